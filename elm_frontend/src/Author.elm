@@ -9,7 +9,9 @@ import Html exposing (Html, a, div, h1, h2, main_, p, text)
 import Html.Attributes exposing (class)
 import HtmlUtils exposing (viewSearchForm, viewSearchNoteWithLinks)
 import Http
-import HttpBuilder exposing (withHeader)
+import HttpBuilder exposing (withJsonBody)
+import Json.Decode as D
+import Json.Encode as E
 import Msg exposing (Msg)
 import Papers.Backend as Backend
 import Papers.Buggy as Buggy
@@ -68,19 +70,41 @@ init flags =
       }
     , Cmd.batch
         ((Date.today |> Task.perform Msg.ReceiveDate)
-            :: List.map (fetchPaper flags.serverURL) flags.paperIds
+            :: List.map (fetchPapers flags.serverURL) (chunksOf batchSize flags.paperIds)
         )
     )
 
 
-fetchPaper : String -> String -> Cmd Msg
-fetchPaper serverURL paperId =
-    HttpBuilder.get (serverURL ++ "/api/papers?paper_id=" ++ paperId)
-        |> withHeader "Content-Type" "application/json"
-        |> HttpBuilder.withExpect (Http.expectJson Msg.GotPaper Backend.paperDecoder)
+{-| Number of papers requested per call to the batch endpoint. Small enough for the
+first results to show up quickly, large enough to share Sherpa lookups.
+-}
+batchSize : Int
+batchSize =
+    20
+
+
+fetchPapers : String -> List String -> Cmd Msg
+fetchPapers serverURL paperIds =
+    HttpBuilder.post (serverURL ++ "/api/papers:batch")
+        |> withJsonBody (E.object [ ( "paper_ids", E.list E.string paperIds ) ])
+        |> HttpBuilder.withExpect
+            (Http.expectJson
+                (Msg.GotPapers (List.length paperIds))
+                (D.list Backend.paperDecoder)
+            )
         |> HttpBuilder.request
 
 
+chunksOf : Int -> List a -> List (List a)
+chunksOf size list =
+    case list of
+        [] ->
+            []
+
+        _ ->
+            List.take size list :: chunksOf size (List.drop size list)
+
+
 
 -- VIEW
 
@@ -144,7 +168,7 @@ update msg model =
                 | style =
                     Animation.interrupt
                         [ Animation.to
-                            [ Animation.width (percent (percentDOIsFetched model))
+                            [ Animation.width (percent (percentDOIsFetched m))
                             , Animation.opacity
                                 (toFloat
                                     (min 1 (List.length model.initialPaperIds - numberFetchedPapers m))
@@ -196,6 +220,36 @@ update msg model =
             , ServerSideLogging.reportHttpError model.serverURL error
             )
 
+        Msg.GotPapers numRequested (Ok backendPapers) ->
+            let
+                updateWithPaper backendPaper ( m, commands ) =
+                    update (Msg.GotPaper (Ok backendPaper)) m
+                        |> Tuple.mapSecond (\command -> command :: commands)
+
+                ( modelWithPapers, paperCommands ) =
+                    List.foldl updateWithPaper ( model, [] ) backendPapers
+
+                -- Papers that couldn't be found are left out of the batch response
+                numMissing =
+                    numRequested - List.length backendPapers
+            in
+            ( { modelWithPapers
+                | numFailedDOIRequests = modelWithPapers.numFailedDOIRequests + numMissing
+              }
+                |> updateStyle
+            , Cmd.batch paperCommands
+            )
+
+        Msg.GotPapers numRequested (Err error) ->
+            let
+                _ =
+                    Debug.log "Error in GotPapers" error
+            in
+            ( { model | numFailedDOIRequests = model.numFailedDOIRequests + numRequested }
+                |> updateStyle
+            , ServerSideLogging.reportHttpError model.serverURL error
+            )
+
         Msg.Animate animMsg ->
             ( { model
                 | style = Animation.update animMsg model.style
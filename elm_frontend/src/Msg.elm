@@ -8,6 +8,7 @@ import Papers.Backend as Backend
 
 type Msg
     = GotPaper (Result Http.Error Backend.Paper)
+    | GotPapers Int (Result Http.Error (List Backend.Paper))
     | Animate Animation.Msg
     | HttpNoOp (Result Http.Error ())
     | ReceiveDate Date
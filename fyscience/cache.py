@@ -1,19 +1,572 @@
 import os
 import json
-
+import asyncio
+import inspect
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
 from contextlib import contextmanager
+from functools import lru_cache, wraps
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+import anyio.to_thread
+from loguru import logger
+
+from fyscience import metrics, rate_limiter, tracing, upstream
+from fyscience.upstream import UpstreamError
+from fyscience.utils import ProcessLocalConnection
+
+
+class LogCache(MutableMapping):
+    """Persistent dict backed by an append-only log file, for batch crawls that have
+    to be resumable and should run in bounded memory.
+
+    Every write appends a record with its own checksum and is flushed right away, so
+    a crash loses at most the record being written, which is dropped when the log is
+    opened again. Only an index of keys and file offsets is kept in memory, values
+    are read from disk on access. Once more than half of the log consists of
+    overwritten or deleted records, it is compacted into a new file. Keys are
+    strings, values anything that can be stored as JSON, optionally zlib compressed.
+    """
+
+    # key length, value length, CRC32 of key and value, flags
+    _HEADER = struct.Struct(">IIIB")
+    _DELETED = 1
+    _COMPRESSED = 2
+
+    def __init__(
+        self, path: str, compress: bool = False, compact_min_size: int = 1024**2
+    ):
+        self.path = path
+        self.compress = compress
+        self.compact_min_size = compact_min_size
+        self._lock = threading.RLock()
+        # key -> (offset of the value, length of the value, flags)
+        self._index: Dict[str, Tuple[int, int, int]] = {}
+        self._live_size = 0
+        self._file = None
+        self._open()
+
+    def _open(self):
+        self._index = {}
+        self._live_size = 0
+        self._file = open(self.path, "a+b")
+        self._file.seek(0)
+        offset = 0
+        while True:
+            record = self._read_record(offset)
+            if record is None:
+                break
+            key, value_offset, value_length, flags, record_size = record
+            self._index_record(key, value_offset, value_length, flags, record_size)
+            offset += record_size
+        # Drop a partially written record left behind by a crash
+        self._file.truncate(offset)
+        self._file.seek(offset)
+        self._size = offset
+
+    def _read_record(self, offset: int):
+        self._file.seek(offset)
+        header = self._file.read(self._HEADER.size)
+        if len(header) < self._HEADER.size:
+            return None
+        key_length, value_length, checksum, flags = self._HEADER.unpack(header)
+        data = self._file.read(key_length + value_length)
+        if len(data) < key_length + value_length or zlib.crc32(data) != checksum:
+            return None
+        key = data[:key_length].decode()
+        value_offset = offset + self._HEADER.size + key_length
+        record_size = self._HEADER.size + key_length + value_length
+        return key, value_offset, value_length, flags, record_size
+
+    def _index_record(
+        self, key: str, value_offset: int, value_length: int, flags: int, size: int
+    ):
+        if key in self._index:
+            _, old_length, _ = self._index.pop(key)
+            self._live_size -= self._HEADER.size + len(key.encode()) + old_length
+        if not flags & self._DELETED:
+            self._index[key] = (value_offset, value_length, flags)
+            self._live_size += size
+
+    def _append(self, key: str, value: bytes, flags: int):
+        encoded_key = key.encode()
+        self._file.seek(self._size)
+        self._file.write(
+            self._HEADER.pack(
+                len(encoded_key), len(value), zlib.crc32(encoded_key + value), flags
+            )
+            + encoded_key
+            + value
+        )
+        self._file.flush()
+        record_size = self._HEADER.size + len(encoded_key) + len(value)
+        value_offset = self._size + self._HEADER.size + len(encoded_key)
+        self._index_record(key, value_offset, len(value), flags, record_size)
+        self._size += record_size
+
+        if self._size > self.compact_min_size and self._live_size < self._size / 2:
+            self.compact()
+
+    def __getitem__(self, key: str) -> Any:
+        with self._lock:
+            value_offset, value_length, flags = self._index[key]
+            self._file.seek(value_offset)
+            value = self._file.read(value_length)
+        if flags & self._COMPRESSED:
+            value = zlib.decompress(value)
+        return json.loads(value)
+
+    def __setitem__(self, key: str, value: Any):
+        encoded_value = json.dumps(value).encode()
+        flags = 0
+        if self.compress:
+            encoded_value = zlib.compress(encoded_value)
+            flags |= self._COMPRESSED
+        with self._lock:
+            self._append(key, encoded_value, flags)
+
+    def __delitem__(self, key: str):
+        with self._lock:
+            if key not in self._index:
+                raise KeyError(key)
+            self._append(key, b"", self._DELETED)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._index))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def compact(self):
+        """Rewrite the log with only the current value of each key."""
+        with self._lock:
+            tmp_path = f"{self.path}.compact"
+            with open(tmp_path, "wb") as compacted:
+                for key, (value_offset, value_length, flags) in self._index.items():
+                    self._file.seek(value_offset)
+                    value = self._file.read(value_length)
+                    encoded_key = key.encode()
+                    compacted.write(
+                        self._HEADER.pack(
+                            len(encoded_key),
+                            len(value),
+                            zlib.crc32(encoded_key + value),
+                            flags,
+                        )
+                        + encoded_key
+                        + value
+                    )
+                compacted.flush()
+                os.fsync(compacted.fileno())
+            self._file.close()
+            os.replace(tmp_path, self.path)
+            self._open()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
 
 
 @contextmanager
-def json_filesystem_cache(name):
-    pathway_cache = dict()
-    if os.path.isfile(name):
-        with open(name, "r") as fh:
-            pathway_cache = json.load(fh)
-            print(f"Loaded cache containing {len(pathway_cache)} items from file")
+def log_cache(name: str, compress: bool = False):
+    """Open a :class:`LogCache` for the duration of e.g. a crawl. Caches written by
+    the former ``json_filesystem_cache`` can be imported with
+    ``cache.update(json.load(fh))``.
+    """
+    cache = LogCache(name, compress=compress)
+    print(f"Loaded cache containing {len(cache)} items from file")
     try:
-        yield pathway_cache
+        yield cache
     finally:
-        print(f"Saved cache containing {len(pathway_cache)} items to file")
-        with open(name, "w") as fh:
-            json.dump(pathway_cache, fh, indent=2)
+        print(f"Saved cache containing {len(cache)} items to file")
+        cache.close()
+
+
+class TTLCache:
+    """Bounded in-memory cache whose entries expire ``ttl`` seconds after being set.
+
+    Exposes ``get(key, default)`` and ``__setitem__`` like a dict, so it can be used
+    wherever a ``cache`` argument is accepted, e.g. by ``oa_pathway``. Once
+    ``maxsize`` entries are stored, the least recently used ones are evicted. All
+    operations are guarded by a lock, so the cache can be shared by all threads and
+    tasks of a process.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10000,
+        ttl: float = 24 * 60 * 60,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key, None)
+            if item is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = item
+            if expires_at <= self._timer():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __getitem__(self, key: Hashable) -> Any:
+        value = self.get(key, KeyError)
+        if value is KeyError:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: Hashable, value: Any):
+        self.set(key, value)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Like ``cache[key] = value``, but with a TTL other than the default"""
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._data[key] = (self._timer() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __delitem__(self, key: Hashable):
+        with self._lock:
+            del self._data[key]
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            item = self._data.get(key, None)
+            return item is not None and item[0] > self._timer()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def values(self) -> list:
+        """All values stored, including those of expired entries not yet removed"""
+        with self._lock:
+            return [value for _, value in self._data.values()]
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteCache:
+    """Cache backed by a SQLite database in WAL mode, which all processes on a host,
+    e.g. all gunicorn workers, can share.
+
+    Entries are grouped into namespaces (e.g. one per upstream API), each with its own
+    TTL and its own bound on the number of entries. Values are stored as JSON.
+
+    Its methods block while another process writes to the database, so async code
+    calls them in a worker thread.
+
+    Once its TTL passed, an entry is stale, but it is kept for another ``max_stale``
+    seconds, in which it can still be served while a fresh value is fetched.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttls: Optional[Dict[str, float]] = None,
+        default_ttl: float = 24 * 60 * 60,
+        max_stale: Optional[Dict[str, float]] = None,
+        default_max_stale: float = 0,
+        max_entries: int = 100000,
+        prune_interval: int = 1000,
+        timer: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.ttls = {} if ttls is None else ttls
+        self.default_ttl = default_ttl
+        self.max_stale = {} if max_stale is None else max_stale
+        self.default_max_stale = default_max_stale
+        self.max_entries = max_entries
+        self.prune_interval = prune_interval
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._connection = ProcessLocalConnection(self._open)
+        self._n_sets = 0
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " stale_at REAL NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_expiry"
+            " ON cache (namespace, expires_at)"
+        )
+        return connection
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        entry = self.get_entry(namespace, key)
+        return default if entry is None else entry[0]
+
+    def get_entry(self, namespace: str, key: str) -> Optional[Tuple[Any, bool]]:
+        """Get the value of an entry and whether it is stale, or None if there is no
+        entry or it expired.
+        """
+        now = self._timer()
+        with self._lock:
+            row = (
+                self._connection.get()
+                .execute(
+                    "SELECT value, stale_at FROM cache"
+                    " WHERE namespace = ? AND key = ? AND expires_at > ?",
+                    (namespace, key, now),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+        value, stale_at = row
+        return json.loads(value), stale_at <= now
+
+    def set(self, namespace: str, key: str, value: Any):
+        stale_at = self._timer() + self.ttls.get(namespace, self.default_ttl)
+        expires_at = stale_at + self.max_stale.get(namespace, self.default_max_stale)
+        with self._lock:
+            self._connection.get().execute(
+                "INSERT OR REPLACE INTO cache"
+                " (namespace, key, value, stale_at, expires_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, json.dumps(value), stale_at, expires_at),
+            )
+            self._n_sets += 1
+            if self._n_sets % self.prune_interval == 0:
+                self._prune(namespace)
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._connection.get().execute(
+                "DELETE FROM cache WHERE namespace = ? AND key = ?", (namespace, key)
+            )
+
+    def _prune(self, namespace: str):
+        """Remove expired entries and those closest to expiry beyond the size bound"""
+        connection = self._connection.get()
+        connection.execute("DELETE FROM cache WHERE expires_at <= ?", (self._timer(),))
+        (n_entries,) = connection.execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (namespace,)
+        ).fetchone()
+        if n_entries > self.max_entries:
+            connection.execute(
+                "DELETE FROM cache WHERE namespace = ? AND key IN ("
+                " SELECT key FROM cache WHERE namespace = ?"
+                " ORDER BY expires_at LIMIT ?"
+                ")",
+                (namespace, namespace, n_entries - self.max_entries),
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = (
+                self._connection.get()
+                .execute("SELECT namespace, COUNT(*) FROM cache GROUP BY namespace")
+                .fetchall()
+            )
+        return {namespace: {"size": n_entries} for namespace, n_entries in rows}
+
+
+# Cache lifetimes per upstream, e.g. OA statuses change more often than publisher
+# policies
+SHARED_CACHE_TTLS = {
+    "unpaywall": 24 * 60 * 60,
+    "semantic_scholar": 24 * 60 * 60,
+    "zenodo": 24 * 60 * 60,
+    "sherpa": 7 * 24 * 60 * 60,
+    "openaccessbutton": 7 * 24 * 60 * 60,
+}
+# How long past their lifetime entries are still served while they are refreshed in
+# the background, or while the upstream is failing
+SHARED_CACHE_MAX_STALE = {
+    "unpaywall": 24 * 60 * 60,
+    "semantic_scholar": 24 * 60 * 60,
+    "zenodo": 24 * 60 * 60,
+    "sherpa": 7 * 24 * 60 * 60,
+    "openaccessbutton": 7 * 24 * 60 * 60,
+}
+
+
+_MISSING = object()
+_refresh_tasks = set()
+
+
+@lru_cache()
+def get_shared_cache() -> Optional[SQLiteCache]:
+    """The cache shared by all processes on this host, if the ``SHARED_CACHE_PATH``
+    environment variable points to a SQLite database file to use.
+    """
+    path = os.getenv("SHARED_CACHE_PATH")
+    if not path:
+        return None
+    return SQLiteCache(path, ttls=SHARED_CACHE_TTLS, max_stale=SHARED_CACHE_MAX_STALE)
+
+
+# Lifetime of cached "not found" answers, shorter than that of actual results, since
+# e.g. a DOI unknown to Unpaywall today may well be known tomorrow
+NEGATIVE_CACHE_TTL = 60 * 60
+
+
+@lru_cache()
+def get_negative_cache() -> TTLCache:
+    """Process-wide cache of lookups the upstream APIs answered with "not found". The
+    lifetime of its entries is ``NEGATIVE_CACHE_TTL`` seconds unless overridden by
+    the ``NEGATIVE_CACHE_TTL`` environment variable, 0 disables the cache.
+    """
+    return TTLCache(
+        maxsize=100000, ttl=float(os.getenv("NEGATIVE_CACHE_TTL", NEGATIVE_CACHE_TTL))
+    )
+
+
+def cached(
+    namespace: str,
+    dump: Callable[[Any], Any] = lambda value: value,
+    load: Callable[[Any], Any] = lambda value: value,
+    cache_if: Callable[[Any], bool] = lambda value: value is not None,
+):
+    """Decorate an async provider function to consult the shared cache before going to
+    the network. The first argument of the function (e.g. the DOI) is used as key,
+    ``dump`` and ``load`` convert results to and from JSON compatible values and only
+    results for which ``cache_if`` holds are stored.
+
+    Stale results are returned right away and refreshed in the background. If the
+    refresh fails, the stale result keeps being served until it expires.
+
+    All other results are "not found" answers, which are kept in the negative cache
+    for a shorter time. If the upstream failed to answer at all, the function raises
+    ``UpstreamError``, which is passed on without caching anything (see
+    ``upstream.fallback`` for returning a default result instead).
+    """
+
+    def decorator(function):
+        signature = inspect.signature(function)
+        key_argument = next(iter(signature.parameters))
+        refreshing = set()
+
+        async def fetch(cache, key, args, kwargs, is_refresh=False):
+            result = await function(*args, **kwargs)
+            if cache_if(result):
+                if cache is not None:
+                    await anyio.to_thread.run_sync(
+                        cache.set, namespace, key, dump(result)
+                    )
+                return result
+
+            if is_refresh:
+                # Not found anymore, so the stale result mustn't be served either
+                await anyio.to_thread.run_sync(cache.delete, namespace, key)
+            negative_cache = get_negative_cache()
+            if negative_cache.ttl > 0:
+                negative_cache[(namespace, key)] = result
+            return result
+
+        async def refresh(cache, key, args, kwargs):
+            try:
+                # Not bound to the deadline of the request that triggered it
+                with upstream.deadline(None), rate_limiter.background():
+                    await fetch(cache, key, args, kwargs, is_refresh=True)
+            except UpstreamError:
+                pass
+            except Exception as e:
+                logger.error(
+                    {
+                        "event": "cache_refresh",
+                        "message": "refresh_failed",
+                        "namespace": namespace,
+                        "key": key,
+                        "error": repr(e),
+                    }
+                )
+            finally:
+                refreshing.discard(key)
+
+        @wraps(function)
+        async def cached_function(*args, **kwargs):
+            key = signature.bind(*args, **kwargs).arguments[key_argument]
+            not_found = get_negative_cache().get((namespace, key), _MISSING)
+            if not_found is not _MISSING:
+                metrics.observe_cache_lookup(namespace, "negative")
+                return not_found
+
+            cache = get_shared_cache()
+            with tracing.span("cache_lookup", namespace=namespace) as lookup_span:
+                entry = (
+                    None
+                    if cache is None
+                    else await anyio.to_thread.run_sync(cache.get_entry, namespace, key)
+                )
+                lookup_span.set_attribute("hit", entry is not None)
+                if entry is not None:
+                    value, is_stale = entry
+                    metrics.observe_cache_lookup(
+                        namespace, "stale" if is_stale else "hit"
+                    )
+                    if is_stale and key not in refreshing:
+                        refreshing.add(key)
+                        task = asyncio.ensure_future(refresh(cache, key, args, kwargs))
+                        # Keep a reference, the event loop only keeps weak ones
+                        _refresh_tasks.add(task)
+                        task.add_done_callback(_refresh_tasks.discard)
+                    return load(value)
+
+            metrics.observe_cache_lookup(namespace, "miss")
+            return await fetch(cache, key, args, kwargs)
+
+        return cached_function
+
+    return decorator
@@ -0,0 +1,122 @@
+"""Circuit breakers per upstream host, so that calls to an upstream API that is down or
+hanging fail fast instead of tying up requests until they time out.
+
+A breaker is closed as long as calls succeed. Once too many of the recent calls
+failed or took too long, it opens and rejects all calls. After a while it is
+half-open and lets a single probe call through, which either closes it again or
+keeps it open for another while.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict
+
+from loguru import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        name: str,
+        window: int = 20,
+        min_calls: int = 10,
+        failure_rate: float = 0.5,
+        # Below the request deadline (see request_deadline in fyscience.routers.deps),
+        # so that calls the deadline cancels count as slow
+        slow_call_duration: float = 2.0,
+        open_duration: float = 30.0,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_duration = slow_call_duration
+        self.open_duration = open_duration
+        self._timer = timer
+        self._lock = threading.Lock()
+        # Outcomes of the most recent calls, True for failed or slow ones
+        self._failures = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _update_state(self):
+        if (
+            self._state == OPEN
+            and self._timer() - self._opened_at >= self.open_duration
+        ):
+            self._state = HALF_OPEN
+            self._probe_in_flight = False
+
+    def _transition(self, state: str):
+        logger.warning(
+            {
+                "event": "circuit_breaker",
+                "message": f"circuit_{state}",
+                "upstream": self.name,
+            }
+        )
+        self._state = state
+        if state == OPEN:
+            self._opened_at = self._timer()
+        elif state == CLOSED:
+            self._failures.clear()
+
+    def allow_request(self) -> bool:
+        """Whether a call may be made now. Every allowed call has to be followed by
+        :meth:`record` or, if it was aborted, :meth:`release`.
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record(self, success: bool, duration: float):
+        failed = not success or duration > self.slow_call_duration
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                self._transition(OPEN if failed else CLOSED)
+                return
+            if self._state == OPEN:
+                # A call started before the circuit opened
+                return
+
+            self._failures.append(failed)
+            if (
+                len(self._failures) >= self.min_calls
+                and sum(self._failures) / len(self._failures) >= self.failure_rate
+            ):
+                self._transition(OPEN)
+
+    def release(self):
+        """Give back the permission of a call that was aborted, e.g. cancelled."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
@@ -1,9 +1,10 @@
 import urllib.parse
 from typing import Optional
 
-import requests
 from loguru import logger
 
+from fyscience import metrics, upstream
+from fyscience.upstream import UpstreamError
 from fyscience.schemas import Author
 
 _CROSSREF_API_USER_AGENT = (
@@ -13,12 +14,16 @@ _CROSSREF_API_USER_AGENT = (
 )
 
 
-def get_author_with_papers(name: str) -> Optional[Author]:
+@metrics.provider_function
+async def get_author_with_papers_async(name: str) -> Optional[Author]:
     query = urllib.parse.urlencode({"query.author": name})
-    r = requests.get(
-        f"https://api.crossref.org/works?{query}",
-        headers={"User-Agent": _CROSSREF_API_USER_AGENT},
-    )
+    try:
+        r = await upstream.get(
+            f"https://api.crossref.org/works?{query}",
+            headers={"User-Agent": _CROSSREF_API_USER_AGENT},
+        )
+    except UpstreamError:
+        return None
     if r.status_code != 200:
         logger.error(
             {
@@ -40,3 +45,7 @@ def get_author_with_papers(name: str) -> Optional[Author]:
     return Author(
         name=name, paper_ids=paper_ids, provider="crossref", profile_url=profile_url
     )
+
+
+def get_author_with_papers(name: str) -> Optional[Author]:
+    return upstream.run_sync(get_author_with_papers_async(name))
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterable, Tuple
 import json
 
 from fyscience.schemas import OAPathway, PaperWithOAPathway
@@ -10,20 +10,34 @@ def load_jsonl(filepath):
             yield json.loads(line)
 
 
-def calculate_metrics(papers: List[PaperWithOAPathway]):
-    n_oa = 0
-    n_pathway_nocost = 0
-    n_pathway_other = 0
-    n_unknown = 0
+class Metrics:
+    """Counts of papers per OA status and pathway, which can be updated paper by paper
+    while the papers are being enriched
+    """
 
+    def __init__(self):
+        self.n_oa = 0
+        self.n_pathway_nocost = 0
+        self.n_pathway_other = 0
+        self.n_unknown = 0
+
+    def add(self, paper: PaperWithOAPathway):
+        if paper.is_open_access:
+            self.n_oa += 1
+        elif paper.oa_pathway is OAPathway.nocost:
+            self.n_pathway_nocost += 1
+        elif paper.oa_pathway is OAPathway.other:
+            self.n_pathway_other += 1
+        elif paper.is_open_access is None or paper.oa_pathway is OAPathway.not_found:
+            self.n_unknown += 1
+
+    def as_tuple(self) -> Tuple[int, int, int, int]:
+        return self.n_oa, self.n_pathway_nocost, self.n_pathway_other, self.n_unknown
+
+
+def calculate_metrics(papers: Iterable[PaperWithOAPathway]):
+    metrics = Metrics()
     for p in papers:
-        if p.is_open_access:
-            n_oa += 1
-        elif p.oa_pathway is OAPathway.nocost:
-            n_pathway_nocost += 1
-        elif p.oa_pathway is OAPathway.other:
-            n_pathway_other += 1
-        elif p.is_open_access is None or p.oa_pathway is OAPathway.not_found:
-            n_unknown += 1
-
-    return n_oa, n_pathway_nocost, n_pathway_other, n_unknown
+        metrics.add(p)
+
+    return metrics.as_tuple()
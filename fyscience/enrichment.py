@@ -0,0 +1,216 @@
+"""Concurrent enrichment of a single DOI with OA status, pathway and permissions.
+
+The lookups only depend on each other through their inputs: Unpaywall, Semantic
+Scholar, Zenodo and the OA Button only need the DOI, whereas Sherpa needs the ISSN
+reported by Unpaywall. Each lookup is therefore started as soon as its inputs are
+known and the results are combined in the same order of precedence as the sequential
+``validate_oa_status_from_s2_and_zenodo`` -> ``oa_pathway`` chain, which means the
+S2 and Zenodo results only matter if the paper isn't OA according to Unpaywall.
+
+The exception is Semantic Scholar, whose rate limit is too tight to spend on lookups
+that are thrown away for OA papers. It is only queried once Unpaywall reported the
+paper as not OA.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple, TypeVar
+
+from fyscience import (
+    metrics,
+    openaccessbutton,
+    semantic_scholar,
+    sherpa,
+    unpaywall,
+    upstream,
+    zenodo,
+)
+from fyscience.oa_status import apply_s2_oa_status, apply_zenodo_oa_location
+from fyscience.schemas import FullPaper, OAPathway
+from fyscience.upstream import UpstreamError
+
+T = TypeVar("T")
+
+
+def _can_share_your_paper(permissions: Optional[dict]) -> bool:
+    # NOTE: There are cases where there is no best_permission but an all_permission key
+    #       e.g. https://api.openaccessbutton.org/permissions?doi=10.1055/s-0030-1263175
+    if permissions is None:
+        return False
+    if permissions.get("best_permission", None):
+        return permissions["best_permission"]["can_archive"]
+    if permissions.get("all_permissions", None):
+        return permissions["all_permissions"][0]["can_archive"]
+    return False
+
+
+async def _result_or_default(
+    step: str, lookup: Awaitable[T], default: T, degraded: List[str]
+) -> T:
+    """Result of the lookup, or ``default`` with the step added to ``degraded`` if the
+    upstream failed to answer (as opposed to not knowing the paper).
+    """
+    try:
+        return await lookup
+    except UpstreamError:
+        degraded.append(step)
+        return default
+
+
+PathwayLookup = Callable[
+    [str, Optional[str]], Awaitable[Tuple[OAPathway, Optional[List[dict]]]]
+]
+
+
+def _retrieve_exception(task: asyncio.Future):
+    if not task.cancelled():
+        task.exception()
+
+
+def share_lookups(lookup: Callable[..., Awaitable]) -> Callable[..., Awaitable]:
+    """Wrap a lookup so that all calls with the same arguments share a single call,
+    e.g. one Sherpa lookup per ISSN for all papers of a batch.
+    """
+    lookups = {}
+
+    def shared_lookup(*args):
+        if args not in lookups:
+            lookups[args] = asyncio.ensure_future(lookup(*args))
+            lookups[args].add_done_callback(_retrieve_exception)
+        # Shielded, so a paper that doesn't need the result anymore doesn't cancel the
+        # lookup for all other papers
+        return asyncio.shield(lookups[args])
+
+    return shared_lookup
+
+
+def cache_pathway_lookups(lookup: PathwayLookup, cache) -> PathwayLookup:
+    """Wrap a pathway lookup with a cache keyed by ISSN, e.g. a ``TTLCache``.
+    Unknown ISSNs aren't cached, since ``not_found`` is also returned on errors.
+    """
+
+    async def cached_lookup(issn: str, api_key: Optional[str] = None):
+        cached = cache.get(issn, None)
+        metrics.observe_cache_lookup("pathway", "miss" if cached is None else "hit")
+        if cached is not None:
+            return cached
+
+        pathway, details = await lookup(issn, api_key)
+        if pathway is not OAPathway.not_found:
+            cache[issn] = (pathway, details)
+        return pathway, details
+
+    return cached_lookup
+
+
+def _cancel(tasks: Iterable[Optional[asyncio.Task]]):
+    """Cancel lookups whose result turned out to be irrelevant."""
+    for task in tasks:
+        if task is None:
+            continue
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Mark possible exceptions as retrieved, the result is discarded anyway
+            task.exception()
+
+
+async def enrich_paper(
+    doi: str,
+    unpaywall_email: Optional[str] = None,
+    sherpa_api_key: Optional[str] = None,
+    s2_api_key: Optional[str] = None,
+    get_pathway: Optional[PathwayLookup] = None,
+) -> FullPaper:
+    """Get the paper for a given DOI with OA status, OA pathway and whether it can be
+    shared via shareyourpaper.org.
+
+    If Unpaywall knows no ISSN for a paywalled paper, the paper is returned as is,
+    without a pathway and without querying the remaining providers' results.
+
+    Providers that fail to answer, e.g. since their circuit breaker is open or the
+    deadline of the request (see ``upstream.deadline``) passed, are skipped. The paper
+    is then returned without their results and the skipped steps listed in
+    ``degraded``.
+
+    ``get_pathway`` replaces ``sherpa.get_pathway_async``, e.g. to share lookups via
+    :func:`share_lookups`.
+    """
+    get_pathway = sherpa.get_pathway_async if get_pathway is None else get_pathway
+    # Lookups started within the block (including those shared with other papers)
+    # raise UpstreamError, telling failures apart from unknown DOIs and ISSNs
+    with upstream.raise_errors():
+        return await _enrich_paper(
+            doi, unpaywall_email, sherpa_api_key, s2_api_key, get_pathway
+        )
+
+
+async def _enrich_paper(
+    doi: str,
+    unpaywall_email: Optional[str],
+    sherpa_api_key: Optional[str],
+    s2_api_key: Optional[str],
+    get_pathway: PathwayLookup,
+) -> FullPaper:
+    unpaywall_task = asyncio.create_task(
+        unpaywall.get_paper_async(doi=doi, email=unpaywall_email)
+    )
+    s2_task = None
+    zenodo_task = asyncio.create_task(zenodo.get_open_access_url_async(doi=doi))
+    permissions_task = asyncio.create_task(openaccessbutton.get_permissions_async(doi))
+    pathway_task = None
+    degraded = []
+
+    try:
+        paper = await _result_or_default("unpaywall", unpaywall_task, None, degraded)
+        if paper is None:
+            paper = FullPaper(doi=doi)
+
+        if paper.issn is None and not paper.is_open_access:
+            paper.degraded = degraded or None
+            return paper
+
+        if paper.is_open_access is False:
+            # Most likely still paywalled after S2 and Zenodo have been consulted, so
+            # query Sherpa right away instead of waiting for them.
+            pathway_task = asyncio.ensure_future(
+                get_pathway(paper.issn, sherpa_api_key)
+            )
+
+        if not paper.is_open_access:
+            # TODO: Don't do this twice if the author papers already have the s2 status
+            s2_task = asyncio.create_task(
+                semantic_scholar.get_paper_async(doi, s2_api_key)
+            )
+            s2_paper = await _result_or_default(
+                "semantic_scholar", s2_task, None, degraded
+            )
+            paper = apply_s2_oa_status(paper, s2_paper)
+
+        if not paper.is_open_access:
+            zenodo_oa_location_url = await _result_or_default(
+                "zenodo", zenodo_task, None, degraded
+            )
+            paper = apply_zenodo_oa_location(paper, zenodo_oa_location_url)
+
+        if paper.is_open_access:
+            paper.oa_pathway = OAPathway.already_oa
+        elif paper.is_open_access is None:
+            paper.oa_pathway = OAPathway.not_attempted
+        else:
+            if pathway_task is None:
+                pathway_task = asyncio.ensure_future(
+                    get_pathway(paper.issn, sherpa_api_key)
+                )
+            paper.oa_pathway, paper.oa_pathway_details = await _result_or_default(
+                "sherpa", pathway_task, (OAPathway.not_found, None), degraded
+            )
+
+        permissions = await _result_or_default(
+            "openaccessbutton", permissions_task, None, degraded
+        )
+        paper.can_share_your_paper = _can_share_your_paper(permissions)
+
+        paper.degraded = degraded or None
+        return paper
+    finally:
+        _cancel([unpaywall_task, s2_task, zenodo_task, permissions_task, pathway_task])
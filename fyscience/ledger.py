@@ -0,0 +1,130 @@
+"""Ledger of the provider calls made for a request
+
+Every call of a provider function (see ``metrics.provider_function``) made while a
+ledger is recorded gets an entry with its duration, how the cache answered it and the
+upstream calls it took. The ledger goes into the ``Server-Timing`` header and the log
+record of the request, to tell which upstream API made a request slow.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+
+class ProviderCall:
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.started_at = time.monotonic()
+        # None while the call is running
+        self.duration: Optional[float] = None
+        # Whether the call was cancelled, e.g. since its result wasn't needed anymore
+        self.cancelled = False
+        # hit, stale, negative or miss of the cache, or served by a call in flight
+        # (coalesced) or an offline dataset (snapshot, policy_store)
+        self.cache: Optional[str] = None
+        self.upstream_calls = 0
+        self.retries = 0
+        self.status: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "provider": self.provider,
+            "duration": self.duration,
+            "cache": self.cache,
+            "upstream_calls": self.upstream_calls,
+            "retries": self.retries,
+            "status": self.status,
+            "cancelled": self.cancelled,
+        }
+
+    def elapsed(self) -> float:
+        """Duration of the call, or the time since it started while it is running"""
+        if self.duration is None:
+            return time.monotonic() - self.started_at
+        return self.duration
+
+    def server_timing(self) -> str:
+        description = f"cache={self.cache or 'none'}"
+        if self.upstream_calls:
+            description += f" status={self.status} retries={self.retries}"
+        if self.cancelled or self.duration is None:
+            description += " cancelled"
+        return f'{self.provider};dur={self.elapsed() * 1000:.1f};desc="{description}"'
+
+
+_ledger: ContextVar[Optional[List[ProviderCall]]] = ContextVar("ledger", default=None)
+_current_call: ContextVar[Optional[ProviderCall]] = ContextVar(
+    "current_provider_call", default=None
+)
+
+
+@contextmanager
+def recording() -> Iterator[List[ProviderCall]]:
+    """Record the provider calls made within the block, including those of tasks
+    started in it, into the ledger of the request. A ledger is started unless one is
+    already being recorded, e.g. by the endpoint that called the block.
+    """
+    ledger = _ledger.get()
+    if ledger is not None:
+        yield ledger
+        return
+
+    ledger = []
+    token = _ledger.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _ledger.reset(token)
+
+
+@contextmanager
+def provider_call(provider: str) -> Iterator[Optional[ProviderCall]]:
+    ledger = _ledger.get()
+    if ledger is None:
+        yield None
+        return
+
+    call = ProviderCall(provider)
+    ledger.append(call)
+    token = _current_call.set(call)
+    try:
+        yield call
+    except asyncio.CancelledError:
+        call.cancelled = True
+        raise
+    finally:
+        call.duration = time.monotonic() - call.started_at
+        _current_call.reset(token)
+
+
+def note_cache(result: str):
+    call = _current_call.get()
+    if call is not None:
+        call.cache = result
+
+
+def note_upstream_call(status: str):
+    call = _current_call.get()
+    if call is not None:
+        call.upstream_calls += 1
+        call.status = status
+
+
+def note_retry():
+    call = _current_call.get()
+    if call is not None:
+        call.retries += 1
+
+
+def server_timing(ledger: List[ProviderCall]) -> str:
+    """``Server-Timing`` header value listing the calls of the ledger. Calls that
+    haven't finished, since the response doesn't wait for them, are listed as
+    cancelled with the time they ran so far.
+    """
+    return ", ".join(call.server_timing() for call in ledger)
+
+
+def as_log(ledger: List[ProviderCall]) -> List[dict]:
+    return [call.as_dict() for call in ledger]
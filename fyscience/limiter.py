@@ -0,0 +1,110 @@
+"""Adaptive bound on the number of concurrent calls per upstream host
+
+The bound follows AIMD (additive increase, multiplicative decrease), like TCP
+congestion control. While calls succeed with flat latency and the bound is reached,
+it grows by ``1 / bound`` with every finished call. Once an upstream throttles us
+(429, 503), fails to answer or gets much slower than usual, the bound is halved, so
+that a traffic spike doesn't get us throttled by every upstream API at once.
+"""
+
+import asyncio
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+class AdaptiveLimiter:
+    def __init__(
+        self,
+        name: str,
+        initial_limit: int = 10,
+        min_limit: int = 1,
+        max_limit: int = 20,
+        decrease_factor: float = 0.5,
+        latency_tolerance: float = 2.0,
+        smoothing: float = 0.05,
+        cooldown: float = 1.0,
+        timer: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.cooldown = cooldown
+        self._timer = timer
+        self._limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.in_flight = 0
+        # Exponentially smoothed latency of successful calls, the latency to expect
+        self.baseline_latency: Optional[float] = None
+        self._decreased_at: Optional[float] = None
+        self._waiters: deque = deque()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        """Wait until one more call may be made. Every acquired call has to be
+        followed by :meth:`release`.
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Cancelled right after being handed a slot
+                self.release()
+            elif waiter in self._waiters:
+                # Unless skipped by _wake_waiters already, being cancelled
+                self._waiters.remove(waiter)
+            raise
+
+    def release(
+        self, overloaded: Optional[bool] = None, latency: Optional[float] = None
+    ):
+        """Give back the slot of a call and adjust the limit by its outcome. Calls
+        that were aborted, e.g. cancelled, have no outcome.
+        """
+        was_saturated = self.in_flight >= self.limit
+        self.in_flight -= 1
+        if overloaded is not None:
+            self._adjust(overloaded, latency, was_saturated)
+        self._wake_waiters()
+
+    def _adjust(self, overloaded: bool, latency: Optional[float], was_saturated: bool):
+        if not overloaded and latency is not None:
+            if self.baseline_latency is None:
+                self.baseline_latency = latency
+            overloaded = latency > self.baseline_latency * self.latency_tolerance
+            # Follows lasting changes of the latency, but not single spikes
+            self.baseline_latency += self.smoothing * (latency - self.baseline_latency)
+
+        if overloaded:
+            # Calls that were in flight together all report the same overload
+            now = self._timer()
+            if self._decreased_at is None or now - self._decreased_at >= self.cooldown:
+                self._limit = max(self._limit * self.decrease_factor, self.min_limit)
+                self._decreased_at = now
+        elif was_saturated:
+            self._limit = min(self._limit + 1 / self._limit, self.max_limit)
+
+    def _wake_waiters(self):
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def stats(self) -> dict:
+        return {"limit": self.limit, "in_flight": self.in_flight, "queued": self.queued}
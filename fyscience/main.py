@@ -1,12 +1,16 @@
 import os
+from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exception_handlers import http_exception_handler
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.exceptions import HTTPException
+from loguru import logger
+from prometheus_client import CONTENT_TYPE_LATEST
 
+from fyscience import metrics, singleflight, tracing, upstream
 from fyscience.routers.api import api_router
 from fyscience.routers.html import html_router
 from fyscience.routers.deps import TEMPLATE_PATH
@@ -16,10 +20,22 @@ STATIC_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static")
 
 templates = Jinja2Templates(directory=TEMPLATE_PATH)
 
-app = FastAPI(title="Free Your Science")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await upstream.aclose()
+    logger.info(
+        {"event": "shutdown", "message": "single_flight_stats", **singleflight.stats()}
+    )
+
+
+app = FastAPI(title="Free Your Science", lifespan=lifespan)
 app.include_router(api_router)
 app.include_router(html_router, include_in_schema=False)
 app.mount("/static", StaticFiles(directory=STATIC_PATH), name="static")
+app.middleware("http")(metrics.track_requests)
+app.middleware("http")(tracing.trace_requests)
 
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +50,11 @@ app.add_middleware(
 )
 
 
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.render(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.exception_handler(Exception)
 async def human_friendly_exception_pages(request: Request, exc: Exception):
     if "text/html" in request.headers.get("accept", ""):
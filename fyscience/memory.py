@@ -0,0 +1,137 @@
+"""Memory usage of a worker process
+
+Long-running workers grow as ORCID records, Semantic Scholar authors and Sherpa
+policies pass through them. ``report`` lists the allocation sites holding the most
+memory, how much they grew since the previous report, and the size of the in-process
+caches, to size the caches and to tell a leak from a cache filling up.
+
+Allocations are only traced once tracing was started, by ``start`` or the
+``PYTHONTRACEMALLOC`` environment variable (e.g. ``PYTHONTRACEMALLOC=1``). Tracing
+costs some CPU and memory, so it is off by default.
+"""
+
+import gc
+import random
+import sys
+import threading
+import tracemalloc
+import types
+from typing import Dict, Iterable, List, Optional
+
+from fyscience import singleflight
+from fyscience.cache import TTLCache, get_negative_cache, get_shared_cache
+
+# Number of values of a cache whose size is measured to estimate that of the cache
+SIZE_SAMPLE = 100
+
+# Referenced by many values, but not part of any
+_SHARED_TYPES = (
+    type,
+    types.ModuleType,
+    types.FunctionType,
+    types.BuiltinFunctionType,
+)
+
+_previous_snapshot: Optional[tracemalloc.Snapshot] = None
+_lock = threading.Lock()
+
+
+def start(n_frames: int = 1):
+    """Trace allocations from now on, each with ``n_frames`` frames of its traceback"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(n_frames)
+
+
+def stop():
+    global _previous_snapshot
+    tracemalloc.stop()
+    with _lock:
+        _previous_snapshot = None
+
+
+def deep_size(value) -> int:
+    """Bytes taken by the value and all objects it references, except for classes,
+    functions and modules shared with other values
+    """
+    seen = set()
+    size = 0
+    objects = [value]
+    while objects:
+        obj = objects.pop()
+        if id(obj) in seen or isinstance(obj, _SHARED_TYPES):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        objects.extend(gc.get_referents(obj))
+    return size
+
+
+def estimate_size(values: List) -> int:
+    """Bytes taken by the values, estimated from a sample of ``SIZE_SAMPLE`` of them"""
+    if not values:
+        return 0
+    sample = random.sample(values, min(len(values), SIZE_SAMPLE))
+    return sum(deep_size(value) for value in sample) * len(values) // len(sample)
+
+
+def cache_stats(caches: Dict[str, TTLCache]) -> dict:
+    """Stats and estimated size in bytes of the given caches and the negative cache,
+    the number of entries of the cache shared by all processes, and the calls of the
+    single flight lookups
+    """
+    in_memory = {**caches, "negative": get_negative_cache()}
+    shared_cache = get_shared_cache()
+    return {
+        **{
+            name: {**cache.stats(), "bytes": estimate_size(cache.values())}
+            for name, cache in in_memory.items()
+        },
+        "shared": None if shared_cache is None else shared_cache.stats(),
+        "single_flight": singleflight.stats(),
+    }
+
+
+def _sites(statistics: Iterable, limit: int) -> List[dict]:
+    return [
+        {
+            "site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size": stat.size,
+            "count": stat.count,
+            **(
+                {"size_diff": stat.size_diff, "count_diff": stat.count_diff}
+                if isinstance(stat, tracemalloc.StatisticDiff)
+                else {}
+            ),
+        }
+        for stat in statistics
+        if stat.size or getattr(stat, "size_diff", 0)
+    ][:limit]
+
+
+def report(caches: Dict[str, TTLCache], limit: int = 20) -> dict:
+    """Top ``limit`` allocation sites by size and by growth since the previous report
+    of this process, if allocations are traced, and the sizes of the caches
+    """
+    global _previous_snapshot
+    result = {
+        "tracing": tracemalloc.is_tracing(),
+        "caches": cache_stats(caches),
+    }
+    if not tracemalloc.is_tracing():
+        return result
+
+    snapshot = tracemalloc.take_snapshot().filter_traces(
+        [tracemalloc.Filter(False, tracemalloc.__file__)]
+    )
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        previous, _previous_snapshot = _previous_snapshot, snapshot
+
+    result["traced_memory"] = {"current": current, "peak": peak}
+    result["top"] = _sites(snapshot.statistics("lineno"), limit)
+    result["growth"] = (
+        None
+        if previous is None
+        else _sites(snapshot.compare_to(previous, "lineno"), limit)
+    )
+    return result
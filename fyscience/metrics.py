@@ -0,0 +1,129 @@
+"""Prometheus metrics, served at ``/metrics``
+
+With gunicorn, every worker is a separate process. If the
+``PROMETHEUS_MULTIPROC_DIR`` environment variable points to a directory (see
+``gunicorn_conf.py``), the workers write their metrics there and ``/metrics``
+aggregates them across all workers, no matter which worker serves the scrape.
+"""
+
+import os
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+import anyio.to_thread
+from fastapi import Request
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from fyscience import ledger, tracing
+
+REQUEST_DURATION = Histogram(
+    "fyscience_request_duration_seconds",
+    "Time until the response (or the first chunk of a stream) was ready",
+    ["method", "route", "status"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "fyscience_requests_in_flight",
+    "Requests currently being handled",
+    multiprocess_mode="livesum",
+)
+UPSTREAM_DURATION = Histogram(
+    "fyscience_upstream_request_duration_seconds",
+    "Duration of calls to upstream APIs by provider function and response status or"
+    " error",
+    ["upstream", "function", "status"],
+)
+CACHE_LOOKUPS = Counter(
+    "fyscience_cache_lookups_total",
+    "Cache lookups by namespace and result (hit, stale, negative or miss)",
+    ["namespace", "result"],
+)
+THREADPOOL_IN_USE = Gauge(
+    "fyscience_threadpool_threads_in_use",
+    "Threads of the pool running sync endpoints and dependencies that are in use",
+    multiprocess_mode="livesum",
+)
+THREADPOOL_SIZE = Gauge(
+    "fyscience_threadpool_threads",
+    "Size of the pool running sync endpoints and dependencies",
+    multiprocess_mode="livesum",
+)
+
+# Provider function making the current upstream calls, see provider_function
+_provider_function: ContextVar[Optional[str]] = ContextVar(
+    "provider_function", default=None
+)
+
+
+def provider_function(function):
+    """Decorate an async provider function to label the upstream calls it makes with
+    its name, e.g. ``sherpa.get_pathway_async``, and to record its calls in the
+    request's ledger and a tracing span.
+    """
+    name = f"{function.__module__.split('.')[-1]}.{function.__name__}"
+
+    @wraps(function)
+    async def labelled_function(*args, **kwargs):
+        token = _provider_function.set(name)
+        try:
+            with ledger.provider_call(name), tracing.span(name):
+                return await function(*args, **kwargs)
+        finally:
+            _provider_function.reset(token)
+
+    return labelled_function
+
+
+def observe_upstream_call(upstream: str, status: str, duration: float):
+    UPSTREAM_DURATION.labels(
+        upstream, _provider_function.get() or "unknown", status
+    ).observe(duration)
+
+
+def observe_cache_lookup(namespace: str, result: str):
+    CACHE_LOOKUPS.labels(namespace, result).inc()
+    ledger.note_cache(result)
+
+
+async def track_requests(request: Request, call_next):
+    """HTTP middleware recording the duration of requests per route"""
+    thread_limiter = anyio.to_thread.current_default_thread_limiter()
+    THREADPOOL_IN_USE.set(thread_limiter.borrowed_tokens)
+    THREADPOOL_SIZE.set(thread_limiter.total_tokens)
+
+    REQUESTS_IN_FLIGHT.inc()
+    started_at = time.monotonic()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUESTS_IN_FLIGHT.dec()
+        # The route template rather than the path, which would mean a time series per
+        # DOI. Set by the router, unless no route matched.
+        route = request.scope.get("route")
+        REQUEST_DURATION.labels(
+            request.method,
+            "unmatched" if route is None else route.path,
+            str(status),
+        ).observe(time.monotonic() - started_at)
+
+
+def render() -> bytes:
+    """The metrics of all worker processes in the Prometheus text format"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
@@ -1,13 +1,14 @@
 from copy import deepcopy
-from typing import Optional, Union
+from typing import List, Optional, Tuple, Union
 
+from fyscience import upstream
 from fyscience.schemas import (
     OAPathway,
     PaperWithOAStatus,
     PaperWithOAPathway,
     FullPaper,
 )
-from fyscience.sherpa import get_pathway as sherpa_pathway_api
+from fyscience.sherpa import get_pathway_async as sherpa_pathway_api_async
 
 
 def oa_pathway(
@@ -18,8 +19,18 @@ def oa_pathway(
     """Enrich a given paper with information about the available open access pathway
     collected from the Sherpa API.
 
-    Cache can be anything that exposes ``get(key, default)`` and ``__setitem__``
+    Cache can be anything that exposes ``get(key, default)`` and ``__setitem__``, it
+    stores the pathway together with the no cost policy details per ISSN.
     """
+    return upstream.run_sync(oa_pathway_async(paper, cache, api_key))
+
+
+async def oa_pathway_async(
+    paper: Union[PaperWithOAStatus, FullPaper],
+    cache=None,
+    api_key: Optional[str] = None,
+) -> Union[PaperWithOAStatus, FullPaper]:
+    """Async variant of :func:`oa_pathway`"""
     details = None
     if paper.is_open_access:
         pathway = OAPathway.already_oa
@@ -27,13 +38,32 @@ def oa_pathway(
         pathway = OAPathway.not_attempted
     else:
         if cache is not None:
-            pathway = cache.get(paper.issn, None)
-            if not pathway:
-                pathway, details = sherpa_pathway_api(paper.issn, api_key)
-                cache[paper.issn] = pathway
+            cached = cache.get(paper.issn, None)
+            if not cached:
+                pathway, details = await sherpa_pathway_api_async(paper.issn, api_key)
+                cache[paper.issn] = (pathway, details)
+            else:
+                pathway, details = _from_cache(cached)
         else:
-            pathway, details = sherpa_pathway_api(paper.issn, api_key)
+            pathway, details = await sherpa_pathway_api_async(paper.issn, api_key)
 
+    return _with_pathway(paper, pathway, details)
+
+
+def _from_cache(cached) -> Tuple[OAPathway, Optional[List[dict]]]:
+    # Caches filled before the details were cached as well only contain the pathway
+    if isinstance(cached, str):
+        return OAPathway(cached), None
+
+    pathway, details = cached
+    return OAPathway(pathway), details
+
+
+def _with_pathway(
+    paper: Union[PaperWithOAStatus, FullPaper],
+    pathway: OAPathway,
+    details: Optional[List[dict]],
+) -> Union[PaperWithOAPathway, FullPaper]:
     if isinstance(paper, PaperWithOAStatus):
         return PaperWithOAPathway(
             oa_pathway=pathway, oa_pathway_details=details, **paper.dict()
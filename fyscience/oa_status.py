@@ -1,23 +1,56 @@
-from typing import Union
+from typing import Optional, Union
 
 from fyscience.schemas import Paper, PaperWithOAStatus, FullPaper
 from fyscience import semantic_scholar, unpaywall, zenodo
 
 
+def apply_s2_oa_status(
+    paper: Union[PaperWithOAStatus, FullPaper], s2_paper: Optional[FullPaper]
+) -> Union[PaperWithOAStatus, FullPaper]:
+    """Override the OA status of a paper with the one known to Semantic Scholar."""
+    if s2_paper is not None and s2_paper.is_open_access is not None:
+        paper.is_open_access = s2_paper.is_open_access
+        paper.oa_location_url = s2_paper.oa_location_url
+
+    return paper
+
+
+def apply_zenodo_oa_location(
+    paper: Union[PaperWithOAStatus, FullPaper], zenodo_oa_location_url: Optional[str]
+) -> Union[PaperWithOAStatus, FullPaper]:
+    """Mark a paper as OA if an open access copy was found on Zenodo."""
+    if zenodo_oa_location_url:
+        paper.is_open_access = True
+        paper.oa_location_url = zenodo_oa_location_url
+
+    return paper
+
+
 def validate_oa_status_from_s2_and_zenodo(
     paper: Union[PaperWithOAStatus, FullPaper], api_key: str = None
 ) -> Union[PaperWithOAStatus, FullPaper]:
     if not paper.is_open_access:
         s2_paper = semantic_scholar.get_paper(paper.doi, api_key)
-        if s2_paper is not None and s2_paper.is_open_access is not None:
-            paper.is_open_access = s2_paper.is_open_access
-            paper.oa_location_url = s2_paper.oa_location_url
+        paper = apply_s2_oa_status(paper, s2_paper)
 
     if not paper.is_open_access:
         zenodo_oa_location_url = zenodo.get_open_access_url(doi=paper.doi)
-        if zenodo_oa_location_url:
-            paper.is_open_access = True
-            paper.oa_location_url = zenodo_oa_location_url
+        paper = apply_zenodo_oa_location(paper, zenodo_oa_location_url)
+
+    return paper
+
+
+async def validate_oa_status_from_s2_and_zenodo_async(
+    paper: Union[PaperWithOAStatus, FullPaper], api_key: str = None
+) -> Union[PaperWithOAStatus, FullPaper]:
+    """Async variant of :func:`validate_oa_status_from_s2_and_zenodo`"""
+    if not paper.is_open_access:
+        s2_paper = await semantic_scholar.get_paper_async(paper.doi, api_key)
+        paper = apply_s2_oa_status(paper, s2_paper)
+
+    if not paper.is_open_access:
+        zenodo_oa_location_url = await zenodo.get_open_access_url_async(doi=paper.doi)
+        paper = apply_zenodo_oa_location(paper, zenodo_oa_location_url)
 
     return paper
 
@@ -1,39 +1,61 @@
 from typing import Optional
 
-import requests
+from fyscience import metrics, upstream
+from fyscience.upstream import UpstreamError
+from fyscience.cache import cached
+from fyscience.singleflight import single_flight
 
 
-def get_paper_metadata(doi: str) -> Optional[dict]:
+@metrics.provider_function
+async def get_paper_metadata_async(doi: str) -> Optional[dict]:
     """Get OA Button's paper meta data for a given DOI."""
-    r = requests.post(
-        "https://api.openaccessbutton.org/find",
-        json={
-            "doi": doi,
-            "config": {
-                "repo_name": "Zenodo",
-                "oa_deposit_off": True,
-                "dark_deposit_off": True,
-                "not_library": True,
-                "autorun_off": False,
-                "owner": "team@freeyourscience.org",
+    try:
+        # A POST, hence only retried if OA Button can't have processed it
+        r = await upstream.post(
+            "https://api.openaccessbutton.org/find",
+            json={
+                "doi": doi,
+                "config": {
+                    "repo_name": "Zenodo",
+                    "oa_deposit_off": True,
+                    "dark_deposit_off": True,
+                    "not_library": True,
+                    "autorun_off": False,
+                    "owner": "team@freeyourscience.org",
+                },
+                "from": "anonymous",
+                "plugin": "shareyourpaper",
+                "embedded": f"https://freeyourscience.org/syp?doi={doi}",
             },
-            "from": "anonymous",
-            "plugin": "shareyourpaper",
-            "embedded": f"https://freeyourscience.org/syp?doi={doi}",
-        },
-    )
+        )
+    except UpstreamError:
+        return None
     if r.status_code not in [200, 201]:
         return None
 
     return r.json()
 
 
-def get_permissions(doi: str) -> Optional[dict]:
+def get_paper_metadata(doi: str) -> Optional[dict]:
+    return upstream.run_sync(get_paper_metadata_async(doi))
+
+
+@metrics.provider_function
+@upstream.fallback(None)
+@single_flight("openaccessbutton")
+@cached("openaccessbutton")
+async def get_permissions_async(doi: str) -> Optional[dict]:
     """Get OA Button's re-publication permission details for a given DOI."""
-    r = requests.get(
+    r = await upstream.get(
         "https://api.openaccessbutton.org/permissions", params={"doi": doi}
     )
-    if r.status_code != 200:
+    if r.status_code == 404:
         return None
+    if r.status_code != 200:
+        raise UpstreamError(f"OA Button responded with {r.status_code}")
 
     return r.json()
+
+
+def get_permissions(doi: str) -> Optional[dict]:
+    return upstream.run_sync(get_permissions_async(doi))
@@ -1,10 +1,11 @@
 import re
 from typing import Optional
 
-import requests
 import xml.etree.ElementTree as ET
 from loguru import logger
 
+from fyscience import metrics, upstream
+from fyscience.upstream import UpstreamError
 from fyscience.schemas import FullPaper, Author
 
 # TODO: Add API key for prod setting
@@ -18,8 +19,12 @@ GIVEN_NAMES = "{http://www.orcid.org/ns/personal-details}given-names"
 WORKS = "{http://www.orcid.org/ns/activities}works"
 
 
-def get_author_with_papers(orcid: str) -> Optional[Author]:
-    r = requests.get(f"https://pub.orcid.org/{orcid}")
+@metrics.provider_function
+async def get_author_with_papers_async(orcid: str) -> Optional[Author]:
+    try:
+        r = await upstream.get(f"https://pub.orcid.org/{orcid}")
+    except UpstreamError:
+        return None
     if r.status_code != 200:
         logger.error(
             {
@@ -67,6 +72,10 @@ def get_author_with_papers(orcid: str) -> Optional[Author]:
     )
 
 
+def get_author_with_papers(orcid: str) -> Optional[Author]:
+    return upstream.run_sync(get_author_with_papers_async(orcid))
+
+
 def is_orcid(orcid: str) -> bool:
     return (
         re.match("[0-9A-Za-z]{4}-[0-9A-Za-z]{4}-[0-9A-Za-z]{4}-[0-9A-Za-z]{4}", orcid)
@@ -0,0 +1,112 @@
+"""Runner for batch enrichments of many papers, e.g. in ``scripts/are_we_right.py``"""
+
+import asyncio
+import sys
+import time
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    TextIO,
+    Tuple,
+    TypeVar,
+)
+
+from loguru import logger
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class Progress:
+    """Reports the number of processed items, the throughput and, if the total number
+    of items is known, the estimated time until all are processed.
+    """
+
+    def __init__(
+        self,
+        total: Optional[int] = None,
+        interval: float = 10.0,
+        timer: Callable[[], float] = time.monotonic,
+        file: TextIO = sys.stderr,
+    ):
+        self.total = total
+        self.interval = interval
+        self._timer = timer
+        self._file = file
+        self.n_done = 0
+        self.n_failed = 0
+        self._started_at = timer()
+        self._reported_at = self._started_at
+
+    @property
+    def rate(self) -> float:
+        """Processed items per second"""
+        elapsed = self._timer() - self._started_at
+        return self.n_done / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until all items are processed"""
+        if self.total is None or not self.rate:
+            return None
+        return max(self.total - self.n_done - self.n_failed, 0) / self.rate
+
+    def update(self, failed: bool = False):
+        if failed:
+            self.n_failed += 1
+        else:
+            self.n_done += 1
+        if self._timer() - self._reported_at >= self.interval:
+            self.report()
+
+    def report(self):
+        self._reported_at = self._timer()
+        total = "" if self.total is None else f"/{self.total}"
+        message = f"{self.n_done}{total} done, {self.rate:.1f}/s"
+        if self.n_failed:
+            message += f", {self.n_failed} failed"
+        if self.eta is not None:
+            message += f", ETA {time.strftime('%H:%M:%S', time.gmtime(self.eta))}"
+        print(message, file=self._file, flush=True)
+
+
+async def run_pipeline(
+    items: Iterable[T],
+    process: Callable[[T], Awaitable[R]],
+    concurrency: int = 16,
+    progress: Optional[Progress] = None,
+) -> AsyncIterator[Tuple[T, R]]:
+    """Process items with at most ``concurrency`` of them in flight at a time and
+    yield each item with its result as soon as it is done. Items are pulled from
+    ``items`` only as capacity frees up, so arbitrarily large inputs are processed
+    in bounded memory. Items whose processing fails are logged and skipped.
+    """
+    pending = {}
+    items = iter(items)
+    exhausted = False
+
+    while pending or not exhausted:
+        while not exhausted and len(pending) < concurrency:
+            item = next(items, None)
+            if item is None:
+                exhausted = True
+            else:
+                pending[asyncio.ensure_future(process(item))] = item
+        if not pending:
+            break
+
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            item = pending.pop(task)
+            exception = task.exception()
+            if progress is not None:
+                progress.update(failed=exception is not None)
+            if exception is not None:
+                logger.opt(exception=exception).error(
+                    {"event": "run_pipeline", "message": "item_failed", "item": item}
+                )
+                continue
+            yield item, task.result()
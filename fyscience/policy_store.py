@@ -0,0 +1,108 @@
+"""Offline store of Sherpa OA pathways per ISSN
+
+The store is a read-only SQLite database with the precomputed pathway and no cost
+policies of every ISSN of a Sherpa crawl (see ``scripts/populate-policy-cache.py``).
+Build it with ``scripts/build-policy-store.py``.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from fyscience.schemas import OAPathway
+from fyscience.utils import ProcessLocalConnection
+
+# Journal policies rarely change, but the store should be rebuilt at least weekly
+DEFAULT_MAX_AGE = 14 * 24 * 60 * 60
+
+
+def build_store(
+    pathways: Iterable[Tuple[str, OAPathway, Optional[List[dict]], float]], path: str
+):
+    """Write ``(issn, pathway, details, retrieved_at)`` tuples to a new store at
+    ``path``, replacing an existing one.
+    """
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path)
+    connection.execute(
+        "CREATE TABLE pathways ("
+        " issn TEXT PRIMARY KEY,"
+        " pathway TEXT NOT NULL,"
+        " details TEXT,"
+        " retrieved_at REAL NOT NULL"
+        ") WITHOUT ROWID"
+    )
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO pathways (issn, pathway, details, retrieved_at)"
+            " VALUES (?, ?, ?, ?)",
+            (
+                (
+                    issn.upper(),
+                    pathway.value,
+                    None if details is None else json.dumps(details),
+                    retrieved_at,
+                )
+                for issn, pathway, details, retrieved_at in pathways
+            ),
+        )
+    connection.close()
+    os.replace(tmp_path, path)
+
+
+class PolicyStore:
+    def __init__(
+        self,
+        path: str,
+        max_age: float = DEFAULT_MAX_AGE,
+        timer: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.max_age = max_age
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._connection = ProcessLocalConnection(self._open)
+
+    def _open(self) -> sqlite3.Connection:
+        return sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    def get(self, issn: str) -> Optional[Tuple[OAPathway, Optional[List[dict]]]]:
+        """Get the pathway and no cost policies for an ISSN or None if the ISSN wasn't
+        crawled or was crawled more than ``max_age`` seconds ago.
+        """
+        with self._lock:
+            row = (
+                self._connection.get()
+                .execute(
+                    "SELECT pathway, details FROM pathways"
+                    " WHERE issn = ? AND retrieved_at > ?",
+                    (issn.upper(), self._timer() - self.max_age),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+
+        pathway, details = row
+        return OAPathway(pathway), None if details is None else json.loads(details)
+
+
+@lru_cache()
+def get_policy_store() -> Optional[PolicyStore]:
+    """The policy store, if the ``SHERPA_POLICY_STORE`` environment variable points
+    to one. Entries older than ``SHERPA_POLICY_STORE_MAX_AGE`` seconds are ignored.
+    """
+    path = os.getenv("SHERPA_POLICY_STORE")
+    if not path:
+        return None
+    max_age = float(os.getenv("SHERPA_POLICY_STORE_MAX_AGE", DEFAULT_MAX_AGE))
+    return PolicyStore(path, max_age=max_age)
@@ -0,0 +1,88 @@
+"""Sampling profiler for single requests
+
+A background thread samples the stack of the thread handling the request (for async
+endpoints the event loop thread) at a fixed interval. The samples are written as
+folded stacks (``frame;frame;frame count``), which flamegraph.pl, speedscope or
+inferno turn into a flame graph.
+
+Note that the event loop thread also runs other requests in between, their samples
+end up in the profile as well. Samples of an idle loop end in ``select``.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+
+def _frame_name(frame) -> str:
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{frame.f_code.co_name}"
+
+
+class SamplingProfiler:
+    """Counts the stacks of the thread with ``thread_id`` (by default the thread that
+    creates the profiler) every ``interval`` seconds while started.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="fyscience-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = []
+        while frame is not None:
+            stack.append(_frame_name(frame))
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.samples.most_common()
+        )
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as file:
+            file.write(self.folded())
+
+
+def profile_name(route: str) -> str:
+    """File name for a profile of the route, unique per worker process"""
+    slug = route.strip("/").replace("/", "_") or "root"
+    return f"{int(time.time() * 1000)}-{os.getpid()}-{slug}.folded"
+
+
+def remove_old_profiles(directory: str, keep: int):
+    """Remove all but the ``keep`` newest profiles (by the time in their name) from
+    the directory
+    """
+    names = sorted(name for name in os.listdir(directory) if name.endswith(".folded"))
+    for name in names[: max(len(names) - keep, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # Removed by another worker in the meantime
+            pass
@@ -0,0 +1,150 @@
+"""Rate limits of upstream APIs, shared by all processes on a host
+
+Rate limits like that of the public Semantic Scholar API or our Sherpa quota apply per
+API key, not per gunicorn worker. Hence the token buckets live in a SQLite database,
+e.g. in ``/dev/shm``, from which all workers and the batch scripts draw.
+
+Background work, like refreshing stale cache entries or warming the cache in batch
+runs, leaves a reserve of every bucket to interactive requests.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+from fyscience.utils import ProcessLocalConnection
+
+# Requests per second and burst size per upstream host. Each host is called with at most
+# one API key (e.g. Semantic Scholar with key is partner.semanticscholar.org), so
+# buckets per host are buckets per API and key.
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    # 100 requests per 5 minutes without API key
+    "api.semanticscholar.org": (100 / 300, 10),
+}
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_priority: ContextVar[str] = ContextVar("rate_limit_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background():
+    """Mark all upstream calls within the block, including those of tasks started in
+    it, as background work, which yields to interactive requests.
+    """
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def get_priority() -> str:
+    return _priority.get()
+
+
+class SharedRateLimiter:
+    """Token buckets per upstream host stored in a SQLite database in WAL mode.
+
+    ``limits`` maps hosts to their requests per second and burst size, calls to other
+    hosts aren't limited. Background calls only get a token while more than
+    ``reserve`` of the bucket's burst size is left.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        reserve: float = 0.5,
+        timer: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.limits = dict(RATE_LIMITS if limits is None else limits)
+        self.reserve = reserve
+        self._timer = timer
+        self._lock = threading.Lock()
+        self._connection = ProcessLocalConnection(self._open)
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self.path, timeout=5, isolation_level=None, check_same_thread=False
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY,"
+            " tokens REAL NOT NULL,"
+            " updated_at REAL NOT NULL"
+            ") WITHOUT ROWID"
+        )
+        return connection
+
+    def try_acquire(self, host: str, priority: str = INTERACTIVE) -> float:
+        """Take a token from the host's bucket. Returns 0 if a token was taken (or the
+        host isn't limited), otherwise the seconds until one will be available.
+        """
+        if host not in self.limits:
+            return 0.0
+        rate, burst = self.limits[host]
+        floor = burst * self.reserve if priority == BACKGROUND else 0.0
+        with self._lock:
+            connection = self._connection.get()
+            # Locks the database right away, so that no other process takes the same
+            # token in between
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = self._timer()
+                row = connection.execute(
+                    "SELECT tokens, updated_at FROM buckets WHERE name = ?", (host,)
+                ).fetchone()
+                if row is None:
+                    tokens = burst
+                else:
+                    tokens = min(row[0] + max(now - row[1], 0.0) * rate, burst)
+
+                if tokens - 1 >= floor:
+                    tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (floor + 1 - tokens) / rate
+
+                connection.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at)"
+                    " VALUES (?, ?, ?)",
+                    (host, tokens, now),
+                )
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+        return wait
+
+
+@lru_cache()
+def get_rate_limiter() -> Optional[SharedRateLimiter]:
+    """The rate limiter shared by all processes on this host, if the
+    ``RATE_LIMIT_PATH`` environment variable points to a SQLite database file to use.
+    ``UPSTREAM_RATE_LIMITS`` adds to or overrides ``RATE_LIMITS``, e.g.
+    ``{"v2.sherpa.ac.uk": [5, 10]}`` for 5 requests per second in bursts of 10.
+    """
+    path = os.getenv("RATE_LIMIT_PATH")
+    if not path:
+        return None
+    limits = {
+        **RATE_LIMITS,
+        **{
+            host: tuple(limit)
+            for host, limit in json.loads(
+                os.getenv("UPSTREAM_RATE_LIMITS", "{}")
+            ).items()
+        },
+    }
+    return SharedRateLimiter(path, limits=limits)
@@ -0,0 +1,137 @@
+"""Retries of upstream calls that failed transiently, e.g. because the upstream API
+throttled us or a connection broke.
+
+Retries are spread out by exponential backoff with full jitter, or by the
+``Retry-After`` the upstream asked for. Each host has a retry budget, so that retries
+add at most a small fraction to the traffic of an upstream API that is struggling.
+"""
+
+import random
+import threading
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+import httpx
+
+RETRYABLE_STATUS_CODES = frozenset({429, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+# Raised before the request was sent, so that it is safe to retry any request
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class RetryBudget:
+    """Token bucket that allows retries for at most ``ratio`` of the calls, plus a
+    reserve of ``max_tokens`` retries for hosts that are called only rarely.
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        """Record a call, which earns ``ratio`` of a retry."""
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        """Whether a retry may be made now, which uses up one token if so."""
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Seconds to wait according to the ``Retry-After`` header, if any"""
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.1,
+        max_delay: float = 5.0,
+        budget: Optional[RetryBudget] = None,
+        random: Callable[[], float] = random.random,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = RetryBudget() if budget is None else budget
+        self._random = random
+
+    def is_retryable(
+        self,
+        method: str,
+        response: Optional[httpx.Response] = None,
+        error: Optional[Exception] = None,
+        idempotent: Optional[bool] = None,
+    ) -> bool:
+        """Whether the outcome of a call is transient and retrying it is safe.
+        Calls that aren't ``idempotent`` (by default all but e.g. GET) are only
+        retried if the upstream can't have processed them, i.e. they weren't sent or
+        were rejected as throttled.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        if error is not None:
+            return isinstance(error, NOT_SENT_ERRORS) or (
+                idempotent and isinstance(error, httpx.TransportError)
+            )
+        if response.status_code == 429:
+            return True
+        return idempotent and response.status_code in RETRYABLE_STATUS_CODES
+
+    def backoff(self, attempt: int) -> float:
+        """Delay before retrying after the given (1-based) attempt"""
+        return self._random() * min(self.base_delay * 2**attempt, self.max_delay)
+
+    def delay(
+        self, attempt: int, response: Optional[httpx.Response] = None
+    ) -> Optional[float]:
+        """Delay before the next attempt, None if the upstream asks us to wait for
+        longer than ``max_delay``.
+        """
+        retry_after = None if response is None else parse_retry_after(response)
+        if retry_after is None:
+            return self.backoff(attempt)
+        if retry_after > self.max_delay:
+            return None
+        return retry_after
+
+
+_policies: Dict[str, RetryPolicy] = {}
+_policies_lock = threading.Lock()
+
+
+def get_retry_policy(host: str) -> RetryPolicy:
+    with _policies_lock:
+        if host not in _policies:
+            _policies[host] = RetryPolicy()
+        return _policies[host]
+
+
+def set_retry_policy(host: str, policy: RetryPolicy):
+    """Replace the retry policy of the host, e.g. ``RetryPolicy(max_attempts=1)``
+    disables retries.
+    """
+    with _policies_lock:
+        _policies[host] = policy
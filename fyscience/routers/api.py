@@ -1,48 +1,72 @@
+import re
+import os
+import asyncio
 import json
+from typing import List, Optional
+from urllib.parse import unquote
 
 from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from loguru import logger
 
-from fyscience.schemas import OAPathway, FullPaper, Author, LogEntry
-from fyscience.unpaywall import get_paper as unpaywall_get_paper
-from fyscience.oa_pathway import oa_pathway
-from fyscience.oa_status import validate_oa_status_from_s2_and_zenodo
-from fyscience import openaccessbutton, orcid, semantic_scholar, crossref
-from fyscience.routers.deps import get_settings, Settings
+from fyscience.schemas import OAPathway, FullPaper, Author, LogEntry, PaperBatch
+from fyscience.cache import TTLCache
+from fyscience.enrichment import (
+    enrich_paper,
+    cache_pathway_lookups,
+    share_lookups,
+    PathwayLookup,
+)
+from fyscience import (
+    crossref,
+    ledger,
+    memory,
+    metrics,
+    orcid,
+    semantic_scholar,
+    sherpa,
+    upstream,
+)
+from fyscience.routers.deps import (
+    get_settings,
+    get_paper_cache,
+    get_pathway_cache,
+    profile_request,
+    verify_admin_token,
+    Settings,
+)
 
 
 api_router = APIRouter()
 
 
-@api_router.get("/api/authors", response_model=Author)
-def get_author_with_papers(
-    profile: str, request: Request, settings: Settings = Depends(get_settings)
-):
-    """Get all information associated with a specific author search string, which can
-    either be an ORCID, Semantic Scholar Profile ID or URL, or an author name to be
-    searched for with the Crossref meta-data search.
-    The returned ``Author.paper_ids`` contains a list of DOIs or S2 paper IDs provided
-    by the chosen search method.
-    To fetch fully populated papers, use ``GET api/papers?doi=...``
-    """
+async def find_author_with_papers(
+    profile: str, request: Request, settings: Settings
+) -> Author:
+    """Find the author for a search string, see ``GET /api/authors``"""
     author = None
 
-    extracted_orcid = orcid.extract_orcid(profile)
-    if extracted_orcid is not None:
-        author = orcid.get_author_with_papers(extracted_orcid)
+    with upstream.deadline(settings.request_deadline), ledger.recording() as calls:
+        extracted_orcid = orcid.extract_orcid(profile)
+        if extracted_orcid is not None:
+            author = await orcid.get_author_with_papers_async(extracted_orcid)
 
-    if author is None:
-        author_id = semantic_scholar.extract_profile_id_from_url(profile)
-        if not author_id.isnumeric():
-            author_id = semantic_scholar.get_author_id(profile, settings.s2_api_key)
+        if author is None:
+            author_id = semantic_scholar.extract_profile_id_from_url(profile)
+            if not author_id.isnumeric():
+                author_id = await semantic_scholar.get_author_id_async(
+                    profile, settings.s2_api_key
+                )
 
-        if author_id is not None:
-            author = semantic_scholar.get_author_with_papers(
-                author_id, settings.s2_api_key
-            )
+            if author_id is not None:
+                author = await semantic_scholar.get_author_with_papers_async(
+                    author_id, settings.s2_api_key
+                )
 
-    if author is None:
-        author = crossref.get_author_with_papers(profile)
+        if author is None:
+            author = await crossref.get_author_with_papers_async(profile)
+
+        remaining_budget = upstream.remaining()
 
     if author is None:
         logger.info(
@@ -50,6 +74,8 @@ def get_author_with_papers(
                 "event": "get_author_with_papers",
                 "message": "no_author_found",
                 "search_profile": profile,
+                "remaining_budget": remaining_budget,
+                "upstream_calls": ledger.as_log(calls),
                 "trace_context": request.headers.get("x-cloud-trace-context"),
             }
         )
@@ -66,6 +92,8 @@ def get_author_with_papers(
             "search_profile": profile,
             "provider": author.provider,
             "n_papers": len(author.paper_ids),
+            "remaining_budget": remaining_budget,
+            "upstream_calls": ledger.as_log(calls),
             "trace_context": request.headers.get("x-cloud-trace-context"),
         }
     )
@@ -73,33 +101,94 @@ def get_author_with_papers(
     return author
 
 
+@api_router.get(
+    "/api/authors",
+    response_model=Author,
+    dependencies=[Depends(profile_request)],
+)
+async def get_author_with_papers(
+    profile: str,
+    request: Request,
+    response: Response,
+    settings: Settings = Depends(get_settings),
+):
+    """Get all information associated with a specific author search string, which can
+    either be an ORCID, Semantic Scholar Profile ID or URL, or an author name to be
+    searched for with the Crossref meta-data search.
+    The returned ``Author.paper_ids`` contains a list of DOIs or S2 paper IDs provided
+    by the chosen search method.
+    To fetch fully populated papers, use ``GET api/papers?doi=...``
+
+    The ``Server-Timing`` header lists the provider calls made for the author.
+    """
+    with ledger.recording() as calls:
+        author = await find_author_with_papers(profile, request, settings)
+    response.headers["server-timing"] = ledger.server_timing(calls)
+    return author
+
+
 def extract_doi(input: str) -> str:
     return input.split("doi.org/")[-1]
 
 
-@api_router.get("/api/papers", response_model=FullPaper)
-def get_paper(
+def normalize_doi(input: str) -> str:
+    """DOIs are case-insensitive and may be passed URL-encoded, as doi.org URL or
+    with ``doi:`` prefix, this maps all variants of a DOI to the same key.
+    """
+    doi = extract_doi(unquote(input).strip())
+    return re.sub(r"^doi:\s*", "", doi, flags=re.IGNORECASE).lower()
+
+
+def _is_incomplete(paper: FullPaper) -> bool:
+    no_issn = paper.issn is None and not paper.is_open_access
+    return no_issn or paper.oa_pathway is OAPathway.not_found
+
+
+async def _get_paper(
     paper_id: str,
     request: Request,
-    response: Response,
-    settings: Settings = Depends(get_settings),
-):
-    """Get paper with OpenAccess status and pathway for a given DOI."""
-    response.headers["cache-control"] = "max-age=3600,public"
-
+    settings: Settings,
+    get_pathway: Optional[PathwayLookup] = None,
+    paper_cache: Optional[TTLCache] = None,
+) -> FullPaper:
+    """Enrich a paper within ``settings.request_deadline``, papers of batches each get
+    their own deadline once they are started.
+    """
     doi = extract_doi(paper_id)
 
-    if "/" not in paper_id:
-        paper = semantic_scholar.get_paper(paper_id)
+    with upstream.deadline(settings.request_deadline), ledger.recording() as calls:
+        if "/" not in paper_id:
+            paper = await semantic_scholar.get_paper_async(paper_id)
 
-        if paper is None:
-            raise HTTPException(404, f"No paper found for {paper_id}")
+            if paper is None:
+                raise HTTPException(404, f"No paper found for {paper_id}")
 
-        doi = paper.doi
+            doi = paper.doi
 
-    paper = unpaywall_get_paper(doi=doi, email=settings.unpaywall_email)
-    if paper is None:
-        paper = FullPaper(doi=doi)
+        paper = None if paper_cache is None else paper_cache.get(normalize_doi(doi))
+        if paper_cache is not None:
+            metrics.observe_cache_lookup("paper", "miss" if paper is None else "hit")
+        if paper is None:
+            paper = await enrich_paper(
+                doi,
+                unpaywall_email=settings.unpaywall_email,
+                sherpa_api_key=settings.sherpa_api_key,
+                s2_api_key=settings.s2_api_key,
+                get_pathway=get_pathway,
+            )
+            # Degraded papers lack results only while an upstream is failing, e.g.
+            # while its circuit is open, so they aren't cached at all
+            if paper_cache is not None and not paper.degraded:
+                paper_cache.set(
+                    normalize_doi(doi),
+                    paper,
+                    ttl=(
+                        settings.paper_cache_incomplete_ttl
+                        if _is_incomplete(paper)
+                        else settings.paper_cache_ttl
+                    ),
+                )
+        remaining_budget = upstream.remaining()
 
     if paper.issn is None and not paper.is_open_access:
         logger.warning(
@@ -109,16 +198,12 @@ def get_paper(
                 "doi": doi,
                 "provider": "unpaywall",
                 "paper": json.dumps(paper.dict()),
+                "upstream_calls": ledger.as_log(calls),
                 "trace_context": request.headers.get("x-cloud-trace-context"),
             }
         )
         return paper
 
-    # TODO: Don't do this twice if the author papers already have the s2 status
-    #       Potentially move towards an enrich as opposed to a construct approach
-    paper = validate_oa_status_from_s2_and_zenodo(paper, settings.s2_api_key)
-
-    paper = oa_pathway(paper=paper, api_key=settings.sherpa_api_key)
     if paper.oa_pathway is OAPathway.not_found:
         logger.warning(
             {
@@ -128,22 +213,11 @@ def get_paper(
                 "provider": "sherpa",
                 "issn": paper.issn,
                 "paper": json.dumps(paper.dict()),
+                "upstream_calls": ledger.as_log(calls),
                 "trace_context": request.headers.get("x-cloud-trace-context"),
             }
         )
 
-    # Ensure it's a FullPaper and not just a PaperWithOAStatus
-    paper = FullPaper(**paper.dict())
-
-    # NOTE: There are cases where there is no best_permission but an all_permission key
-    #       e.g. https://api.openaccessbutton.org/permissions?doi=10.1055/s-0030-1263175
-    perms = openaccessbutton.get_permissions(paper.doi)
-    if perms is not None:
-        if perms.get("best_permission", None):
-            paper.can_share_your_paper = perms["best_permission"]["can_archive"]
-        elif perms.get("all_permissions", None):
-            paper.can_share_your_paper = perms["all_permissions"][0]["can_archive"]
-
     logger.info(
         {
             "event": "get_paper",
@@ -152,6 +226,8 @@ def get_paper(
             "is_oa": paper.is_open_access,
             "can_syp": paper.can_share_your_paper,
             "pathway": str(paper.oa_pathway),
+            "remaining_budget": remaining_budget,
+            "upstream_calls": ledger.as_log(calls),
             "trace_context": request.headers.get("x-cloud-trace-context"),
         }
     )
@@ -159,6 +235,220 @@ def get_paper(
     return paper
 
 
+@api_router.get(
+    "/api/papers",
+    response_model=FullPaper,
+    dependencies=[Depends(profile_request)],
+)
+async def get_paper(
+    paper_id: str,
+    request: Request,
+    response: Response,
+    settings: Settings = Depends(get_settings),
+    pathway_cache: TTLCache = Depends(get_pathway_cache),
+    paper_cache: TTLCache = Depends(get_paper_cache),
+):
+    """Get paper with OpenAccess status and pathway for a given DOI.
+    The ``Server-Timing`` header lists the provider calls made for the paper.
+    """
+    response.headers["cache-control"] = "max-age=3600,public"
+
+    get_pathway = cache_pathway_lookups(sherpa.get_pathway_async, pathway_cache)
+    with ledger.recording() as calls:
+        paper = await _get_paper(paper_id, request, settings, get_pathway, paper_cache)
+    response.headers["server-timing"] = ledger.server_timing(calls)
+    return paper
+
+
+def _get_papers(
+    paper_ids: List[str],
+    request: Request,
+    settings: Settings,
+    pathway_cache: TTLCache,
+    paper_cache: Optional[TTLCache] = None,
+) -> List["asyncio.Task[Optional[FullPaper]]"]:
+    """Start enriching the given papers with bounded concurrency, sharing Sherpa lookups
+    across papers. Tasks of papers that can't be found resolve to ``None``.
+    """
+    get_pathway = share_lookups(
+        cache_pathway_lookups(sherpa.get_pathway_async, pathway_cache)
+    )
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def get_paper_or_none(paper_id: str) -> Optional[FullPaper]:
+        async with semaphore:
+            try:
+                return await _get_paper(
+                    paper_id, request, settings, get_pathway, paper_cache
+                )
+            except HTTPException:
+                return None
+            except Exception as e:
+                logger.error(
+                    {
+                        "event": "get_papers",
+                        "message": "paper_failed",
+                        "paper_id": paper_id,
+                        "error": repr(e),
+                        "trace_context": request.headers.get("x-cloud-trace-context"),
+                    }
+                )
+                return None
+
+    return [
+        asyncio.ensure_future(get_paper_or_none(paper_id))
+        for paper_id in dict.fromkeys(paper_ids)
+    ]
+
+
+@api_router.post("/api/papers:batch", response_model=List[FullPaper])
+async def get_papers(
+    batch: PaperBatch,
+    request: Request,
+    settings: Settings = Depends(get_settings),
+    pathway_cache: TTLCache = Depends(get_pathway_cache),
+    paper_cache: TTLCache = Depends(get_paper_cache),
+):
+    """Get papers with OpenAccess status and pathway for a list of DOIs or S2 paper IDs,
+    e.g. all ``Author.paper_ids``. Papers that can't be found are left out.
+    All papers published in the same journal share a single Sherpa lookup.
+    """
+    papers = await asyncio.gather(
+        *_get_papers(batch.paper_ids, request, settings, pathway_cache, paper_cache)
+    )
+
+    return [paper for paper in papers if paper is not None]
+
+
+@api_router.get("/api/authors/{profile:path}/papers/stream")
+async def stream_author_papers(
+    profile: str,
+    request: Request,
+    settings: Settings = Depends(get_settings),
+    pathway_cache: TTLCache = Depends(get_pathway_cache),
+    paper_cache: TTLCache = Depends(get_paper_cache),
+):
+    """Stream the fully populated papers of an author, found the same way as with
+    ``GET /api/authors``, in the order in which their enrichment finishes.
+
+    Papers are sent as newline delimited JSON, or as Server-Sent Events ``paper``
+    followed by a final ``end`` event if ``text/event-stream`` is accepted.
+    """
+    author = await find_author_with_papers(profile, request, settings)
+    tasks = _get_papers(author.paper_ids, request, settings, pathway_cache, paper_cache)
+
+    use_sse = "text/event-stream" in request.headers.get("accept", "")
+
+    async def serialized_papers():
+        try:
+            for next_paper in asyncio.as_completed(tasks):
+                paper = await next_paper
+                if paper is None:
+                    continue
+                if use_sse:
+                    yield f"event: paper\ndata: {json.dumps(paper.dict())}\n\n"
+                else:
+                    yield json.dumps(paper.dict()) + "\n"
+            if use_sse:
+                yield "event: end\ndata: {}\n\n"
+        finally:
+            # In case the client disconnected early
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        serialized_papers(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"cache-control": "no-cache", "x-accel-buffering": "no"},
+    )
+
+
+@api_router.delete(
+    "/api/admin/paper-cache",
+    status_code=204,
+    dependencies=[Depends(verify_admin_token)],
+    include_in_schema=False,
+)
+def invalidate_paper_cache(
+    doi: Optional[str] = None,
+    paper_cache: TTLCache = Depends(get_paper_cache),
+):
+    """Drop the cached paper for a DOI, or all cached papers if no DOI is given, from
+    the paper cache of the worker process handling this request only.
+
+    Other workers keep serving their cached papers until these expire. Neither the
+    pathway cache nor the shared cache of upstream responses is touched, so a paper
+    enriched again gets the same pathway from Sherpa's cached answer.
+    """
+    if doi is None:
+        paper_cache.clear()
+    else:
+        paper_cache.pop(normalize_doi(doi), None)
+
+
+@api_router.get(
+    "/api/admin/upstreams",
+    dependencies=[Depends(verify_admin_token)],
+    include_in_schema=False,
+)
+async def get_upstream_stats():
+    """Current concurrency limit, calls in flight and queued calls, and circuit breaker
+    state per upstream host of this worker process
+    """
+    return upstream.stats()
+
+
+@api_router.get(
+    "/api/admin/memory",
+    dependencies=[Depends(verify_admin_token)],
+    include_in_schema=False,
+)
+def get_memory_report(
+    limit: int = 20,
+    pathway_cache: TTLCache = Depends(get_pathway_cache),
+    paper_cache: TTLCache = Depends(get_paper_cache),
+):
+    """Top allocation sites of this worker process, their growth since the previous
+    report and the sizes of the in-process caches, see ``memory.report``
+    """
+    return memory.report({"pathway": pathway_cache, "paper": paper_cache}, limit=limit)
+
+
+@api_router.put(
+    "/api/admin/memory/tracing",
+    status_code=204,
+    dependencies=[Depends(verify_admin_token)],
+    include_in_schema=False,
+)
+def start_memory_tracing():
+    memory.start()
+
+
+@api_router.delete(
+    "/api/admin/memory/tracing",
+    status_code=204,
+    dependencies=[Depends(verify_admin_token)],
+    include_in_schema=False,
+)
+def stop_memory_tracing():
+    memory.stop()
+
+
+@api_router.get(
+    "/api/admin/profiles/{name}",
+    response_class=PlainTextResponse,
+    dependencies=[Depends(verify_admin_token)],
+    include_in_schema=False,
+)
+def get_profile(name: str, settings: Settings = Depends(get_settings)):
+    """Folded stacks of a profiled request of this host, see ``profile_request``"""
+    path = os.path.join(settings.profile_dir, os.path.basename(name))
+    if not os.path.isfile(path):
+        raise HTTPException(404)
+    with open(path) as file:
+        return file.read()
+
+
 @api_router.get("/debug", include_in_schema=False)
 def get_request_headers(request: Request):
     return {"headers": request.headers, "url_scheme": request.url.scheme}
@@ -1,8 +1,16 @@
 import os
+import random
+import secrets
 from typing import Optional
 from functools import lru_cache
+
+import anyio.to_thread
+from fastapi import Depends, HTTPException, Request, Response
+from loguru import logger
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from fyscience.cache import TTLCache
+from fyscience.profiler import SamplingProfiler, profile_name, remove_old_profiles
 
 TEMPLATE_PATH = os.path.join(
     os.path.abspath(os.path.dirname(__file__)), "..", "templates"
@@ -13,6 +21,23 @@ class Settings(BaseSettings):
     sherpa_api_key: str
     unpaywall_email: str
     s2_api_key: Optional[str] = None
+    batch_concurrency: int = 8
+    pathway_cache_maxsize: int = 10000
+    pathway_cache_ttl: float = 24 * 60 * 60
+    paper_cache_maxsize: int = 10000
+    paper_cache_ttl: float = 6 * 60 * 60
+    # For papers without ISSN or pathway, which may well be found on the next try
+    paper_cache_incomplete_ttl: float = 60 * 60
+    admin_token: Optional[str] = None
+    # Seconds the upstream calls for a paper or an author may take in total, after
+    # which the results found so far are returned
+    request_deadline: float = 3.0
+    # Share of paper, author and search requests to profile, besides those asking for
+    # it with the admin token in the x-profile header
+    profile_sample_rate: float = 0.0
+    profile_dir: str = "/tmp/fyscience-profiles"
+    # Profiles kept in profile_dir, older ones are removed
+    profile_max_files: int = 100
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -20,3 +45,87 @@ class Settings(BaseSettings):
 @lru_cache()
 def get_settings():
     return Settings()
+
+
+@lru_cache()
+def _get_pathway_cache(maxsize: int, ttl: float) -> TTLCache:
+    return TTLCache(maxsize=maxsize, ttl=ttl)
+
+
+def get_pathway_cache(settings: Settings = Depends(get_settings)) -> TTLCache:
+    """Process-wide cache of Sherpa pathways and no cost policy details per ISSN"""
+    return _get_pathway_cache(
+        settings.pathway_cache_maxsize, settings.pathway_cache_ttl
+    )
+
+
+@lru_cache()
+def _get_paper_cache(maxsize: int) -> TTLCache:
+    return TTLCache(maxsize=maxsize)
+
+
+def get_paper_cache(settings: Settings = Depends(get_settings)) -> TTLCache:
+    """Process-wide cache of fully enriched papers per normalized DOI"""
+    return _get_paper_cache(settings.paper_cache_maxsize)
+
+
+def verify_admin_token(request: Request, settings: Settings = Depends(get_settings)):
+    """Only allow requests with the ``admin_token`` as bearer token, admin endpoints
+    don't exist if no (or an empty) token is configured.
+    """
+    if not settings.admin_token:
+        raise HTTPException(404)
+
+    authorization = request.headers.get("authorization", "")
+    if not secrets.compare_digest(
+        authorization.encode(), f"Bearer {settings.admin_token}".encode()
+    ):
+        raise HTTPException(403)
+
+
+def _profile_requested(request: Request, settings: Settings) -> bool:
+    token = request.headers.get("x-profile")
+    if token is not None and settings.admin_token:
+        return secrets.compare_digest(token.encode(), settings.admin_token.encode())
+    return random.random() < settings.profile_sample_rate
+
+
+def _save_profile(profiler: SamplingProfiler, path: str, max_files: int):
+    profiler.stop()
+    profiler.write(path)
+    remove_old_profiles(os.path.dirname(path), max_files)
+
+
+async def profile_request(
+    request: Request, response: Response, settings: Settings = Depends(get_settings)
+):
+    """Profile the request if asked to by the admin token in the ``x-profile`` header,
+    or sampled at ``profile_sample_rate``. The folded stacks are written to
+    ``profile_dir`` (which keeps the ``profile_max_files`` newest profiles) and
+    logged, the file name is also returned in the ``x-profile`` header of JSON
+    responses.
+    """
+    if not _profile_requested(request, settings):
+        yield
+        return
+
+    name = profile_name(request.scope["route"].path)
+    response.headers["x-profile"] = name
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        path = os.path.join(settings.profile_dir, name)
+        await anyio.to_thread.run_sync(
+            _save_profile, profiler, path, settings.profile_max_files
+        )
+        logger.info(
+            {
+                "event": "profile",
+                "message": "profile_written",
+                "path": path,
+                "samples": sum(profiler.samples.values()),
+                "trace_context": request.headers.get("x-cloud-trace-context"),
+            }
+        )
@@ -6,9 +6,14 @@ from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from starlette.datastructures import URL
 
-from fyscience.routers.api import get_author_with_papers
-from fyscience.routers.deps import get_settings, Settings, TEMPLATE_PATH
-from fyscience.openaccessbutton import get_paper_metadata
+from fyscience.routers.api import find_author_with_papers
+from fyscience.routers.deps import (
+    get_settings,
+    profile_request,
+    Settings,
+    TEMPLATE_PATH,
+)
+from fyscience.openaccessbutton import get_paper_metadata_async
 from fyscience.utils import assemble_author_name
 
 
@@ -38,10 +43,10 @@ def _render_paper_page(
     )
 
 
-def _render_author_page(
+async def _render_author_page(
     author_query: str, settings: Settings, request: Request
 ) -> templates.TemplateResponse:
-    author = get_author_with_papers(
+    author = await find_author_with_papers(
         profile=author_query, request=request, settings=settings
     )
 
@@ -86,8 +91,10 @@ def get_landing_page(request: Request, response: Response):
     return _simple_template_response("landing_page.html", request)
 
 
-@html_router.get("/search", response_class=HTMLResponse)
-def get_search_result_html(
+@html_router.get(
+    "/search", response_class=HTMLResponse, dependencies=[Depends(profile_request)]
+)
+async def get_search_result_html(
     query: str, request: Request, settings: Settings = Depends(get_settings)
 ):
     """Allows author name, ORCID, Semantic Scholar ID / profile URL and DOI queries."""
@@ -95,15 +102,15 @@ def get_search_result_html(
     if _is_doi_query(query):
         return _render_paper_page(doi=query, settings=settings, request=request)
     else:
-        return _render_author_page(
+        return await _render_author_page(
             author_query=query, settings=settings, request=request
         )
 
 
 @html_router.get("/syp", response_class=HTMLResponse)
-def get_share_your_paper(doi: str, request: Request):
+async def get_share_your_paper(doi: str, request: Request):
     """Get shareyourpaper.org submission form for the given DOI."""
-    paper_meta_data = get_paper_metadata(doi=doi)
+    paper_meta_data = await get_paper_metadata_async(doi=doi)
 
     host = request.headers["host"]
     server_url = (
@@ -5,6 +5,8 @@ from pydantic import BaseModel, Field
 
 # TODO: Unify paper models
 
+MAX_BATCH_SIZE = 100
+
 
 class OAPathway(str, Enum):
     already_oa = "already_oa"
@@ -57,6 +59,12 @@ class FullPaper(BaseModel):
     oa_pathway: Optional[OAPathway] = None
     oa_pathway_details: Optional[List[dict]] = None
     can_share_your_paper: bool = False
+    # Enrichment steps skipped, since their upstream API is failing
+    degraded: Optional[List[str]] = None
+
+
+class PaperBatch(BaseModel):
+    paper_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
 
 
 class Author(BaseModel):
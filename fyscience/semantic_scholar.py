@@ -1,11 +1,13 @@
 from typing import List, Optional
 
-import requests
+import httpx
 from pydantic import BaseModel
 from loguru import logger
-from urllib3.exceptions import HTTPError
-from requests.exceptions import ConnectionError
 
+from fyscience import metrics, tracing, upstream
+from fyscience.upstream import UpstreamError
+from fyscience.cache import cached
+from fyscience.singleflight import single_flight
 from fyscience.schemas import FullPaper, Author
 
 
@@ -46,10 +48,9 @@ class S2Author(BaseModel):
     url: Optional[str] = None
 
 
-@logger.catch((HTTPError, ConnectionError))
-def _get_request(
+async def _get_request(
     relative_url: str, api_key: str, graph_api: bool = False, **kwargs
-) -> Optional[requests.Response]:
+) -> Optional[httpx.Response]:
     if api_key is not None:
         headers = kwargs.pop("headers", None)
         if isinstance(headers, dict):
@@ -69,14 +70,17 @@ def _get_request(
             + f"{'/graph' if graph_api else ''}/v1/{relative_url}"
         )
 
-    return requests.get(url, **kwargs)
+    try:
+        return await upstream.get(url, **kwargs)
+    except UpstreamError:
+        return None
 
 
-def _get_paper(paper_id: str, api_key: str = None) -> Optional[Paper]:
-    r = _get_request(f"paper/{paper_id}", api_key)
+async def _get_paper(paper_id: str, api_key: str = None) -> Optional[Paper]:
+    r = await _get_request(f"paper/{paper_id}", api_key)
 
     if r is None:
-        return None
+        raise UpstreamError("Semantic Scholar failed to respond")
 
     if r.status_code != 200:
         logger.error(
@@ -88,13 +92,24 @@ def _get_paper(paper_id: str, api_key: str = None) -> Optional[Paper]:
                 "response": r.content.decode() if r.content else "",
             }
         )
-        return None
-
-    return Paper(**r.json())
-
-
-def get_paper(paper_id: str, api_key: str = None) -> Optional[FullPaper]:
-    paper = _get_paper(paper_id, api_key)
+        if r.status_code == 404:
+            return None
+        raise UpstreamError(f"Semantic Scholar responded with {r.status_code}")
+
+    with tracing.span("parse_response", model="semantic_scholar.Paper"):
+        return Paper(**r.json())
+
+
+@metrics.provider_function
+@upstream.fallback(None)
+@single_flight("semantic_scholar")
+@cached(
+    "semantic_scholar",
+    dump=lambda paper: paper.dict(),
+    load=lambda paper: FullPaper(**paper),
+)
+async def get_paper_async(paper_id: str, api_key: str = None) -> Optional[FullPaper]:
+    paper = await _get_paper(paper_id, api_key)
     if paper is None or paper.doi is None:
         logger.info(
             {
@@ -115,8 +130,12 @@ def get_paper(paper_id: str, api_key: str = None) -> Optional[FullPaper]:
     )
 
 
-def _get_author(author_id: str, api_key: str = None) -> Optional[S2Author]:
-    r = _get_request(f"author/{author_id}", api_key)
+def get_paper(paper_id: str, api_key: str = None) -> Optional[FullPaper]:
+    return upstream.run_sync(get_paper_async(paper_id, api_key))
+
+
+async def _get_author(author_id: str, api_key: str = None) -> Optional[S2Author]:
+    r = await _get_request(f"author/{author_id}", api_key)
 
     if r is None:
         return None
@@ -133,11 +152,15 @@ def _get_author(author_id: str, api_key: str = None) -> Optional[S2Author]:
         )
         return None
 
-    return S2Author(**r.json())
+    with tracing.span("parse_response", model="semantic_scholar.S2Author"):
+        return S2Author(**r.json())
 
 
-def get_author_with_papers(author_id: str, api_key: str = None) -> Optional[Author]:
-    author = _get_author(author_id, api_key)
+@metrics.provider_function
+async def get_author_with_papers_async(
+    author_id: str, api_key: str = None
+) -> Optional[Author]:
+    author = await _get_author(author_id, api_key)
     if author is None:
         return None
 
@@ -152,6 +175,10 @@ def get_author_with_papers(author_id: str, api_key: str = None) -> Optional[Auth
     )
 
 
+def get_author_with_papers(author_id: str, api_key: str = None) -> Optional[Author]:
+    return upstream.run_sync(get_author_with_papers_async(author_id, api_key))
+
+
 def get_dois(author_id: str, api_key: str = None) -> List[str]:
     author = get_author_with_papers(author_id, api_key)
     if author is None:
@@ -170,9 +197,10 @@ def extract_profile_id_from_url(url: str) -> Optional[str]:
     return author_id
 
 
-def get_author_id(author_name: str, api_key: str = None) -> Optional[str]:
+@metrics.provider_function
+async def get_author_id_async(author_name: str, api_key: str = None) -> Optional[str]:
     """Get S2 author ID via the author search."""
-    r = _get_request(
+    r = await _get_request(
         f"author/search?query={author_name}", api_key=api_key, graph_api=True
     )
 
@@ -184,3 +212,7 @@ def get_author_id(author_name: str, api_key: str = None) -> Optional[str]:
         return None
 
     return data[0].get("authorId")
+
+
+def get_author_id(author_name: str, api_key: str = None) -> Optional[str]:
+    return upstream.run_sync(get_author_id_async(author_name, api_key))
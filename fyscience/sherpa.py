@@ -2,9 +2,13 @@ import os
 import json
 from typing import Optional, Tuple, List
 
-import requests
 from loguru import logger
 
+from fyscience import ledger, metrics, upstream
+from fyscience.upstream import UpstreamError
+from fyscience.cache import cached
+from fyscience.singleflight import single_flight
+from fyscience.policy_store import get_policy_store
 from fyscience.schemas import OAPathway
 
 
@@ -27,7 +31,22 @@ def has_no_cost_oa_policy(policy: dict) -> bool:
         return False
 
 
-def get_pathway(
+def _load_cached_pathway(cached: list) -> Tuple[OAPathway, Optional[List[dict]]]:
+    pathway, details = cached
+    return OAPathway(pathway), details
+
+
+def _is_found(pathway_and_details: Tuple[OAPathway, Optional[List[dict]]]) -> bool:
+    return pathway_and_details[0] is not OAPathway.not_found
+
+
+@cached(
+    "sherpa",
+    dump=list,
+    load=_load_cached_pathway,
+    cache_if=_is_found,
+)
+async def _get_pathway_from_api(
     issn: str, api_key: Optional[str] = None
 ) -> Tuple[OAPathway, Optional[List[dict]]]:
     """Fetch information about the available open access pathways for the publciation
@@ -45,6 +64,8 @@ def get_pathway(
         In case no Sherpa API key is passed to the function as an argument and none is
         found in the ``SHERPA_API_KEY`` environment variable.
         To obtain an API key, register at https://v2.sherpa.ac.uk/cgi/register
+    UpstreamError
+        In case the API fails to answer, as opposed to not knowing the ISSN.
     """
     api_key = os.getenv("SHERPA_API_KEY") if api_key is None else api_key
     if api_key is None or not api_key:
@@ -52,7 +73,7 @@ def get_pathway(
             "No Sherpa API key available in the 'SHERPA_API_KEY' environment variable."
         )
 
-    response = requests.get(
+    response = await upstream.get(
         "https://v2.sherpa.ac.uk/cgi/retrieve?"
         + f"item-type=publication&api-key={api_key}&format=Json&"
         + f'filter=[["issn","equals","{issn}"]]'
@@ -67,9 +88,17 @@ def get_pathway(
                 "response": response.content.decode() if response.content else "",
             }
         )
-        return OAPathway.not_found, None
+        raise UpstreamError(f"Sherpa responded with {response.status_code}")
 
-    publications = response.json()
+    return classify_publications(response.json())
+
+
+def classify_publications(
+    publications: Optional[dict],
+) -> Tuple[OAPathway, Optional[List[dict]]]:
+    """Determine the OA pathway and the no cost policies from the publications
+    returned by the Sherpa API for an ISSN
+    """
     try:
         if (
             not publications
@@ -95,3 +124,28 @@ def get_pathway(
         return OAPathway.other, None
 
     return OAPathway.nocost, oa_policies_no_cost
+
+
+@metrics.provider_function
+@upstream.fallback((OAPathway.not_found, None))
+@single_flight("sherpa")
+async def get_pathway_async(
+    issn: str, api_key: Optional[str] = None
+) -> Tuple[OAPathway, Optional[List[dict]]]:
+    """Get the pathway from the offline policy store, if there is one and it holds a
+    recent enough classification for the ISSN, and from the Sherpa API otherwise.
+    """
+    policy_store = get_policy_store()
+    if policy_store is not None:
+        pathway_and_details = policy_store.get(issn)
+        if pathway_and_details is not None:
+            ledger.note_cache("policy_store")
+            return pathway_and_details
+
+    return await _get_pathway_from_api(issn, api_key)
+
+
+def get_pathway(
+    issn: str, api_key: Optional[str] = None
+) -> Tuple[OAPathway, Optional[List[dict]]]:
+    return upstream.run_sync(get_pathway_async(issn, api_key))
@@ -0,0 +1,100 @@
+"""Coalescing of concurrent identical upstream lookups
+
+While a lookup, e.g. of the pathway for an ISSN, is in flight, further calls with the
+same arguments wait for its result instead of querying the upstream API again.
+"""
+
+import asyncio
+import inspect
+import weakref
+from collections import Counter
+from copy import deepcopy
+from functools import wraps
+from typing import Dict
+
+from fyscience import ledger
+
+# Per namespace: calls, calls that were served by a lookup already in flight and
+# lookups in flight
+_calls: Counter = Counter()
+_coalesced: Counter = Counter()
+_in_flight: Counter = Counter()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.n_waiters = 0
+
+
+def single_flight(namespace: str):
+    """Decorate an async provider function to share in-flight calls with the same
+    arguments. Callers of a shared call each get a copy of the result, since callers
+    may modify it, e.g. ``enrich_paper`` adds the pathway to the paper.
+    """
+
+    def decorator(function):
+        signature = inspect.signature(function)
+        # Calls are bound to the event loop they were started on
+        flights: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+        @wraps(function)
+        async def single_flight_function(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple(bound.arguments.values())
+            loop_flights: Dict[tuple, _Flight] = flights.setdefault(
+                asyncio.get_running_loop(), {}
+            )
+
+            _calls[namespace] += 1
+            flight = loop_flights.get(key, None)
+            is_first = flight is None
+            if is_first:
+                flight = _Flight(asyncio.ensure_future(function(*args, **kwargs)))
+                loop_flights[key] = flight
+                _in_flight[namespace] += 1
+
+                def land(_):
+                    loop_flights.pop(key, None)
+                    _in_flight[namespace] -= 1
+
+                flight.task.add_done_callback(land)
+            else:
+                _coalesced[namespace] += 1
+                ledger.note_cache("coalesced")
+
+            flight.n_waiters += 1
+            try:
+                # Shielded, so that one caller being cancelled doesn't cancel the
+                # lookup for the others, unless nobody waits for it anymore
+                result = await asyncio.shield(flight.task)
+                # The first caller may resume before the others, so it only gets
+                # the result itself if nobody else waits for it
+                is_shared = not is_first or flight.n_waiters > 1
+            except asyncio.CancelledError:
+                if flight.n_waiters == 1:
+                    flight.task.cancel()
+                raise
+            finally:
+                flight.n_waiters -= 1
+
+            return deepcopy(result) if is_shared else result
+
+        return single_flight_function
+
+    return decorator
+
+
+def stats() -> dict:
+    """Number of calls, of calls saved by coalescing and of lookups in flight per
+    namespace
+    """
+    return {
+        namespace: {
+            "calls": _calls[namespace],
+            "coalesced": _coalesced[namespace],
+            "in_flight": _in_flight[namespace],
+        }
+        for namespace in _calls
+    }
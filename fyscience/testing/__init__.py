@@ -0,0 +1,3 @@
+"""Stand-ins for the upstream APIs and a benchmark of the endpoints against them, to
+test and measure the service without network access
+"""
@@ -0,0 +1,249 @@
+"""Latency and throughput of the endpoints against stand-ins of the upstream APIs
+
+Runs the app with uvicorn in a subprocess, with all its upstream calls sent to the
+stand-ins of ``fyscience.testing.upstreams``, and requests every scenario's endpoint
+from concurrent clients. No network access is needed, so runs before and after a
+change can be compared, e.g.
+
+    python -m fyscience.testing.benchmark --requests 500 --concurrency 50
+
+Every request of a scenario asks for a different paper or author, so the in-process
+caches only answer the upstream calls that repeat across requests.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import quote
+
+import httpx
+
+from fyscience.testing import payloads
+from fyscience.testing.upstreams import FakeUpstreams, default_behaviours
+
+
+def _orcid(i: int) -> str:
+    return f"0000-0002-{i // 10000 % 10000:04d}-{i % 10000:04d}"
+
+
+# Path of the i-th request per scenario
+SCENARIOS: Dict[str, Callable[[int], str]] = {
+    "papers": lambda i: "/api/papers?paper_id="
+    + quote(payloads.dois()[i % len(payloads.dois())]),
+    "authors": lambda i: f"/api/authors?profile={_orcid(i)}",
+    "search": lambda i: "/search?query="
+    + quote(f"{payloads.author_names()[i % len(payloads.author_names())]} {i}"),
+}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """The ``q``-th percentile (nearest rank) of the values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(math.ceil(q * len(ordered) / 100), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies: List[float], statuses: List[int], duration: float) -> dict:
+    """Latency percentiles in seconds and throughput in requests per second of the
+    requests, and how many of them failed (5xx or no response at all)
+    """
+    return {
+        "requests": len(latencies),
+        "errors": sum(1 for status in statuses if status == 0 or status >= 500),
+        "throughput": len(latencies) / duration if duration > 0 else None,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+async def run_load(client: httpx.AsyncClient, paths: List[str], concurrency: int):
+    """Request the paths from ``concurrency`` concurrent clients"""
+    queue: asyncio.Queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+    latencies, statuses = [], []
+
+    async def worker():
+        while not queue.empty():
+            path = queue.get_nowait()
+            started_at = time.monotonic()
+            try:
+                status = (await client.get(path)).status_code
+            except httpx.HTTPError:
+                status = 0
+            latencies.append(time.monotonic() - started_at)
+            statuses.append(status)
+
+    started_at = time.monotonic()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, statuses, time.monotonic() - started_at)
+
+
+async def run_benchmark(
+    app_url: str,
+    scenarios: List[str],
+    n_requests: int,
+    concurrency: int,
+    n_warmup: int = 10,
+) -> Dict[str, dict]:
+    """Summaries per scenario, each after ``n_warmup`` requests that aren't counted"""
+    results = {}
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=app_url, limits=limits, timeout=60.0
+    ) as client:
+        for scenario in scenarios:
+            path = SCENARIOS[scenario]
+            # Warm-up requests ask for other papers and authors than the measured ones
+            await run_load(
+                client,
+                [path(n_requests + i) for i in range(n_warmup)],
+                concurrency,
+            )
+            results[scenario] = await run_load(
+                client, [path(i) for i in range(n_requests)], concurrency
+            )
+    return results
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def run_app(
+    base_urls: Dict[str, str],
+    workers: int = 1,
+    log_path: Optional[str] = None,
+    timeout: float = 30.0,
+) -> Iterator[str]:
+    """Run the app with uvicorn, sending its upstream calls to ``base_urls``, and
+    yield its URL once it answers
+    """
+    port = _free_port()
+    env = {
+        "SHERPA_API_KEY": "benchmark",
+        "UNPAYWALL_EMAIL": "benchmark@freeyourscience.org",
+        **os.environ,
+        "UPSTREAM_BASE_URLS": json.dumps(base_urls),
+    }
+    log = open(log_path or os.devnull, "w")
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "fyscience.main:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    try:
+        url = f"http://127.0.0.1:{port}"
+        started_at = time.monotonic()
+        while True:
+            try:
+                if httpx.get(f"{url}/metrics").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if process.poll() is not None or time.monotonic() - started_at > timeout:
+                raise RuntimeError("The app failed to start")
+            time.sleep(0.1)
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+        log.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the endpoints against stand-ins of the upstream APIs"
+    )
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help=f"Comma-separated scenarios out of {', '.join(SCENARIOS)}",
+    )
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Factor of the upstream latencies, 0 to answer right away",
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--app-log", help="File to write the app's log to")
+    parser.add_argument("--output", help="File to write the results to as JSON")
+    args = parser.parse_args()
+
+    behaviours = default_behaviours(
+        args.latency_scale, args.error_rate, args.throttle_rate
+    )
+    with FakeUpstreams(behaviours, seed=args.seed) as fakes:
+        with run_app(fakes.base_urls, args.workers, args.app_log) as app_url:
+            results = asyncio.run(
+                run_benchmark(
+                    app_url,
+                    args.scenarios.split(","),
+                    args.requests,
+                    args.concurrency,
+                    args.warmup,
+                )
+            )
+        upstream_calls = {
+            name: dict(fake.calls) for name, fake in fakes.upstreams.items()
+        }
+
+    print(f"{'scenario':<10}{'req/s':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'errors':>8}")
+    for scenario, result in results.items():
+        print(
+            f"{scenario:<10}{result['throughput']:>8.1f}"
+            + "".join(f"{result[q] * 1000:>6.0f}ms" for q in ["p50", "p95", "p99"])
+            + f"{result['errors']:>8}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "arguments": vars(args),
+                    "results": results,
+                    "upstream_calls": upstream_calls,
+                },
+                file,
+                indent=2,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""Responses of the upstream APIs for their stand-ins
+
+The payloads are built from the responses recorded in ``tests/assets`` (the ORCID
+record, the Crossref author search, the Sherpa policy and the Unpaywall subset), with
+the identifiers asked for filled in. There are no recorded Semantic Scholar, Zenodo
+and OA Button responses, those payloads follow the documented formats instead, with
+up to a few hundred citations, references and papers each.
+
+The same identifier always gets the same payload.
+"""
+
+import hashlib
+import json
+import os
+import zlib
+from functools import lru_cache
+from typing import List, Optional
+
+ASSETS_PATH = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), "..", "..", "tests", "assets"
+)
+# ORCID iD of the recorded ORCID record
+RECORDED_ORCID = "0000-0002-9227-8514"
+
+
+def _seed(key: str) -> int:
+    return zlib.crc32(key.encode())
+
+
+def _paper_id(key: str) -> str:
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+@lru_cache()
+def _unpaywall_subset() -> dict:
+    with open(os.path.join(ASSETS_PATH, "unpaywall_subset.jsonl")) as file:
+        records = [json.loads(line) for line in file]
+    return {record["doi"]: record for record in records}
+
+
+@lru_cache()
+def _crossref_author_search() -> dict:
+    with open(os.path.join(ASSETS_PATH, "crossref_author_search.json")) as file:
+        return json.load(file)
+
+
+@lru_cache()
+def _orcid_record() -> str:
+    with open(os.path.join(ASSETS_PATH, "orcid_author.xml")) as file:
+        return file.read()
+
+
+@lru_cache()
+def _sherpa_policy() -> dict:
+    path = os.path.join(ASSETS_PATH, "policy_without_additional_oa_fee_key.json")
+    with open(path) as file:
+        return json.load(file)
+
+
+def _crossref_work(key: str) -> dict:
+    """A recorded Crossref work to take title, journal and authors from"""
+    works = _crossref_author_search()["message"]["items"]
+    return works[_seed(key) % len(works)]
+
+
+def _year(work: dict) -> Optional[int]:
+    date_parts = work.get("issued", {}).get("date-parts", [[None]])
+    return date_parts[0][0]
+
+
+def dois() -> List[str]:
+    """DOIs of the recorded Unpaywall subset"""
+    return list(_unpaywall_subset())
+
+
+def author_names() -> List[str]:
+    """Names of the authors of the recorded Crossref works"""
+    names = []
+    for work in _crossref_author_search()["message"]["items"]:
+        for author in work.get("author", []):
+            name = f"{author.get('given', '')} {author.get('family', '')}".strip()
+            if name and name not in names:
+                names.append(name)
+    return names
+
+
+def unpaywall_doi_object(doi: str) -> dict:
+    """https://unpaywall.org/data-format#doi-object"""
+    seed = _seed(doi)
+    record = _unpaywall_subset().get(doi) or {
+        "doi": doi,
+        "is_oa": seed % 3 == 0,
+        "journal_issn_l": f"{seed % 10000:04d}-{seed // 10000 % 1000:03d}X",
+    }
+    work = _crossref_work(doi)
+    oa_location = None
+    if record["is_oa"]:
+        oa_location = {
+            "endpoint_id": None,
+            "evidence": "oa repository (via OAI-PMH doi match)",
+            "host_type": "repository",
+            "is_best": True,
+            "license": "cc-by",
+            "pmh_id": f"oai:europepmc.org:{seed}",
+            "repository_institution": "PubMed Central - Europe PMC",
+            "updated": "2021-03-01T12:00:00.000000",
+            "url": f"https://europepmc.org/articles/pmc{seed % 10000000}",
+            "url_for_landing_page": f"https://europepmc.org/abstract/MED/{seed}",
+            "url_for_pdf": f"https://europepmc.org/articles/pmc{seed % 10000000}?pdf",
+            "version": "publishedVersion",
+        }
+    return {
+        "best_oa_location": oa_location,
+        "data_standard": 2,
+        "doi": doi,
+        "doi_url": f"https://doi.org/{doi}",
+        "first_oa_location": oa_location,
+        "genre": "journal-article",
+        "has_repository_copy": record["is_oa"],
+        "is_oa": record["is_oa"],
+        "is_paratext": False,
+        "journal_is_in_doaj": False,
+        "journal_is_oa": False,
+        "journal_issn_l": record["journal_issn_l"],
+        "journal_issns": record["journal_issn_l"],
+        "journal_name": (work.get("container-title") or [None])[0],
+        "oa_locations": [] if oa_location is None else [oa_location],
+        "oa_locations_embargoed": [],
+        "oa_status": "green" if record["is_oa"] else "closed",
+        "published_date": f"{_year(work)}-01-01" if _year(work) else None,
+        "publisher": work.get("publisher"),
+        "title": (work.get("title") or [None])[0],
+        "updated": "2021-03-01T12:00:00.000000",
+        "year": _year(work),
+        "z_authors": [
+            {
+                key: author[key]
+                for key in ["given", "family", "sequence"]
+                if key in author
+            }
+            for author in work.get("author", [])
+        ]
+        or None,
+    }
+
+
+def sherpa_publications(issn: str) -> dict:
+    """Response of ``/cgi/retrieve`` for publications with the ISSN, none for one in
+    ten ISSNs
+    """
+    seed = _seed(issn)
+    if seed % 10 == 0:
+        return {"items": []}
+    work = _crossref_work(issn)
+    publication_id = seed % 100000
+    return {
+        "items": [
+            {
+                "id": publication_id,
+                "issns": [{"issn": issn, "type": "print"}],
+                "listed_in_doaj": "no",
+                "publisher_policy": [_sherpa_policy()],
+                "publishers": [
+                    {
+                        "publisher": {
+                            "id": _sherpa_policy()["id"],
+                            "name": [{"name": work.get("publisher"), "language": "en"}],
+                        },
+                        "relationship_type": "commercial_publisher",
+                    }
+                ],
+                "system_metadata": {
+                    "id": publication_id,
+                    "uri": f"https://v2.sherpa.ac.uk/id/publication/{publication_id}",
+                    "date_created": "2010-11-22 15:48:50",
+                    "date_modified": "2020-09-10 09:52:50",
+                    "publicly_visible": "yes",
+                },
+                "title": [
+                    {
+                        "title": (work.get("container-title") or [""])[0],
+                        "language": "en",
+                    }
+                ],
+                "type": "journal",
+                "url": work.get("URL"),
+            }
+        ]
+    }
+
+
+def _s2_paper_stub(key: str) -> dict:
+    work = _crossref_work(key)
+    paper_id = _paper_id(key)
+    return {
+        "arxivId": None,
+        "authors": [
+            {"authorId": str(_seed(author.get("family", ""))), "name": author["family"]}
+            for author in work.get("author", [])
+            if "family" in author
+        ],
+        "doi": work.get("DOI"),
+        "intent": ["background"],
+        "isInfluential": False,
+        "paperId": paper_id,
+        "title": (work.get("title") or [None])[0],
+        "url": f"https://www.semanticscholar.org/paper/{paper_id}",
+        "venue": (work.get("container-title") or [""])[0],
+        "year": _year(work),
+    }
+
+
+def s2_paper(paper_id: str) -> dict:
+    """Response of ``/v1/paper/{paper_id}``, with up to 300 citations"""
+    seed = _seed(paper_id)
+    work = _crossref_work(paper_id)
+    s2_id = _paper_id(paper_id)
+    is_doi = paper_id.startswith("10.")
+    return {
+        "abstract": " ".join((work.get("title") or ["Abstract"]) * 40),
+        "arxivId": None,
+        "authors": [
+            {
+                "authorId": str(_seed(author.get("family", ""))),
+                "name": f"{author.get('given', '')} {author.get('family', '')}",
+                "url": "https://www.semanticscholar.org/author/"
+                + str(_seed(author.get("family", ""))),
+            }
+            for author in work.get("author", [])
+        ],
+        "citationVelocity": seed % 20,
+        "citations": [
+            _s2_paper_stub(f"{paper_id}/citation/{i}") for i in range(seed % 300)
+        ],
+        "corpusId": seed,
+        "doi": paper_id if is_doi else work.get("DOI"),
+        "fieldsOfStudy": ["Medicine", "Biology"],
+        "influentialCitationCount": seed % 10,
+        "is_open_access": seed % 4 == 0,
+        "is_publisher_licensed": False,
+        "paperId": s2_id,
+        "references": [
+            _s2_paper_stub(f"{paper_id}/reference/{i}") for i in range(seed % 50)
+        ],
+        "title": (work.get("title") or [None])[0],
+        "topics": [
+            {
+                "topic": "Plant physiology",
+                "topicId": str(seed % 100000),
+                "url": f"https://www.semanticscholar.org/topic/{seed % 100000}",
+            }
+        ],
+        "url": f"https://www.semanticscholar.org/paper/{s2_id}",
+        "venue": (work.get("container-title") or [""])[0],
+        "year": _year(work),
+    }
+
+
+def s2_author(author_id: str) -> dict:
+    """Response of ``/v1/author/{author_id}``, with 10 to 300 papers"""
+    seed = _seed(author_id)
+    names = author_names()
+    return {
+        "aliases": [names[seed % len(names)].upper()],
+        "authorId": author_id,
+        "influentialCitationCount": seed % 100,
+        "name": names[seed % len(names)],
+        "papers": [
+            {
+                key: value
+                for key, value in _s2_paper_stub(f"{author_id}/paper/{i}").items()
+                if key in ["paperId", "title", "url", "year"]
+            }
+            for i in range(10 + seed % 290)
+        ],
+        "url": f"https://www.semanticscholar.org/author/{author_id}",
+    }
+
+
+def s2_author_search(query: str) -> dict:
+    """Response of ``/graph/v1/author/search``"""
+    return {
+        "total": 1,
+        "offset": 0,
+        "data": [{"authorId": str(_seed(query) % 10**9), "name": query}],
+    }
+
+
+def zenodo_records(doi: str) -> dict:
+    """Response of ``/api/records`` for a DOI, with an open record for one in five"""
+    seed = _seed(doi)
+    hits = []
+    if seed % 5 == 0:
+        record_id = seed % 10000000
+        hits.append(
+            {
+                "created": "2020-05-04T12:00:00.000000+00:00",
+                "doi": doi,
+                "id": record_id,
+                "links": {
+                    "doi": f"https://doi.org/{doi}",
+                    "html": f"https://zenodo.org/record/{record_id}",
+                },
+                "metadata": {
+                    "access_right": "open",
+                    "doi": doi,
+                    "license": {"id": "CC-BY-4.0"},
+                    "resource_type": {"type": "publication", "subtype": "article"},
+                    "title": (_crossref_work(doi).get("title") or [""])[0],
+                },
+            }
+        )
+    return {
+        "aggregations": {},
+        "hits": {"hits": hits, "total": len(hits)},
+        "links": {"self": "https://zenodo.org/api/records/?page=1&size=10"},
+    }
+
+
+def crossref_works(author: str) -> dict:
+    """Response of ``/works`` for the ``query.author``"""
+    response = dict(_crossref_author_search())
+    response["message"] = {
+        **response["message"],
+        "query": {"start-index": 0, "search-terms": author},
+    }
+    return response
+
+
+def orcid_record(orcid: str) -> str:
+    """Response of ``/{orcid}``, the recorded record with the ORCID iD replaced"""
+    return _orcid_record().replace(RECORDED_ORCID, orcid)
+
+
+def _oab_permission(doi: str) -> dict:
+    seed = _seed(doi)
+    return {
+        "can_archive": seed % 3 != 0,
+        "deposit_statement": f"© {_year(_crossref_work(doi))} The Authors",
+        "embargo_months": 12 if seed % 2 else 0,
+        "issuer": {
+            "has_policy": "yes",
+            "id": _crossref_work(doi).get("ISSN", []),
+            "type": "journal",
+        },
+        "licence": "cc-by",
+        "locations": ["institutional repository"],
+        "meta": {
+            "creator": ["joe+doaj@oa.works"],
+            "contributors": ["joe+doaj@oa.works"],
+            "monitoring": "Automatic",
+            "updated": "01/06/2021",
+        },
+        "provenance": {"oa_evidence": "In DOAJ"},
+        "requirements": None,
+        "score": seed % 1000,
+        "version": "acceptedVersion",
+        "versions": ["submittedVersion", "acceptedVersion"],
+    }
+
+
+def oab_permissions(doi: str) -> dict:
+    """Response of ``/permissions`` for a DOI"""
+    permission = _oab_permission(doi)
+    return {
+        "all_permissions": [permission, {**permission, "version": "submittedVersion"}],
+        "best_permission": permission,
+        "file": None,
+    }
+
+
+def oab_find(doi: str) -> dict:
+    """Response of ``POST /find`` for a DOI"""
+    work = _crossref_work(doi)
+    return {
+        "metadata": {
+            "author": [
+                {key: author[key] for key in ["given", "family"] if key in author}
+                for author in work.get("author", [])
+            ],
+            "doi": doi,
+            "issn": work.get("ISSN", []),
+            "journal": (work.get("container-title") or [None])[0],
+            "publisher": work.get("publisher"),
+            "title": (work.get("title") or [None])[0],
+            "year": _year(work),
+        },
+        "permissions": oab_permissions(doi),
+        "url": f"https://doi.org/{doi}",
+    }
@@ -0,0 +1,278 @@
+"""Local stand-ins for the upstream APIs
+
+``FakeUpstreams`` serves a stand-in per upstream API on its own port of localhost,
+answering with the payloads of ``fyscience.testing.payloads`` after a random latency,
+or with errors and 429s at the configured rates. The app is pointed at them by
+``route_upstream_calls`` in-process, or by the ``UPSTREAM_BASE_URLS`` environment
+variable (see ``fyscience.upstream``), e.g. ``json.dumps(fakes.base_urls)``.
+"""
+
+import asyncio
+import json
+import math
+import random
+import socket
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+from fyscience import upstream
+from fyscience.testing import payloads
+
+Latency = Callable[[random.Random], float]
+
+
+def constant(seconds: float) -> Latency:
+    return lambda _: seconds
+
+
+def lognormal(median: float, p99: float) -> Latency:
+    """Log-normally distributed latency with the given median and 99th percentile"""
+    # The 99th percentile of the standard normal distribution
+    sigma = math.log(p99 / median) / 2.326
+    return lambda rng: rng.lognormvariate(math.log(median), sigma)
+
+
+class Behaviour:
+    """How a stand-in answers: ``latency`` draws the seconds to wait before each
+    answer, ``error_rate`` and ``throttle_rate`` are the shares of calls answered with
+    503 and with 429 (asking to retry after ``retry_after`` seconds) instead.
+    """
+
+    def __init__(
+        self,
+        latency: Latency = constant(0.0),
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 1.0,
+    ):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+
+# Median and 99th percentile of the upstream latencies in seconds, rough guesses to
+# be adjusted from fyscience_upstream_request_duration_seconds in production
+LATENCIES = {
+    "unpaywall": (0.15, 1.0),
+    "sherpa": (0.4, 2.0),
+    "semantic_scholar": (0.3, 1.5),
+    "zenodo": (0.3, 2.0),
+    "crossref": (0.8, 3.0),
+    "orcid": (0.4, 2.0),
+    "openaccessbutton": (0.5, 2.5),
+}
+
+HOSTS = {
+    "unpaywall": ["api.unpaywall.org"],
+    "sherpa": ["v2.sherpa.ac.uk"],
+    "semantic_scholar": ["api.semanticscholar.org", "partner.semanticscholar.org"],
+    "zenodo": ["zenodo.org"],
+    "crossref": ["api.crossref.org"],
+    "orcid": ["pub.orcid.org"],
+    "openaccessbutton": ["api.openaccessbutton.org"],
+}
+
+
+def default_behaviours(
+    latency_scale: float = 1.0, error_rate: float = 0.0, throttle_rate: float = 0.0
+) -> Dict[str, Behaviour]:
+    """Behaviours of all stand-ins with ``LATENCIES`` scaled by ``latency_scale``"""
+    return {
+        name: Behaviour(
+            latency=(
+                lognormal(median * latency_scale, p99 * latency_scale)
+                if latency_scale > 0
+                else constant(0.0)
+            ),
+            error_rate=error_rate,
+            throttle_rate=throttle_rate,
+        )
+        for name, (median, p99) in LATENCIES.items()
+    }
+
+
+async def _unpaywall_paper(request: Request) -> Response:
+    return JSONResponse(payloads.unpaywall_doi_object(request.path_params["doi"]))
+
+
+async def _sherpa_retrieve(request: Request) -> Response:
+    # filter=[["issn","equals","1234-5678"]]
+    issn = json.loads(request.query_params["filter"])[0][2]
+    return JSONResponse(payloads.sherpa_publications(issn))
+
+
+async def _s2_paper(request: Request) -> Response:
+    return JSONResponse(payloads.s2_paper(request.path_params["paper_id"]))
+
+
+async def _s2_author(request: Request) -> Response:
+    return JSONResponse(payloads.s2_author(request.path_params["author_id"]))
+
+
+async def _s2_author_search(request: Request) -> Response:
+    return JSONResponse(payloads.s2_author_search(request.query_params["query"]))
+
+
+async def _zenodo_records(request: Request) -> Response:
+    # q=doi:"10.1011/111111"
+    doi = request.query_params["q"].split(":", 1)[1].strip('"')
+    return JSONResponse(payloads.zenodo_records(doi))
+
+
+async def _crossref_works(request: Request) -> Response:
+    return JSONResponse(payloads.crossref_works(request.query_params["query.author"]))
+
+
+async def _orcid_record(request: Request) -> Response:
+    return Response(
+        payloads.orcid_record(request.path_params["orcid"]),
+        media_type="application/vnd.orcid+xml",
+    )
+
+
+async def _oab_permissions(request: Request) -> Response:
+    return JSONResponse(payloads.oab_permissions(request.query_params["doi"]))
+
+
+async def _oab_find(request: Request) -> Response:
+    return JSONResponse(payloads.oab_find((await request.json())["doi"]))
+
+
+ROUTES: Dict[str, List[Route]] = {
+    "unpaywall": [Route("/v2/{doi:path}", _unpaywall_paper)],
+    "sherpa": [Route("/cgi/retrieve", _sherpa_retrieve)],
+    "semantic_scholar": [
+        Route("/v1/paper/{paper_id:path}", _s2_paper),
+        Route("/v1/author/{author_id}", _s2_author),
+        Route("/graph/v1/author/search", _s2_author_search),
+    ],
+    "zenodo": [Route("/api/records", _zenodo_records)],
+    "crossref": [Route("/works", _crossref_works)],
+    "orcid": [Route("/{orcid}", _orcid_record)],
+    "openaccessbutton": [
+        Route("/permissions", _oab_permissions),
+        Route("/find", _oab_find, methods=["POST"]),
+    ],
+}
+
+
+class FakeUpstream:
+    """ASGI app standing in for the upstream API ``name``, counting the calls it
+    answered per response status
+    """
+
+    def __init__(self, name: str, behaviour: Optional[Behaviour] = None, seed=0):
+        self.name = name
+        self.behaviour = Behaviour() if behaviour is None else behaviour
+        self.calls: Counter = Counter()
+        self._random = random.Random(f"{name}-{seed}")
+        self._app = Starlette(routes=ROUTES[name])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self._app(scope, receive, send)
+
+        await asyncio.sleep(self.behaviour.latency(self._random))
+        roll = self._random.random()
+        if roll < self.behaviour.throttle_rate:
+            app = Response(
+                status_code=429,
+                headers={"retry-after": str(self.behaviour.retry_after)},
+            )
+        elif roll < self.behaviour.throttle_rate + self.behaviour.error_rate:
+            app = Response(status_code=503)
+        else:
+            app = self._app
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                self.calls[message["status"]] += 1
+            await send(message)
+
+        await app(scope, receive, counting_send)
+
+
+class FakeUpstreams:
+    """Stand-ins for all upstream APIs, served by a background thread while started.
+    Stand-ins without a behaviour answer right away.
+
+    ``base_urls`` maps every upstream host to the base URL of its stand-in.
+    """
+
+    def __init__(self, behaviours: Optional[Dict[str, Behaviour]] = None, seed=0):
+        behaviours = {} if behaviours is None else behaviours
+        self.upstreams = {
+            name: FakeUpstream(name, behaviours.get(name), seed) for name in ROUTES
+        }
+        self.base_urls: Dict[str, str] = {}
+        self._servers: List[uvicorn.Server] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, timeout: float = 10.0):
+        sockets = []
+        for name, fake in self.upstreams.items():
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("127.0.0.1", 0))
+            sockets.append(sock)
+            for host in HOSTS[name]:
+                self.base_urls[host] = f"http://127.0.0.1:{sock.getsockname()[1]}"
+            self._servers.append(
+                uvicorn.Server(
+                    uvicorn.Config(
+                        fake, lifespan="off", log_level="warning", access_log=False
+                    )
+                )
+            )
+
+        async def serve():
+            await asyncio.gather(
+                *(
+                    server.serve(sockets=[sock])
+                    for server, sock in zip(self._servers, sockets)
+                )
+            )
+
+        self._thread = threading.Thread(
+            target=asyncio.run, args=(serve(),), name="fake-upstreams", daemon=True
+        )
+        self._thread.start()
+        started_at = time.monotonic()
+        while not all(server.started for server in self._servers):
+            if time.monotonic() - started_at > timeout:
+                raise RuntimeError("Stand-ins of the upstream APIs failed to start")
+            time.sleep(0.01)
+
+    def stop(self):
+        for server in self._servers:
+            server.should_exit = True
+        self._thread.join()
+        self._servers = []
+
+    def __enter__(self) -> "FakeUpstreams":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @contextmanager
+    def route_upstream_calls(self) -> Iterator[None]:
+        """Send the upstream calls of this process to the stand-ins within the block"""
+        for host, base_url in self.base_urls.items():
+            upstream.set_base_url(host, base_url)
+        try:
+            yield
+        finally:
+            for host in self.base_urls:
+                upstream.set_base_url(host, None)
@@ -0,0 +1,251 @@
+"""Lightweight tracing spans, correlated by the incoming ``x-cloud-trace-context``
+
+Spans cover request handling, provider functions, cache lookups and the parsing of
+upstream responses into models. They are nested through a context variable, so spans
+of tasks started within a span are its children, and belong to the trace of the
+Cloud Run request, which lets us follow a slow author page across all its paper
+requests.
+
+Finished spans are exported in the OTLP/JSON format, as JSON lines to the file at
+``TRACE_EXPORT_PATH`` or posted in batches to the OTLP/HTTP collector at
+``TRACE_EXPORT_URL`` (e.g. ``http://localhost:4318/v1/traces``). Without either,
+spans aren't recorded at all.
+"""
+
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from fastapi import Request
+from loguru import logger
+
+SERVICE_NAME = "fyscience"
+EXPORT_BATCH_SIZE = 512
+EXPORT_INTERVAL = 5.0
+
+
+class Span:
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes: Dict[str, Any] = {}
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def as_otlp(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+        }
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Exporter:
+    """Exports finished spans in batches from a background thread, so that neither
+    file nor network I/O holds up requests. Spans are dropped if the queue is full.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        url: Optional[str] = None,
+        max_queue_size: int = 10000,
+    ):
+        self.path = path
+        self.url = url
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        # Threads don't survive forking, e.g. into gunicorn workers
+        if self._thread is None or self._thread_pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._thread_pid != os.getpid():
+                    self._thread = threading.Thread(
+                        target=self._run, name="fyscience-tracing", daemon=True
+                    )
+                    self._thread.start()
+                    self._thread_pid = os.getpid()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + EXPORT_INTERVAL
+            while len(batch) < EXPORT_BATCH_SIZE:
+                try:
+                    batch.append(
+                        self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                    )
+                except queue.Empty:
+                    break
+            self.flush(batch)
+
+    def flush(self, batch: List[Span]):
+        try:
+            if self.path is not None:
+                with open(self.path, "a") as file:
+                    file.write(
+                        "".join(json.dumps(span.as_otlp()) + "\n" for span in batch)
+                    )
+            if self.url is not None:
+                httpx.post(self.url, json=otlp_payload(batch), timeout=5.0)
+        except Exception as e:
+            logger.warning(
+                {"event": "tracing", "message": "export_failed", "error": repr(e)}
+            )
+
+
+def otlp_payload(spans: List[Span]) -> dict:
+    """Request body of the OTLP/HTTP JSON protocol for the spans"""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": SERVICE_NAME}}
+                    ]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "fyscience.tracing"},
+                        "spans": [span.as_otlp() for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+@lru_cache()
+def get_exporter() -> Optional[Exporter]:
+    path = os.getenv("TRACE_EXPORT_PATH") or None
+    url = os.getenv("TRACE_EXPORT_URL") or None
+    if path is None and url is None:
+        return None
+    return Exporter(path=path, url=url)
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+class _DisabledSpan:
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+def parse_trace_context(header: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Trace ID and parent span ID (as hex, like OTLP) of an ``x-cloud-trace-context``
+    header of the form ``TRACE_ID/SPAN_ID;o=OPTIONS``
+    """
+    if not header:
+        return None, None
+    trace_id, _, rest = header.partition("/")
+    span_id = rest.split(";")[0]
+    if len(trace_id) != 32:
+        return None, None
+    try:
+        int(trace_id, 16)
+        parent_id = f"{int(span_id):016x}" if span_id else None
+    except ValueError:
+        return None, None
+    return trace_id.lower(), parent_id
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Time the block as a child span of the current span, or as the root span of a
+    new trace. If tracing is disabled, the yielded span does nothing.
+    """
+    exporter = get_exporter()
+    if exporter is None:
+        yield _DISABLED_SPAN
+        return
+
+    parent = _current_span.get()
+    if parent is None:
+        new_span = Span(name, secrets.token_hex(16))
+    else:
+        new_span = Span(name, parent.trace_id, parent.span_id)
+    new_span.attributes.update(attributes)
+    with _activate(new_span, exporter):
+        yield new_span
+
+
+@contextmanager
+def _activate(active_span: Span, exporter: Exporter):
+    token = _current_span.set(active_span)
+    try:
+        yield
+    except BaseException as e:
+        active_span.set_attribute("error", repr(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        active_span.end_time = time.time_ns()
+        exporter.export(active_span)
+
+
+async def trace_requests(request: Request, call_next):
+    """HTTP middleware starting a span per request, as child of the span given by the
+    ``x-cloud-trace-context`` header
+    """
+    exporter = get_exporter()
+    if exporter is None:
+        return await call_next(request)
+
+    trace_id, parent_id = parse_trace_context(
+        request.headers.get("x-cloud-trace-context")
+    )
+    request_span = Span(
+        f"{request.method} {request.url.path}",
+        trace_id or secrets.token_hex(16),
+        parent_id,
+    )
+    request_span.set_attribute("http.target", request.url.path)
+    with _activate(request_span, exporter):
+        response = await call_next(request)
+        request_span.set_attribute("http.status_code", response.status_code)
+        # Spans of the same route share a name, whatever the DOI
+        route = request.scope.get("route")
+        if route is not None:
+            request_span.name = f"{request.method} {route.path}"
+        return response
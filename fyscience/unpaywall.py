@@ -1,11 +1,15 @@
 import os
 from typing import Optional, List
 
-import requests
 from pydantic import BaseModel
 from loguru import logger
 
+from fyscience import ledger, metrics, tracing, upstream
+from fyscience.upstream import UpstreamError
+from fyscience.cache import cached
+from fyscience.singleflight import single_flight
 from fyscience.schemas import FullPaper
+from fyscience.unpaywall_snapshot import get_snapshot_index
 from fyscience.utils import assemble_author_name
 
 
@@ -35,7 +39,7 @@ class Paper(BaseModel):
     z_authors: Optional[List[dict]] = None
 
 
-def _get_paper(doi: str, email: Optional[str] = None) -> Optional[Paper]:
+async def _get_paper(doi: str, email: Optional[str] = None) -> Optional[Paper]:
     """Fetch paper information, most notable information about the availability of an
     open access version as well as the ISSN for a given DOI from the unpaywall API
     (api.unpaywall.org)
@@ -45,6 +49,8 @@ def _get_paper(doi: str, email: Optional[str] = None) -> Optional[Paper]:
     RuntimeError
         In case no email address is passed to the function as an argument and none is
         found in the ``UNPAYWALL_EMAIL`` environment variable.
+    UpstreamError
+        In case the API fails to answer, as opposed to not knowing the DOI.
     """
     email = os.getenv("UNPAYWALL_EMAIL") if email is None else email
     if email is None or not email:
@@ -53,7 +59,7 @@ def _get_paper(doi: str, email: Optional[str] = None) -> Optional[Paper]:
             + " environment variable."
         )
 
-    response = requests.get(f"https://api.unpaywall.org/v2/{doi}?email={email}")
+    response = await upstream.get(f"https://api.unpaywall.org/v2/{doi}?email={email}")
     if response.status_code != 200:
         logger.error(
             {
@@ -64,10 +70,13 @@ def _get_paper(doi: str, email: Optional[str] = None) -> Optional[Paper]:
                 "response": response.content.decode() if response.content else "",
             }
         )
-        return None
+        if response.status_code == 404:
+            return None
+        raise UpstreamError(f"Unpaywall responded with {response.status_code}")
 
-    data = response.json()
-    paper = Paper(**data)
+    with tracing.span("parse_response", model="unpaywall.Paper"):
+        data = response.json()
+        paper = Paper(**data)
     return paper
 
 
@@ -84,29 +93,65 @@ def _extract_authors(authors: List[dict]) -> str:
     return f"{assemble_author_name(first_author)} et al."
 
 
-def get_paper(doi: str, email: Optional[str] = None) -> Optional[FullPaper]:
-    paper = _get_paper(doi, email)
-    if paper is None:
-        return None
-
+def to_full_paper(doi: str, doi_object: dict) -> FullPaper:
+    """Extract the paper from an Unpaywall DOI object, e.g. an API response or a
+    snapshot record
+    """
     oa_location_url = None
-    if paper.best_oa_location is not None:
-        oa_location_url = paper.best_oa_location.get(
+    best_oa_location = doi_object.get("best_oa_location", None)
+    if best_oa_location is not None:
+        oa_location_url = best_oa_location.get(
             "url",
-            paper.best_oa_location.get(
+            best_oa_location.get(
                 "url_for_pdf",
                 None,
             ),
         )
 
+    authors = doi_object.get("z_authors", None)
     return FullPaper(
         doi=doi,
-        issn=paper.journal_issn_l,
-        is_open_access=paper.is_oa,
-        title=paper.title,
-        year=paper.year,
-        journal=paper.journal_name,
-        authors=_extract_authors(paper.z_authors) if paper.z_authors else None,
+        issn=doi_object.get("journal_issn_l", None),
+        is_open_access=doi_object["is_oa"],
+        title=doi_object.get("title", None),
+        year=doi_object.get("year", None),
+        journal=doi_object.get("journal_name", None),
+        authors=_extract_authors(authors) if authors else None,
         oa_location_url=oa_location_url,
-        published_date=paper.published_date,
+        published_date=doi_object.get("published_date", None),
     )
+
+
+@cached(
+    "unpaywall",
+    dump=lambda paper: paper.dict(),
+    load=lambda paper: FullPaper(**paper),
+)
+async def _get_paper_from_api(
+    doi: str, email: Optional[str] = None
+) -> Optional[FullPaper]:
+    paper = await _get_paper(doi, email)
+    if paper is None:
+        return None
+    return to_full_paper(doi, paper.dict())
+
+
+@metrics.provider_function
+@upstream.fallback(None)
+@single_flight("unpaywall")
+async def get_paper_async(doi: str, email: Optional[str] = None) -> Optional[FullPaper]:
+    """Get the paper from the local snapshot index, if there is one, and from the
+    Unpaywall API only for DOIs not in the snapshot.
+    """
+    snapshot_index = get_snapshot_index()
+    if snapshot_index is not None:
+        paper = snapshot_index.get(doi)
+        if paper is not None:
+            ledger.note_cache("snapshot")
+            return paper
+
+    return await _get_paper_from_api(doi, email)
+
+
+def get_paper(doi: str, email: Optional[str] = None) -> Optional[FullPaper]:
+    return upstream.run_sync(get_paper_async(doi, email))
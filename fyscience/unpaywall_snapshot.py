@@ -0,0 +1,133 @@
+"""DOI-keyed index of the Unpaywall snapshot (https://unpaywall.org/products/snapshot)
+
+The index is a read-only SQLite database holding only the fields needed for a
+``FullPaper``. It is memory-mapped, so lookups are served from the page cache that all
+worker processes share, instead of going to the Unpaywall API. Build it with
+``scripts/build-unpaywall-index.py``.
+"""
+
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from typing import Iterable, Iterator, Optional
+
+from fyscience.schemas import FullPaper
+from fyscience.utils import ProcessLocalConnection
+
+# Upper bound, SQLite only maps as much as the database file is large
+MMAP_SIZE = 64 * 1024**3
+
+FIELDS = (
+    "doi",
+    "issn",
+    "is_open_access",
+    "title",
+    "year",
+    "journal",
+    "authors",
+    "oa_location_url",
+    "published_date",
+)
+
+
+def load_unpaywall_snapshot(jsonl_gzip_path: str) -> Iterator[dict]:
+    """Yields records from unpaywall snapshot jsonl.gzip"""
+    with gzip.open(jsonl_gzip_path) as file:
+        for line in file:
+            yield json.loads(line)
+
+
+def build_index(papers: Iterable[FullPaper], path: str, batch_size: int = 10000):
+    """Write the papers to a new index at ``path``, replacing an existing one."""
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    connection = sqlite3.connect(tmp_path, isolation_level=None)
+    # Nothing to recover if the build crashes, it is simply started again
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute(
+        "CREATE TABLE papers ("
+        " doi TEXT PRIMARY KEY,"
+        " issn TEXT,"
+        " is_open_access INTEGER,"
+        " title TEXT,"
+        " year INTEGER,"
+        " journal TEXT,"
+        " authors TEXT,"
+        " oa_location_url TEXT,"
+        " published_date TEXT"
+        ") WITHOUT ROWID"
+    )
+
+    insert = (
+        f"INSERT OR REPLACE INTO papers ({', '.join(FIELDS)})"
+        f" VALUES ({', '.join('?' for _ in FIELDS)})"
+    )
+    batch = []
+    for paper in papers:
+        row = paper.dict(include=set(FIELDS))
+        row["doi"] = row["doi"].lower()
+        batch.append(tuple(row[field] for field in FIELDS))
+        if len(batch) == batch_size:
+            connection.execute("BEGIN")
+            connection.executemany(insert, batch)
+            connection.execute("COMMIT")
+            batch = []
+    if batch:
+        connection.execute("BEGIN")
+        connection.executemany(insert, batch)
+        connection.execute("COMMIT")
+
+    connection.execute("VACUUM")
+    connection.close()
+    os.replace(tmp_path, path)
+
+
+class SnapshotIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = ProcessLocalConnection(self._open)
+
+    def _open(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+        connection.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        return connection
+
+    def get(self, doi: str) -> Optional[FullPaper]:
+        """Get the paper for a DOI or None if the DOI isn't part of the snapshot, e.g.
+        because it was registered after the snapshot was taken.
+        """
+        with self._lock:
+            row = (
+                self._connection.get()
+                .execute(
+                    f"SELECT {', '.join(FIELDS)} FROM papers WHERE doi = ?",
+                    (doi.lower(),),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return None
+
+        paper = FullPaper(**dict(zip(FIELDS, row)))
+        paper.doi = doi
+        return paper
+
+
+@lru_cache()
+def get_snapshot_index() -> Optional[SnapshotIndex]:
+    """The snapshot index, if the ``UNPAYWALL_SNAPSHOT_INDEX`` environment variable
+    points to one.
+    """
+    path = os.getenv("UNPAYWALL_SNAPSHOT_INDEX")
+    if not path:
+        return None
+    return SnapshotIndex(path)
@@ -0,0 +1,407 @@
+"""Shared async HTTP client used by all provider modules to talk to upstream APIs.
+
+Every upstream host gets its own connection pool with keep-alive (and HTTP/2 if the
+optional ``h2`` package is installed), so consecutive calls to the same API reuse an
+already established TCP+TLS connection instead of paying the handshake each time.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Awaitable, Dict, Optional, TypeVar
+from urllib.parse import urlsplit, urlunsplit
+
+import anyio.to_thread
+import httpx
+from loguru import logger
+
+from fyscience import ledger, metrics
+from fyscience.circuit_breaker import CircuitBreaker, get_circuit_breaker
+from fyscience.limiter import AdaptiveLimiter
+from fyscience.rate_limiter import get_priority, get_rate_limiter
+from fyscience.retry import get_retry_policy
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10.0
+
+TIMEOUT = httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+LIMITS = httpx.Limits(
+    max_connections=20, max_keepalive_connections=10, keepalive_expiry=30.0
+)
+
+T = TypeVar("T")
+
+
+class UpstreamError(Exception):
+    """An upstream API failed to answer, as opposed to answering "not found"."""
+
+
+class CircuitOpenError(UpstreamError):
+    """Calls to an upstream API are rejected, since it recently kept failing."""
+
+
+class DeadlineExceeded(UpstreamError):
+    """The time budget of the request ran out before the upstream API answered."""
+
+
+# Clients are bound to the event loop they were created on, hence one pool per host
+# and event loop.
+_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# Concurrent requests per upstream host are bounded adaptively, see fyscience.limiter.
+# Optionally, the bound is capped further, e.g. for batch runs that would otherwise hit
+# an API's rate limit.
+MAX_CONCURRENCY = LIMITS.max_connections
+_concurrency_limits: Dict[str, int] = {}
+_limiters: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+# Base URLs to send the calls to an upstream host to instead, e.g. the stand-ins of
+# fyscience.testing. Set by the UPSTREAM_BASE_URLS environment variable, e.g.
+# {"api.unpaywall.org": "http://127.0.0.1:8101"}, or set_base_url.
+_base_urls: Dict[str, str] = json.loads(os.getenv("UPSTREAM_BASE_URLS") or "{}")
+
+# Responses telling that the upstream is overloaded, besides timeouts
+OVERLOAD_STATUS_CODES = frozenset({429, 503})
+
+# Point in time (of time.monotonic) by which all upstream calls of the current request
+# have to be done. Tasks inherit it from the context they are started in.
+_deadline: ContextVar[Optional[float]] = ContextVar("upstream_deadline", default=None)
+
+# Whether provider functions pass on UpstreamError instead of returning their fallback
+# result, for callers that tell failing upstreams apart from "not found" answers
+_raise_errors: ContextVar[bool] = ContextVar("upstream_raise_errors", default=False)
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def get_client(host: str) -> httpx.AsyncClient:
+    """Get the pooled client for the given upstream host on the running event loop."""
+    clients = _clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(host)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(http2=HTTP2, timeout=TIMEOUT, limits=LIMITS)
+        clients[host] = client
+    return client
+
+
+def limit_concurrency(host: str, limit: Optional[int]):
+    """Allow at most ``limit`` concurrent requests to the host, however high the
+    adaptive bound grows. None lifts the cap.
+    """
+    if limit is None:
+        _concurrency_limits.pop(host, None)
+    else:
+        _concurrency_limits[host] = limit
+    for limiters in _limiters.values():
+        limiters.pop(host, None)
+
+
+def set_base_url(host: str, base_url: Optional[str]):
+    """Send calls to the host to ``base_url`` (scheme, host and port) instead. Pools,
+    limits, circuit breakers and metrics stay those of the host. None reverts this.
+    """
+    if base_url is None:
+        _base_urls.pop(host, None)
+    else:
+        _base_urls[host] = base_url
+
+
+def _rebase(host: str, url: str) -> str:
+    base_url = _base_urls.get(host)
+    if base_url is None:
+        return url
+    base = urlsplit(base_url)
+    parts = urlsplit(url)
+    return urlunsplit(
+        (base.scheme, base.netloc, base.path.rstrip("/") + parts.path, parts.query, "")
+    )
+
+
+def _get_limiter(host: str) -> AdaptiveLimiter:
+    limiters = _limiters.setdefault(asyncio.get_running_loop(), {})
+    if host not in limiters:
+        limiters[host] = AdaptiveLimiter(
+            host, max_limit=_concurrency_limits.get(host, MAX_CONCURRENCY)
+        )
+    return limiters[host]
+
+
+def stats() -> Dict[str, dict]:
+    """Current concurrency limit, calls in flight and queued calls per upstream host
+    on the running event loop, along with the state of its circuit breaker
+    """
+    return {
+        host: {**limiter.stats(), "circuit": get_circuit_breaker(host).state}
+        for host, limiter in _limiters.get(asyncio.get_running_loop(), {}).items()
+    }
+
+
+def _is_hanging(breaker: CircuitBreaker, duration: float) -> bool:
+    return duration >= breaker.slow_call_duration
+
+
+async def _request(host: str, method: str, url: str, **kwargs) -> httpx.Response:
+    breaker = get_circuit_breaker(host)
+    if not breaker.allow_request():
+        raise CircuitOpenError(f"Circuit for {host} is open")
+
+    started_at = time.monotonic()
+    try:
+        response = await get_client(host).request(method, _rebase(host, url), **kwargs)
+    except httpx.TransportError as e:
+        duration = time.monotonic() - started_at
+        breaker.record(False, duration)
+        metrics.observe_upstream_call(host, type(e).__name__, duration)
+        ledger.note_upstream_call(type(e).__name__)
+        raise
+    except BaseException:
+        duration = time.monotonic() - started_at
+        if _is_hanging(breaker, duration):
+            # Cancelled, e.g. by the deadline of the request, only after it took too
+            # long, which hints at a hanging upstream
+            breaker.record(False, duration)
+        else:
+            # E.g. cancelled right away, which says nothing about the upstream
+            breaker.release()
+        raise
+
+    duration = time.monotonic() - started_at
+    breaker.record(response.status_code < 500, duration)
+    metrics.observe_upstream_call(host, str(response.status_code), duration)
+    ledger.note_upstream_call(str(response.status_code))
+    return response
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Give all upstream calls within the block, including those of tasks started in
+    it, at most ``seconds`` to finish. An enclosing deadline that ends earlier still
+    applies, None lifts all deadlines, e.g. for background work.
+    """
+    if seconds is None:
+        new_deadline = None
+    else:
+        new_deadline = time.monotonic() + seconds
+        if _deadline.get() is not None:
+            new_deadline = min(new_deadline, _deadline.get())
+
+    token = _deadline.set(new_deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+@contextmanager
+def raise_errors():
+    """Let the provider functions called within the block, including those of tasks
+    started in it, raise ``UpstreamError`` instead of returning their fallback result
+    (see :func:`fallback`).
+    """
+    token = _raise_errors.set(True)
+    try:
+        yield
+    finally:
+        _raise_errors.reset(token)
+
+
+def fallback(result):
+    """Decorate an async provider function to return ``result`` if the upstream
+    failed to answer, i.e. the function raised ``UpstreamError``, unless it is called
+    within :func:`raise_errors`.
+
+    Apply it above ``single_flight``, so that every caller of a shared call decides
+    for itself.
+    """
+
+    def decorator(function):
+        @wraps(function)
+        async def function_with_fallback(*args, **kwargs):
+            try:
+                return await function(*args, **kwargs)
+            except UpstreamError:
+                if _raise_errors.get():
+                    raise
+                return result
+
+        return function_with_fallback
+
+    return decorator
+
+
+def remaining() -> Optional[float]:
+    """Seconds left until the current deadline, None without deadline"""
+    current_deadline = _deadline.get()
+    if current_deadline is None:
+        return None
+    return max(current_deadline - time.monotonic(), 0.0)
+
+
+async def _wait_for_rate_limit(host: str):
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is None:
+        return
+    priority = get_priority()
+    while True:
+        # Waits for the database lock while other processes take tokens
+        wait = await anyio.to_thread.run_sync(rate_limiter.try_acquire, host, priority)
+        if wait == 0.0:
+            return
+        budget = remaining()
+        if budget is not None and wait > budget:
+            raise DeadlineExceeded(f"Rate limit of {host} leaves no time for the call")
+        await asyncio.sleep(wait)
+
+
+async def _limited_request(host: str, method: str, url: str, **kwargs):
+    await _wait_for_rate_limit(host)
+    limiter = _get_limiter(host)
+    await limiter.acquire()
+    started_at = time.monotonic()
+    try:
+        response = await _request(host, method, url, **kwargs)
+    except httpx.TransportError:
+        limiter.release(True, time.monotonic() - started_at)
+        raise
+    except BaseException:
+        duration = time.monotonic() - started_at
+        if _is_hanging(get_circuit_breaker(host), duration):
+            limiter.release(True, duration)
+        else:
+            # E.g. cancelled or rejected by the circuit breaker
+            limiter.release()
+        raise
+
+    limiter.release(
+        response.status_code in OVERLOAD_STATUS_CODES, time.monotonic() - started_at
+    )
+    return response
+
+
+async def _request_with_retries(
+    host: str, method: str, url: str, idempotent: Optional[bool], **kwargs
+) -> httpx.Response:
+    policy = get_retry_policy(host)
+    policy.budget.deposit()
+    attempt = 1
+    while True:
+        try:
+            response, error = await _limited_request(host, method, url, **kwargs), None
+        except httpx.TransportError as e:
+            response, error = None, e
+
+        if attempt < policy.max_attempts and policy.is_retryable(
+            method, response, error, idempotent
+        ):
+            delay = policy.delay(attempt, response)
+            budget = remaining()
+            if (
+                delay is not None
+                and (budget is None or delay < budget)
+                and policy.budget.withdraw()
+            ):
+                logger.info(
+                    {
+                        "event": "upstream_request",
+                        "message": "retry",
+                        "upstream": host,
+                        "attempt": attempt,
+                        "status_code": None if error else response.status_code,
+                        "error": repr(error) if error else None,
+                        "delay": delay,
+                    }
+                )
+                await asyncio.sleep(delay)
+                ledger.note_retry()
+                attempt += 1
+                continue
+
+        if error is not None:
+            raise UpstreamError(f"{host} failed to answer: {error!r}") from error
+        return response
+
+
+async def request(
+    method: str, url: str, idempotent: Optional[bool] = None, **kwargs
+) -> httpx.Response:
+    """Send a request through the pool of the URL's host.
+
+    Throttled requests and requests that failed transiently are retried according to
+    the host's retry policy (see :mod:`fyscience.retry`), if that is safe. Pass
+    ``idempotent`` to override whether it is, which by default depends on the method.
+
+    Raises
+    ------
+    UpstreamError
+        If the host failed to answer, e.g. refused the connection or timed out, on
+        the last attempt.
+    CircuitOpenError
+        Right away, if the circuit breaker of the host is open.
+    DeadlineExceeded
+        If the current deadline (see :func:`deadline`) passes before the response
+        arrives.
+    """
+    host = urlsplit(url).hostname
+    budget = remaining()
+    if budget is None:
+        return await _request_with_retries(host, method, url, idempotent, **kwargs)
+
+    if budget == 0.0:
+        raise DeadlineExceeded(f"No time left for {url}")
+    try:
+        return await asyncio.wait_for(
+            _request_with_retries(host, method, url, idempotent, **kwargs), budget
+        )
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"No response from {host} within {budget:.2f}s")
+
+
+async def get(url: str, **kwargs) -> httpx.Response:
+    return await request("GET", url, **kwargs)
+
+
+async def post(url: str, **kwargs) -> httpx.Response:
+    return await request("POST", url, **kwargs)
+
+
+async def aclose():
+    """Close all connection pools of the running event loop, e.g. on app shutdown."""
+    clients = _clients.pop(asyncio.get_running_loop(), {})
+    await asyncio.gather(*(client.aclose() for client in clients.values()))
+
+
+def _get_background_loop() -> asyncio.AbstractEventLoop:
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_background_loop.run_forever,
+                name="fyscience-upstream",
+                daemon=True,
+            ).start()
+    return _background_loop
+
+
+def run_sync(coroutine: Awaitable[T]) -> T:
+    """Run a coroutine on a long-lived background event loop and wait for its result.
+
+    This is what the synchronous provider functions (used by the scripts) are built
+    on, so they share connection pools across calls just like the async variants.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, _get_background_loop()).result()
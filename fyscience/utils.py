@@ -1,3 +1,25 @@
+import os
+import sqlite3
+from typing import Callable, Optional
+
+
+class ProcessLocalConnection:
+    """SQLite connection opened by ``connect`` on first use, and again in each forked
+    child process (e.g. gunicorn worker), which must not share the parent's connection.
+    """
+
+    def __init__(self, connect: Callable[[], sqlite3.Connection]):
+        self._connect = connect
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def get(self) -> sqlite3.Connection:
+        if self._connection is None or self._pid != os.getpid():
+            self._connection = self._connect()
+            self._pid = os.getpid()
+        return self._connection
+
+
 def assemble_author_name(author: dict) -> str:
     # Even though the Unpaywall schema (https://unpaywall.org/data-format#doi-object)
     # says z_authors is exclusively a Crossref Contributor schema
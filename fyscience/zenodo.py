@@ -1,12 +1,22 @@
 from typing import Optional
-import requests
 
 from loguru import logger
 
+from fyscience import metrics, upstream
+from fyscience.upstream import UpstreamError
+from fyscience.cache import cached
+from fyscience.singleflight import single_flight
 
-def get_open_access_url(doi: str) -> Optional[str]:
+
+@metrics.provider_function
+@upstream.fallback(None)
+@single_flight("zenodo")
+@cached("zenodo")
+async def get_open_access_url_async(doi: str) -> Optional[str]:
     # TODO: Add access_token parameter with registered API token
-    r = requests.get("https://zenodo.org/api/records", params={"q": f'doi:"{doi}"'})
+    r = await upstream.get(
+        "https://zenodo.org/api/records", params={"q": f'doi:"{doi}"'}
+    )
 
     if r.status_code != 200:
         logger.error(
@@ -18,7 +28,7 @@ def get_open_access_url(doi: str) -> Optional[str]:
                 "response": r.content.decode() if r.content else "",
             }
         )
-        return None
+        raise UpstreamError(f"Zenodo responded with {r.status_code}")
 
     hits = r.json().get("hits")
     if not hits or hits["total"] == 0:
@@ -36,3 +46,7 @@ def get_open_access_url(doi: str) -> Optional[str]:
         }
     )
     return None
+
+
+def get_open_access_url(doi: str) -> Optional[str]:
+    return upstream.run_sync(get_open_access_url_async(doi))
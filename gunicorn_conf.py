@@ -1,6 +1,7 @@
 import json
 import multiprocessing
 import os
+import shutil
 
 workers_per_core_str = os.getenv("WORKERS_PER_CORE", "1")
 max_workers_str = os.getenv("MAX_WORKERS")
@@ -35,6 +36,18 @@ use_errorlog = errorlog_var or None
 graceful_timeout_str = os.getenv("GRACEFUL_TIMEOUT", "120")
 timeout_str = os.getenv("TIMEOUT", "120")
 keepalive_str = os.getenv("KEEP_ALIVE", "5")
+# Upstream response cache shared by all workers, see fyscience.cache.get_shared_cache
+shared_cache_path = os.getenv("SHARED_CACHE_PATH", "/dev/shm/fyscience-cache.sqlite3")
+os.environ["SHARED_CACHE_PATH"] = shared_cache_path
+# Upstream rate limits shared by all workers, see fyscience.rate_limiter
+rate_limit_path = os.getenv("RATE_LIMIT_PATH", "/dev/shm/fyscience-rate-limits.sqlite3")
+os.environ["RATE_LIMIT_PATH"] = rate_limit_path
+# Metrics of all workers, aggregated by /metrics, see fyscience.metrics. Metrics of
+# previous runs are dropped.
+metrics_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR", "/dev/shm/fyscience-metrics")
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+shutil.rmtree(metrics_dir, ignore_errors=True)
+os.makedirs(metrics_dir)
 
 # Gunicorn config variables
 loglevel = use_loglevel
@@ -48,6 +61,13 @@ timeout = int(timeout_str)
 keepalive = int(keepalive_str)
 
 
+def child_exit(server, worker):
+    # Drops the worker's live gauges, e.g. of requests in flight
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
 # For debugging and testing
 log_data = {
     "loglevel": loglevel,
@@ -63,5 +83,8 @@ log_data = {
     "use_max_workers": use_max_workers,
     "host": host,
     "port": port,
+    "shared_cache_path": shared_cache_path,
+    "rate_limit_path": rate_limit_path,
+    "metrics_dir": metrics_dir,
 }
 print(json.dumps(log_data))
@@ -1,22 +1,79 @@
 import os
+import asyncio
 import argparse
 from functools import partial
+from itertools import islice
 
-from fyscience.cache import json_filesystem_cache
+from fyscience import rate_limiter, upstream
+from fyscience.cache import log_cache
 from fyscience.data import load_jsonl, calculate_metrics
-from fyscience.oa_pathway import oa_pathway
-from fyscience.oa_status import validate_oa_status_from_s2_and_zenodo
-from fyscience.schemas import PaperWithOAStatus
+from fyscience.oa_pathway import oa_pathway_async
+from fyscience.oa_status import validate_oa_status_from_s2_and_zenodo_async
+from fyscience.pipeline import Progress, run_pipeline
+from fyscience.retry import RetryPolicy, set_retry_policy
+from fyscience.schemas import OAPathway, PaperWithOAPathway, PaperWithOAStatus
+
+
+UPSTREAM_HOSTS = [
+    "api.semanticscholar.org",
+    "partner.semanticscholar.org",
+    "zenodo.org",
+    "v2.sherpa.ac.uk",
+]
+
+
+def has_no_policy(issn, pathway_cache):
+    cached = pathway_cache.get(issn, None)
+    if not cached:
+        return False
+    pathway = cached if isinstance(cached, str) else cached[0]
+    return pathway == OAPathway.not_found
+
+
+def papers_to_enrich(dataset_file_path, results, pathway_cache, skip_unknown_issns):
+    return (
+        paper
+        for paper in load_jsonl(dataset_file_path)
+        if paper["journal_issn_l"] is not None
+        and paper["doi"] not in results
+        and not (
+            skip_unknown_issns and has_no_policy(paper["journal_issn_l"], pathway_cache)
+        )
+    )
+
+
+async def enrich(paper, pathway_cache):
+    paper = await validate_oa_status_from_s2_and_zenodo_async(paper)
+    return await oa_pathway_async(paper, cache=pathway_cache)
+
+
+async def run(papers, pathway_cache, results, concurrency, total):
+    progress = Progress(total=total)
+    async for paper, paper_with_pathway in run_pipeline(
+        papers,
+        lambda paper: enrich(paper, pathway_cache),
+        concurrency=concurrency,
+        progress=progress,
+    ):
+        # Checkpoint, papers already in the results are skipped on the next run
+        results[paper.doi] = paper_with_pathway.dict()
+    progress.report()
+    await upstream.aclose()
 
 
 if __name__ == "__main__":
     # TODO: Consider checking against publicly available publishers / ISSNS (e.g. elife)
     parser = argparse.ArgumentParser()
-    # TODO: find way to reintroduce '--limit' for generator based loading
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=None,
+        help="Maximum number of papers to enrich in this run.",
+    )
     parser.add_argument(
         "--pathway-cache",
         type=str,
-        default="./pathway.json",
+        default="./pathway.cache",
         help="Path to cache open access pathway information at.",
     )
     parser.add_argument(
@@ -25,35 +82,78 @@ if __name__ == "__main__":
         default="../tests/assets/unpaywall_subset.jsonl",
         help="Path to extract of unpaywall dataset with doi, issn and oa status",
     )
+    parser.add_argument(
+        "--results",
+        type=str,
+        default="./are_we_right.cache",
+        help="Path to store enriched papers at, a run resumes where the last stopped.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=32,
+        help="Maximum number of papers enriched concurrently.",
+    )
+    parser.add_argument(
+        "--max-requests-per-upstream",
+        type=int,
+        default=4,
+        help="Maximum number of concurrent requests to each upstream API.",
+    )
+    parser.add_argument(
+        "--skip-unknown-issns",
+        action="store_true",
+        help="Skip papers with ISSNs for which the cache says no policy was found.",
+    )
     args = parser.parse_args()
 
+    for host in UPSTREAM_HOSTS:
+        upstream.limit_concurrency(host, args.max_requests_per_upstream)
+        # Unlike users, batch runs can afford to wait out rate limits
+        set_retry_policy(host, RetryPolicy(max_attempts=5, max_delay=60.0))
+
     # Load data
     dataset_file_path = os.path.join(os.path.dirname(__file__), args.unpaywall_extract)
 
-    # TODO: Skip papers with ISSNs for which cache says no policy could be found
-    papers_with_oa_status = (
-        PaperWithOAStatus(
-            doi=paper["doi"],
-            issn=paper["journal_issn_l"],
-            is_open_access=paper["is_oa"],
-        )
-        for paper in load_jsonl(dataset_file_path)
-        if paper["journal_issn_l"] is not None
-    )
-
-    with json_filesystem_cache(args.pathway_cache) as pathway_cache:
-        # Enrich data
-        papers_with_s2_validated_oa_status = map(
-            validate_oa_status_from_s2_and_zenodo, papers_with_oa_status
+    with log_cache(args.pathway_cache) as pathway_cache, log_cache(
+        args.results, compress=True
+    ) as results:
+        to_enrich = partial(
+            papers_to_enrich,
+            dataset_file_path,
+            results,
+            pathway_cache,
+            args.skip_unknown_issns,
         )
-        papers_with_pathway = map(
-            partial(oa_pathway, cache=pathway_cache), papers_with_s2_validated_oa_status
+        papers_with_oa_status = (
+            PaperWithOAStatus(
+                doi=paper["doi"],
+                issn=paper["journal_issn_l"],
+                is_open_access=paper["is_oa"],
+            )
+            for paper in to_enrich()
         )
+        # Count with the same filter, so skipped papers don't inflate the ETA
+        total = sum(1 for _ in to_enrich())
+        if args.limit is not None:
+            papers_with_oa_status = islice(papers_with_oa_status, args.limit)
+            total = min(total, args.limit)
+
+        # Enrich data, leaving a share of the rate limits to the app
+        with rate_limiter.background():
+            asyncio.run(
+                run(
+                    papers_with_oa_status,
+                    pathway_cache,
+                    results,
+                    args.concurrency,
+                    total,
+                )
+            )
 
-        # Calculate & report metrics
-        # TODO: count number of papers from generator
+        # Calculate & report metrics over this and all previous runs
         n_oa, n_pathway_nocost, n_pathway_other, n_unknown = calculate_metrics(
-            papers_with_pathway
+            PaperWithOAPathway(**paper) for paper in results.values()
         )
 
     print(f"{n_oa} are already OA")
@@ -0,0 +1,33 @@
+"""Build the policy store served by fyscience.policy_store from a Sherpa crawl of
+scripts/populate-policy-cache.py, e.g.
+
+    python scripts/build-policy-store.py ../data/policy-cache.log policy-store.sqlite3
+
+and point the ``SHERPA_POLICY_STORE`` environment variable to the store.
+"""
+
+import sys
+
+from fyscience.cache import LogCache
+from fyscience.policy_store import build_store
+from fyscience.sherpa import classify_publications
+
+
+def classify_crawl(crawl):
+    for issn, crawled in crawl.items():
+        if not isinstance(crawled, dict) or "publications" not in crawled:
+            print(f"Skipping {issn}, re-crawl it", file=sys.stderr)
+            continue
+
+        pathway, details = classify_publications(crawled["publications"])
+        yield issn, pathway, details, crawled["retrieved_at"]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(f"Usage: {sys.argv[0]} CRAWL_LOG STORE_PATH")
+
+    crawl_path, store_path = sys.argv[1:]
+    crawl = LogCache(crawl_path, compress=True)
+    build_store(classify_crawl(crawl), store_path)
+    crawl.close()
@@ -0,0 +1,27 @@
+"""Build the DOI index served by fyscience.unpaywall_snapshot from an Unpaywall
+snapshot, e.g.
+
+    python scripts/build-unpaywall-index.py unpaywall.jsonl.gz unpaywall-index.sqlite3
+
+and point the ``UNPAYWALL_SNAPSHOT_INDEX`` environment variable to the index.
+"""
+
+import sys
+
+from fyscience.unpaywall import to_full_paper
+from fyscience.unpaywall_snapshot import build_index, load_unpaywall_snapshot
+
+
+def extract_papers(records):
+    for i, record in enumerate(records):
+        if i % 1000000 == 0:
+            print(f"{i} records indexed", file=sys.stderr)
+        yield to_full_paper(record["doi"], record)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit(f"Usage: {sys.argv[0]} SNAPSHOT_JSONL_GZ INDEX_PATH")
+
+    snapshot_path, index_path = sys.argv[1:]
+    build_index(extract_papers(load_unpaywall_snapshot(snapshot_path)), index_path)
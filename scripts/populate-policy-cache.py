@@ -1,11 +1,13 @@
-import json
 import os
+import time
+
 import requests
 
 from dotenv import load_dotenv
 from expression.core import pipe
 
-from fyscience.cache import json_filesystem_cache
+from fyscience.cache import log_cache
+from fyscience.rate_limiter import BACKGROUND, get_rate_limiter
 
 load_dotenv()
 
@@ -17,6 +19,14 @@ if api_key is None:
 
 
 def query_sherpa(issn):
+    # Draws from the same Sherpa quota as the app, if RATE_LIMIT_PATH is set
+    rate_limiter = get_rate_limiter()
+    if rate_limiter is not None:
+        wait = rate_limiter.try_acquire("v2.sherpa.ac.uk", BACKGROUND)
+        while wait > 0:
+            time.sleep(wait)
+            wait = rate_limiter.try_acquire("v2.sherpa.ac.uk", BACKGROUND)
+
     return requests.get(
         "https://v2.sherpa.ac.uk/cgi/retrieve?"
         + f"item-type=publication&api-key={api_key}&format=Json&"
@@ -24,28 +34,39 @@ def query_sherpa(issn):
     )
 
 
-def extract_policy(response):
+# Re-crawl policies weekly, see scripts/build-policy-store.py
+MAX_AGE = 7 * 24 * 60 * 60
+
+
+def extract_publications(response):
     if response.status_code != 200:
-        return "bad response"
+        return None
 
-    try:
-        return response.json()["items"][0]["publisher_policy"]
-    except Exception:
-        return "No publication or policy found"
+    return {"retrieved_at": time.time(), "publications": response.json()}
 
 
-def get_policy(issn):
+def get_publications(issn):
     return pipe(
         issn,
         query_sherpa,
-        extract_policy,
+        extract_publications,
+    )
+
+
+def is_stale(crawled):
+    # Also re-crawls entries of the former format, which only held the policies
+    return (
+        not isinstance(crawled, dict)
+        or "retrieved_at" not in crawled
+        or crawled["retrieved_at"] < time.time() - MAX_AGE
     )
 
 
-with json_filesystem_cache("../data/policy-cache.json") as cache:
+with log_cache("../data/policy-cache.log", compress=True) as cache:
     with open("../data/issn-list.txt", "r") as issn_list:
         for i, issn in enumerate(issn_list):
             issn = issn.strip("\n")
-            policy = cache.get(issn, None)
-            if not policy:
-                cache[issn] = get_policy(issn)
+            if is_stale(cache.get(issn, None)):
+                publications = get_publications(issn)
+                if publications is not None:
+                    cache[issn] = publications
@@ -1,7 +1,7 @@
 import os
 from functools import partial
 
-from fyscience.cache import json_filesystem_cache
+from fyscience.cache import log_cache
 from fyscience.data import load_jsonl
 from fyscience.schemas import PaperWithOAPathway, Paper
 from fyscience.oa_status import oa_status
@@ -29,7 +29,7 @@ if __name__ == "__main__":
     base_papers = [Paper(doi=paper.doi, issn=paper.issn) for paper in manual_references]
 
     # enricht list of papers with status and pathway
-    with json_filesystem_cache(os.path.join(HERE, "../pathway.json")) as pathway_cache:
+    with log_cache(os.path.join(HERE, "../pathway.cache")) as pathway_cache:
         papers_with_status = [oa_status(paper) for paper in base_papers]
         papers_with_pathways = [
             partial(oa_pathway, cache=pathway_cache)(paper)
@@ -0,0 +1,335 @@
+import os
+import asyncio
+import threading
+
+import pytest
+from prometheus_client import REGISTRY
+
+from fyscience import cache as shared_cache
+from fyscience.cache import LogCache, SQLiteCache, TTLCache, cached, log_cache
+from fyscience.upstream import UpstreamError
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=60, timer=timer)
+    cache["1234-1234"] = "nocost"
+
+    timer.now = 59
+    assert cache.get("1234-1234") == "nocost"
+
+    timer.now = 60
+    assert cache.get("1234-1234") is None
+    assert "1234-1234" not in cache
+    assert cache.stats()["expirations"] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache["a"] = 1
+    cache["b"] = 2
+    cache.get("a")
+    cache["c"] = 3
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_counts_hits_and_misses():
+    cache = TTLCache()
+    cache["a"] = 1
+
+    assert cache.get("a") == 1
+    assert cache.get("b", "default") == "default"
+    with pytest.raises(KeyError):
+        cache["b"]
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_sqlite_cache_expires_entries_per_namespace(tmp_path):
+    timer = FakeTimer()
+    cache = SQLiteCache(
+        str(tmp_path / "cache.sqlite3"),
+        ttls={"sherpa": 120},
+        default_ttl=60,
+        timer=timer,
+    )
+    cache.set("sherpa", "1234-1234", ["nocost", None])
+    cache.set("unpaywall", "10.1011/111111", {"doi": "10.1011/111111"})
+
+    timer.now = 60
+    assert cache.get("sherpa", "1234-1234") == ["nocost", None]
+    assert cache.get("unpaywall", "10.1011/111111") is None
+    assert cache.get("unpaywall", "1234-1234", "default") == "default"
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCache(path).set("zenodo", "10.1011/111111", "https://zenodo.org/1")
+
+    other_cache = SQLiteCache(path)
+    assert other_cache.get("zenodo", "10.1011/111111") == "https://zenodo.org/1"
+
+    other_cache.delete("zenodo", "10.1011/111111")
+    assert other_cache.get("zenodo", "10.1011/111111") is None
+
+
+def test_sqlite_cache_prunes_beyond_max_entries(tmp_path):
+    timer = FakeTimer()
+    cache = SQLiteCache(
+        str(tmp_path / "cache.sqlite3"), max_entries=2, prune_interval=3, timer=timer
+    )
+    for i in range(3):
+        timer.now = i
+        cache.set("zenodo", str(i), i)
+
+    assert cache.get("zenodo", "0") is None
+    assert cache.get("zenodo", "2") == 2
+    assert cache.stats() == {"zenodo": {"size": 2}}
+
+
+@pytest.mark.anyio
+async def test_cached(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+    calls = []
+
+    @cached("zenodo")
+    async def get_url(doi, api_key=None):
+        calls.append(doi)
+        return None if doi == "10.1011/unknown" else f"https://zenodo.org/{doi}"
+
+    assert await get_url("10.1011/111111") == "https://zenodo.org/10.1011/111111"
+    assert await get_url(doi="10.1011/111111", api_key="key") == (
+        "https://zenodo.org/10.1011/111111"
+    )
+    assert calls == ["10.1011/111111"]
+
+    # Misses are only kept in the negative cache
+    assert await get_url("10.1011/unknown") is None
+    assert await get_url("10.1011/unknown") is None
+    assert calls == ["10.1011/111111", "10.1011/unknown"]
+    assert cache.get("zenodo", "10.1011/unknown") is None
+
+
+@pytest.mark.anyio
+async def test_cached_queries_shared_cache_off_the_event_loop(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+    threads = []
+    for method in ["get_entry", "set"]:
+        original = getattr(cache, method)
+
+        def record(*args, original=original):
+            threads.append(threading.get_ident())
+            return original(*args)
+
+        monkeypatch.setattr(cache, method, record)
+
+    @cached("zenodo")
+    async def get_url(doi):
+        return f"https://zenodo.org/{doi}"
+
+    await get_url("10.1011/111111")
+    await get_url("10.1011/111111")
+    assert len(threads) == 3
+    assert threading.get_ident() not in threads
+
+
+@pytest.mark.anyio
+async def test_cached_counts_lookups(tmp_path, monkeypatch):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+
+    @cached("zenodo_metrics")
+    async def get_url(doi):
+        return None if doi == "10.1011/unknown" else f"https://zenodo.org/{doi}"
+
+    for doi in ["10.1011/111111", "10.1011/111111", "10.1011/unknown"] * 2:
+        await get_url(doi)
+
+    for result, count in [("miss", 2), ("hit", 3), ("negative", 1)]:
+        assert (
+            REGISTRY.get_sample_value(
+                "fyscience_cache_lookups_total",
+                {"namespace": "zenodo_metrics", "result": result},
+            )
+            == count
+        )
+
+
+@pytest.mark.anyio
+async def test_cached_without_shared_cache(monkeypatch):
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: None)
+    calls = []
+
+    @cached("zenodo")
+    async def get_url(doi):
+        calls.append(doi)
+        return "https://zenodo.org/1"
+
+    await get_url("10.1011/111111")
+    await get_url("10.1011/111111")
+    assert calls == ["10.1011/111111", "10.1011/111111"]
+
+
+def test_log_cache_persists_entries(tmp_path):
+    path = str(tmp_path / "pathway.cache")
+    with log_cache(path) as cache:
+        cache["1234-1234"] = ["nocost", [{"id": 1}]]
+        cache["2345-2345"] = "other"
+        cache["3456-3456"] = "not_found"
+        cache["2345-2345"] = ["other", None]
+        del cache["3456-3456"]
+
+    with log_cache(path) as cache:
+        assert dict(cache) == {
+            "1234-1234": ["nocost", [{"id": 1}]],
+            "2345-2345": ["other", None],
+        }
+        assert cache.get("3456-3456", None) is None
+
+
+def test_log_cache_drops_partially_written_record(tmp_path):
+    path = str(tmp_path / "pathway.cache")
+    cache = LogCache(path)
+    cache["1234-1234"] = "nocost"
+    cache["2345-2345"] = "other"
+    cache.close()
+
+    # Simulate a crash in the middle of writing the last record
+    with open(path, "r+b") as fh:
+        fh.truncate(os.path.getsize(path) - 3)
+
+    cache = LogCache(path)
+    assert dict(cache) == {"1234-1234": "nocost"}
+    cache["2345-2345"] = "other"
+    cache.close()
+
+    assert dict(LogCache(path)) == {"1234-1234": "nocost", "2345-2345": "other"}
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_log_cache_compacts(compress, tmp_path):
+    path = str(tmp_path / "pathway.cache")
+    cache = LogCache(path, compress=compress, compact_min_size=1024)
+    for i in range(100):
+        cache["1234-1234"] = ["nocost", [{"id": i}]]
+    cache["2345-2345"] = "other"
+
+    assert os.path.getsize(path) < 1024
+    assert dict(cache) == {"1234-1234": ["nocost", [{"id": 99}]], "2345-2345": "other"}
+    cache.close()
+    assert dict(LogCache(path)) == {
+        "1234-1234": ["nocost", [{"id": 99}]],
+        "2345-2345": "other",
+    }
+
+
+@pytest.mark.anyio
+async def test_cached_does_not_cache_errors(monkeypatch):
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: None)
+    calls = []
+
+    @cached("sherpa")
+    async def get_pathway(issn):
+        calls.append(issn)
+        raise UpstreamError("dummy error")
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            await get_pathway("1234-1234")
+    assert calls == ["1234-1234", "1234-1234"]
+
+
+@pytest.mark.anyio
+async def test_cached_negative_cache_disabled(monkeypatch):
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: None)
+    monkeypatch.setenv("NEGATIVE_CACHE_TTL", "0")
+    shared_cache.get_negative_cache.cache_clear()
+    calls = []
+
+    @cached("zenodo")
+    async def get_url(doi):
+        calls.append(doi)
+        return None
+
+    await get_url("10.1011/unknown")
+    await get_url("10.1011/unknown")
+    assert calls == ["10.1011/unknown", "10.1011/unknown"]
+
+
+@pytest.mark.anyio
+async def test_cached_serves_stale_while_revalidating(tmp_path, monkeypatch):
+    timer = FakeTimer()
+    cache = SQLiteCache(
+        str(tmp_path / "cache.sqlite3"),
+        ttls={"zenodo": 60},
+        max_stale={"zenodo": 60},
+        timer=timer,
+    )
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+    responses = ["https://zenodo.org/1", UpstreamError(), "https://zenodo.org/2"]
+
+    @cached("zenodo")
+    async def get_url(doi):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    assert await get_url("10.1011/111111") == "https://zenodo.org/1"
+
+    # Stale, the failing refresh keeps the stale result
+    timer.now = 60
+    assert await get_url("10.1011/111111") == "https://zenodo.org/1"
+    await asyncio.sleep(0.01)
+    assert responses == ["https://zenodo.org/2"]
+    assert await get_url("10.1011/111111") == "https://zenodo.org/1"
+    await asyncio.sleep(0.01)
+
+    assert responses == []
+    assert await get_url("10.1011/111111") == "https://zenodo.org/2"
+    assert cache.get_entry("zenodo", "10.1011/111111") == (
+        "https://zenodo.org/2",
+        False,
+    )
+
+
+@pytest.mark.anyio
+async def test_cached_does_not_serve_expired_results(tmp_path, monkeypatch):
+    timer = FakeTimer()
+    cache = SQLiteCache(
+        str(tmp_path / "cache.sqlite3"),
+        ttls={"zenodo": 60},
+        max_stale={"zenodo": 60},
+        timer=timer,
+    )
+    monkeypatch.setattr(shared_cache, "get_shared_cache", lambda: cache)
+    responses = ["https://zenodo.org/1", UpstreamError()]
+
+    @cached("zenodo")
+    async def get_url(doi):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    await get_url("10.1011/111111")
+    timer.now = 120
+    with pytest.raises(UpstreamError):
+        await get_url("10.1011/111111")
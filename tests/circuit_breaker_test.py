@@ -0,0 +1,74 @@
+import httpx
+import pytest
+
+from fyscience import upstream
+from fyscience.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from fyscience.retry import RetryPolicy, set_retry_policy
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_breaker_opens_on_failures():
+    timer = FakeTimer()
+    breaker = CircuitBreaker("zenodo.org", window=4, min_calls=4, timer=timer)
+
+    for success in [True, False, True]:
+        assert breaker.allow_request()
+        breaker.record(success, 0.1)
+    assert breaker.state == CLOSED
+
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_circuit_breaker_counts_slow_calls_as_failures():
+    breaker = CircuitBreaker("zenodo.org", min_calls=2, slow_call_duration=1.0)
+    breaker.record(True, 1.5)
+    breaker.record(True, 1.5)
+    assert breaker.state == OPEN
+
+
+@pytest.mark.parametrize("probe_succeeds,state", [(True, CLOSED), (False, OPEN)])
+def test_circuit_breaker_half_open_probe(probe_succeeds, state):
+    timer = FakeTimer()
+    breaker = CircuitBreaker("zenodo.org", min_calls=1, open_duration=30, timer=timer)
+    breaker.record(False, 0.1)
+
+    timer.now = 30
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    # Only a single probe
+    assert not breaker.allow_request()
+
+    breaker.record(probe_succeeds, 0.1)
+    assert breaker.state == state
+
+
+@pytest.mark.anyio
+async def test_request_fails_fast_with_open_circuit(monkeypatch):
+    calls = []
+
+    async def mock_request(self, method, url, **kwargs):
+        calls.append(url)
+        return httpx.Response(503)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    monkeypatch.setattr(
+        "fyscience.circuit_breaker._breakers",
+        {"zenodo.org": CircuitBreaker("zenodo.org", min_calls=2)},
+    )
+    set_retry_policy("zenodo.org", RetryPolicy(max_attempts=1))
+
+    for _ in range(2):
+        assert (await upstream.get("https://zenodo.org/api/records")).status_code == 503
+    with pytest.raises(upstream.CircuitOpenError):
+        await upstream.get("https://zenodo.org/api/records")
+    assert len(calls) == 2
+    await upstream.aclose()
@@ -6,6 +6,7 @@ from _pytest.logging import caplog as _caplog
 from loguru import logger
 from fastapi.testclient import TestClient
 
+from fyscience.cache import get_negative_cache
 from fyscience.main import app
 
 
@@ -15,6 +16,11 @@ def client() -> Generator:
         yield c
 
 
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
 @pytest.fixture
 def caplog(_caplog):
     class PropogateHandler(logging.Handler):
@@ -24,3 +30,17 @@ def caplog(_caplog):
     handler_id = logger.add(PropogateHandler(), format="{message} {extra}")
     yield _caplog
     logger.remove(handler_id)
+
+
+@pytest.fixture(autouse=True)
+def clear_negative_cache():
+    # Tests mock different answers for the same DOIs and ISSNs
+    get_negative_cache.cache_clear()
+    yield
+    get_negative_cache.cache_clear()
+
+
+@pytest.fixture(autouse=True)
+def reset_retry_policies(monkeypatch):
+    # Every test starts with the default policies and full retry budgets
+    monkeypatch.setattr("fyscience.retry._policies", {})
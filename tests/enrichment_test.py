@@ -0,0 +1,299 @@
+import asyncio
+
+import httpx
+import pytest
+from prometheus_client import REGISTRY
+
+from fyscience import upstream
+from fyscience.cache import TTLCache
+from fyscience.enrichment import enrich_paper, cache_pathway_lookups, share_lookups
+from fyscience.retry import RetryPolicy, set_retry_policy
+from fyscience.schemas import FullPaper, OAPathway
+from fyscience.testing import payloads
+
+DOI = "10.1011/111111"
+ISSN = "1234-1234"
+
+
+@pytest.fixture
+def providers(monkeypatch):
+    """Mock all providers, the returned dict configures their results (or errors to
+    raise) and records which of them got called."""
+    config = {
+        "unpaywall": FullPaper(doi=DOI, issn=ISSN, is_open_access=False),
+        "s2": None,
+        "zenodo": None,
+        "sherpa": (OAPathway.nocost, [{"id": 1}]),
+        "permissions": {"best_permission": {"can_archive": True}},
+        "calls": [],
+    }
+
+    def mock(name):
+        async def provider(*a, **kw):
+            config["calls"].append(name)
+            result = config[name]
+            if isinstance(result, Exception):
+                raise result
+            return result.model_copy() if isinstance(result, FullPaper) else result
+
+        return provider
+
+    monkeypatch.setattr(
+        "fyscience.enrichment.unpaywall.get_paper_async", mock("unpaywall")
+    )
+    monkeypatch.setattr(
+        "fyscience.enrichment.semantic_scholar.get_paper_async", mock("s2")
+    )
+    monkeypatch.setattr(
+        "fyscience.enrichment.zenodo.get_open_access_url_async", mock("zenodo")
+    )
+    monkeypatch.setattr("fyscience.enrichment.sherpa.get_pathway_async", mock("sherpa"))
+    monkeypatch.setattr(
+        "fyscience.enrichment.openaccessbutton.get_permissions_async",
+        mock("permissions"),
+    )
+    return config
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "unpaywall_oa,s2_oa,zenodo_url,expected_oa,expected_pathway",
+    [
+        (True, False, None, True, OAPathway.already_oa),
+        (False, None, None, False, OAPathway.nocost),
+        (False, True, None, True, OAPathway.already_oa),
+        (False, False, "https://zenodo.local", True, OAPathway.already_oa),
+        (False, True, "https://zenodo.local", True, OAPathway.already_oa),
+    ],
+)
+async def test_enrich_paper(
+    unpaywall_oa, s2_oa, zenodo_url, expected_oa, expected_pathway, providers
+):
+    providers["unpaywall"] = FullPaper(doi=DOI, issn=ISSN, is_open_access=unpaywall_oa)
+    providers["s2"] = FullPaper(doi=DOI, is_open_access=s2_oa)
+    providers["zenodo"] = zenodo_url
+
+    paper = await enrich_paper(DOI)
+
+    assert paper.is_open_access is expected_oa
+    assert paper.oa_pathway is expected_pathway
+    assert paper.can_share_your_paper
+    if expected_pathway is OAPathway.nocost:
+        assert paper.oa_pathway_details == [{"id": 1}]
+
+
+@pytest.mark.anyio
+async def test_enrich_paper_without_issn(providers):
+    providers["unpaywall"] = None
+
+    paper = await enrich_paper(DOI)
+
+    assert paper == FullPaper(doi=DOI)
+    assert "sherpa" not in providers["calls"]
+
+
+@pytest.mark.anyio
+async def test_enrich_paper_skips_s2_for_oa_papers(providers):
+    providers["unpaywall"] = FullPaper(doi=DOI, issn=ISSN, is_open_access=True)
+
+    paper = await enrich_paper(DOI)
+
+    assert paper.oa_pathway is OAPathway.already_oa
+    assert "s2" not in providers["calls"]
+
+
+@pytest.mark.anyio
+async def test_enrich_paper_runs_lookups_concurrently(providers, monkeypatch):
+    zenodo_started = asyncio.Event()
+
+    async def mock_unpaywall(*a, **kw):
+        # Would never finish if Zenodo were only queried after Unpaywall
+        await zenodo_started.wait()
+        return FullPaper(doi=DOI, issn=ISSN, is_open_access=False)
+
+    async def mock_zenodo(*a, **kw):
+        zenodo_started.set()
+        return None
+
+    monkeypatch.setattr(
+        "fyscience.enrichment.unpaywall.get_paper_async", mock_unpaywall
+    )
+    monkeypatch.setattr(
+        "fyscience.enrichment.zenodo.get_open_access_url_async", mock_zenodo
+    )
+
+    paper = await asyncio.wait_for(enrich_paper(DOI), timeout=1)
+    assert paper.oa_pathway is OAPathway.nocost
+
+
+@pytest.mark.anyio
+async def test_share_lookups():
+    calls = []
+
+    async def lookup(issn, api_key):
+        calls.append(issn)
+        await asyncio.sleep(0)
+        return OAPathway.nocost, None
+
+    shared_lookup = share_lookups(lookup)
+    results = await asyncio.gather(
+        shared_lookup(ISSN, None),
+        shared_lookup(ISSN, None),
+        shared_lookup("0000-0000", None),
+    )
+
+    assert calls == [ISSN, "0000-0000"]
+    assert all(result == (OAPathway.nocost, None) for result in results)
+    assert await shared_lookup(ISSN, None) == (OAPathway.nocost, None)
+    assert calls == [ISSN, "0000-0000"]
+
+
+@pytest.mark.anyio
+async def test_share_lookups_survives_cancellation():
+    async def lookup(issn, api_key):
+        await asyncio.sleep(0.01)
+        return OAPathway.nocost, None
+
+    shared_lookup = share_lookups(lookup)
+    cancelled = asyncio.ensure_future(shared_lookup(ISSN, None))
+    await asyncio.sleep(0)
+    cancelled.cancel()
+
+    assert await shared_lookup(ISSN, None) == (OAPathway.nocost, None)
+
+
+@pytest.mark.anyio
+async def test_cache_pathway_lookups():
+    calls = []
+
+    async def lookup(issn, api_key):
+        calls.append(issn)
+        if issn == ISSN:
+            return OAPathway.nocost, [{"id": 1}]
+        return OAPathway.not_found, None
+
+    def lookups(result):
+        return (
+            REGISTRY.get_sample_value(
+                "fyscience_cache_lookups_total",
+                {"namespace": "pathway", "result": result},
+            )
+            or 0
+        )
+
+    hits, misses = lookups("hit"), lookups("miss")
+    cache = TTLCache()
+    cached_lookup = cache_pathway_lookups(lookup, cache)
+
+    assert await cached_lookup(ISSN) == (OAPathway.nocost, [{"id": 1}])
+    assert await cached_lookup(ISSN) == (OAPathway.nocost, [{"id": 1}])
+    assert await cached_lookup("0000-0000") == (OAPathway.not_found, None)
+    assert await cached_lookup("0000-0000") == (OAPathway.not_found, None)
+
+    assert calls == [ISSN, "0000-0000", "0000-0000"]
+    assert lookups("hit") - hits == 1
+    assert lookups("miss") - misses == 3
+
+
+@pytest.mark.anyio
+async def test_enrich_paper_marks_steps_with_open_circuit_as_degraded(
+    providers, monkeypatch
+):
+    providers["zenodo"] = upstream.CircuitOpenError("Circuit for zenodo.org is open")
+    providers["sherpa"] = upstream.CircuitOpenError("Circuit for sherpa is open")
+    # Not found, which isn't degraded
+    providers["permissions"] = None
+
+    paper = await enrich_paper(DOI)
+
+    assert paper.is_open_access is False
+    assert paper.oa_pathway is OAPathway.not_found
+    assert paper.can_share_your_paper is False
+    assert paper.degraded == ["zenodo", "sherpa"]
+
+
+@pytest.mark.anyio
+async def test_enrich_paper_marks_missing_results_as_degraded_after_deadline(
+    providers, monkeypatch
+):
+    for provider in ["s2", "zenodo", "sherpa", "permissions"]:
+        providers[provider] = upstream.DeadlineExceeded("No time left")
+
+    paper = await enrich_paper(DOI)
+
+    assert paper.issn == ISSN
+    assert paper.degraded == [
+        "semantic_scholar",
+        "zenodo",
+        "sherpa",
+        "openaccessbutton",
+    ]
+
+
+UPSTREAM_RESPONSES = {
+    "api.unpaywall.org": {
+        **payloads.unpaywall_doi_object(DOI),
+        "is_oa": False,
+        "best_oa_location": None,
+        "journal_issn_l": ISSN,
+    },
+    "api.semanticscholar.org": {"doi": DOI, "is_open_access": False},
+    "zenodo.org": {"hits": {"hits": [], "total": 0}},
+    "v2.sherpa.ac.uk": payloads.sherpa_publications(ISSN),
+    "api.openaccessbutton.org": {"best_permission": {"can_archive": True}},
+}
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize(
+    "failing_host,expected",
+    [
+        (
+            "api.unpaywall.org",
+            {
+                "issn": None,
+                "oa_pathway": None,
+                "can_share_your_paper": False,
+                "degraded": ["unpaywall"],
+            },
+        ),
+        ("api.semanticscholar.org", {"degraded": ["semantic_scholar"]}),
+        ("zenodo.org", {"degraded": ["zenodo"]}),
+        (
+            "v2.sherpa.ac.uk",
+            {"oa_pathway": OAPathway.not_found, "degraded": ["sherpa"]},
+        ),
+        (
+            "api.openaccessbutton.org",
+            {"can_share_your_paper": False, "degraded": ["openaccessbutton"]},
+        ),
+    ],
+)
+async def test_enrich_paper_survives_transport_errors(
+    failing_host, expected, monkeypatch
+):
+    monkeypatch.setattr("fyscience.circuit_breaker._breakers", {})
+    set_retry_policy(failing_host, RetryPolicy(max_attempts=1))
+
+    async def mock_request(self, method, url, **kwargs):
+        host = httpx.URL(url).host
+        if host == failing_host:
+            raise httpx.ConnectError("Connection refused")
+        return httpx.Response(200, json=UPSTREAM_RESPONSES[host])
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+
+    paper = await enrich_paper(
+        DOI, unpaywall_email="team@freeyourscience.org", sherpa_api_key="key"
+    )
+    await upstream.aclose()
+
+    assert paper.doi == DOI
+    for field, value in {
+        "issn": ISSN,
+        "oa_pathway": OAPathway.nocost,
+        "can_share_your_paper": True,
+        "degraded": None,
+        **expected,
+    }.items():
+        assert getattr(paper, field) == value
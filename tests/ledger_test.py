@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from fyscience import ledger
+from fyscience.singleflight import single_flight
+
+
+def test_ledger_records_only_while_recording():
+    with ledger.provider_call("zenodo.get_open_access_url_async") as call:
+        assert call is None
+
+    with ledger.recording() as calls:
+        with ledger.recording() as nested_calls:
+            with ledger.provider_call("zenodo.get_open_access_url_async"):
+                ledger.note_cache("miss")
+                ledger.note_upstream_call("429")
+                ledger.note_retry()
+                ledger.note_upstream_call("200")
+    assert nested_calls is calls
+
+    assert ledger.as_log(calls) == [
+        {
+            "provider": "zenodo.get_open_access_url_async",
+            "duration": calls[0].duration,
+            "cache": "miss",
+            "upstream_calls": 2,
+            "retries": 1,
+            "status": "200",
+            "cancelled": False,
+        }
+    ]
+    assert ledger.server_timing(calls).endswith(
+        'desc="cache=miss status=200 retries=1"'
+    )
+
+
+@pytest.mark.anyio
+async def test_ledger_marks_coalesced_calls():
+    @single_flight("ledger_test")
+    async def get_pathway(issn):
+        await asyncio.sleep(0.01)
+        return "nocost"
+
+    async def lookup(issn):
+        with ledger.provider_call("sherpa.get_pathway_async"):
+            return await get_pathway(issn)
+
+    with ledger.recording() as calls:
+        await asyncio.gather(lookup("1234-1234"), lookup("1234-1234"))
+
+    assert [call.cache for call in calls] == [None, "coalesced"]
+
+
+@pytest.mark.anyio
+async def test_server_timing_lists_unfinished_calls():
+    async def lookup():
+        with ledger.provider_call("zenodo.get_open_access_url_async"):
+            await asyncio.sleep(1)
+
+    with ledger.recording() as calls:
+        task = asyncio.ensure_future(lookup())
+        await asyncio.sleep(0.01)
+        running = ledger.server_timing(calls)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    assert running.startswith("zenodo.get_open_access_url_async;dur=")
+    assert running.endswith('desc="cache=none cancelled"')
+    assert float(running.split("dur=")[1].split(";")[0]) >= 10
+    assert calls[0].cancelled
+    assert ledger.server_timing(calls).endswith('desc="cache=none cancelled"')
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from fyscience.limiter import AdaptiveLimiter
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def run_calls(limiter, n_calls, overloaded=False, latency=0.1):
+    for _ in range(n_calls):
+        await limiter.acquire()
+    for _ in range(n_calls):
+        limiter.release(overloaded, latency)
+
+
+@pytest.mark.anyio
+async def test_limiter_grows_while_saturated_with_flat_latency():
+    limiter = AdaptiveLimiter("zenodo.org", initial_limit=2, max_limit=4)
+
+    for _ in range(3):
+        await run_calls(limiter, 2)
+    assert limiter.limit == 3
+
+    for _ in range(20):
+        await run_calls(limiter, limiter.limit)
+    assert limiter.limit == 4
+
+
+@pytest.mark.anyio
+async def test_limiter_does_not_grow_without_load():
+    limiter = AdaptiveLimiter("zenodo.org", initial_limit=2)
+
+    for _ in range(10):
+        await run_calls(limiter, 1)
+    assert limiter.limit == 2
+
+
+@pytest.mark.anyio
+async def test_limiter_shrinks_once_per_cooldown_when_overloaded():
+    timer = FakeTimer()
+    limiter = AdaptiveLimiter("zenodo.org", initial_limit=8, cooldown=1, timer=timer)
+
+    await run_calls(limiter, 4, overloaded=True)
+    assert limiter.limit == 4
+
+    timer.now = 1.0
+    await run_calls(limiter, 1, overloaded=True)
+    assert limiter.limit == 2
+
+    for t in [2.0, 3.0]:
+        timer.now = t
+        await run_calls(limiter, 1, overloaded=True)
+    assert limiter.limit == 1
+
+
+@pytest.mark.anyio
+async def test_limiter_shrinks_on_latency_spike():
+    limiter = AdaptiveLimiter("zenodo.org", initial_limit=8, latency_tolerance=2)
+
+    await run_calls(limiter, 1, latency=0.1)
+    await run_calls(limiter, 1, latency=0.15)
+    assert limiter.limit == 8
+    await run_calls(limiter, 1, latency=1.0)
+    assert limiter.limit == 4
+
+
+@pytest.mark.anyio
+async def test_limiter_queues_calls_beyond_limit():
+    limiter = AdaptiveLimiter("zenodo.org", initial_limit=1)
+    await limiter.acquire()
+
+    waiting = asyncio.ensure_future(limiter.acquire())
+    cancelled = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.stats() == {"limit": 1, "in_flight": 1, "queued": 2}
+
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    assert limiter.queued == 1
+
+    limiter.release()
+    await waiting
+    assert limiter.stats() == {"limit": 1, "in_flight": 1, "queued": 0}
+
+
+@pytest.mark.anyio
+async def test_limiter_skips_cancelled_waiters():
+    limiter = AdaptiveLimiter("zenodo.org", initial_limit=1)
+    await limiter.acquire()
+
+    cancelled = asyncio.ensure_future(limiter.acquire())
+    waiting = asyncio.ensure_future(limiter.acquire())
+    await asyncio.sleep(0)
+
+    # The slot is given back before the cancelled call notices being cancelled
+    cancelled.cancel()
+    limiter.release()
+    await waiting
+    with pytest.raises(asyncio.CancelledError):
+        await cancelled
+    assert limiter.stats() == {"limit": 1, "in_flight": 1, "queued": 0}
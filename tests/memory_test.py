@@ -0,0 +1,52 @@
+import sys
+
+from fyscience import memory
+from fyscience.cache import TTLCache
+from fyscience.schemas import FullPaper
+
+
+def test_deep_size_counts_referenced_objects():
+    title = "x" * 1000
+    paper = FullPaper(doi="10.1011/111111", title=title)
+
+    assert memory.deep_size(paper) > sys.getsizeof(title)
+    assert memory.deep_size([title, title]) < 2 * sys.getsizeof(title)
+
+
+def test_estimate_size(monkeypatch):
+    monkeypatch.setattr(memory, "SIZE_SAMPLE", 10)
+    values = ["x" * 1000 for _ in range(100)]
+
+    assert memory.estimate_size([]) == 0
+    assert memory.estimate_size(values) == sum(memory.deep_size(v) for v in values)
+
+
+def test_report_without_tracing():
+    cache = TTLCache()
+    cache["1234-1234"] = "x" * 1000
+
+    result = memory.report({"pathway": cache})
+
+    assert result["tracing"] is False
+    assert "top" not in result
+    assert result["caches"]["pathway"]["size"] == 1
+    assert result["caches"]["pathway"]["bytes"] > 1000
+    assert result["caches"]["negative"]["size"] == 0
+    assert result["caches"]["shared"] is None
+
+
+def test_report_growth_between_snapshots():
+    memory.start()
+    try:
+        assert memory.report({})["growth"] is None
+        leak = [bytearray(1000) for _ in range(1000)]
+        result = memory.report({}, limit=5)
+    finally:
+        memory.stop()
+
+    assert len(result["top"]) <= 5
+    assert result["traced_memory"]["current"] > 1000 * 1000
+    (site,) = [s for s in result["growth"] if s["site"].startswith(__file__)]
+    assert site["size_diff"] >= 1000 * 1000
+    assert site["count_diff"] >= 1000
+    assert len(leak) == 1000
@@ -0,0 +1,47 @@
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+
+from fyscience import metrics, upstream
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.anyio
+async def test_upstream_calls_are_labelled_with_provider_function(monkeypatch):
+    async def mock_request(self, method, url, **kwargs):
+        return httpx.Response(418)
+
+    @metrics.provider_function
+    async def get_teapot():
+        return await upstream.get("https://zenodo.org/api/teapot")
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    labels = {
+        "upstream": "zenodo.org",
+        "function": "metrics_test.get_teapot",
+        "status": "418",
+    }
+    before = sample("fyscience_upstream_request_duration_seconds_count", **labels)
+
+    await get_teapot()
+    await upstream.aclose()
+
+    after = sample("fyscience_upstream_request_duration_seconds_count", **labels)
+    assert after == before + 1
+
+
+def test_metrics_endpoint(client: TestClient):
+    client.get("/api/logs")
+    r = client.get("/metrics")
+
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert (
+        'fyscience_request_duration_seconds_count{method="GET",route="/api/logs",'
+        'status="405"}'
+    ) in r.text
+    assert "fyscience_requests_in_flight 1.0" in r.text
@@ -9,7 +9,6 @@ from fyscience.schemas import (
     OAPathway,
 )
 
-
 ASSETS_PATH = os.path.join(os.path.dirname(__file__), "assets")
 
 
@@ -27,11 +26,11 @@ def test_oa_pathway(monkeypatch):
     updated_paper = oa_pathway(paper=paper)
     assert updated_paper.oa_pathway is OAPathway.not_attempted
 
-    def mock_sherpa_pathway_api(*args, **kwargs):
+    async def mock_sherpa_pathway_api(*args, **kwargs):
         return OAPathway.already_oa, None
 
     monkeypatch.setattr(
-        "fyscience.oa_pathway.sherpa_pathway_api", mock_sherpa_pathway_api
+        "fyscience.oa_pathway.sherpa_pathway_api_async", mock_sherpa_pathway_api
     )
 
     paper = PaperWithOAStatus(is_open_access=False, **base_paper.dict())
@@ -40,7 +39,7 @@ def test_oa_pathway(monkeypatch):
 
 
 def test_oa_pathway_doesnt_call_api_when_cached(mocker):
-    sherpa_pathway_api_spy = mocker.spy(oa_pathway_module, "sherpa_pathway_api")
+    sherpa_pathway_api_spy = mocker.spy(oa_pathway_module, "sherpa_pathway_api_async")
     issn = "0003-987X"
     cache = {issn: OAPathway.nocost}
 
@@ -57,11 +56,11 @@ def test_oa_pathway_chaches_after_api_call(monkeypatch):
     target_pathway = OAPathway.nocost
     cache = {}
 
-    def mock_sherpa_pathway_api(*args, **kwargs):
+    async def mock_sherpa_pathway_api(*args, **kwargs):
         return target_pathway, []
 
     monkeypatch.setattr(
-        "fyscience.oa_pathway.sherpa_pathway_api", mock_sherpa_pathway_api
+        "fyscience.oa_pathway.sherpa_pathway_api_async", mock_sherpa_pathway_api
     )
 
     oa_pathway(
@@ -70,7 +69,23 @@ def test_oa_pathway_chaches_after_api_call(monkeypatch):
     )
 
     assert issn in cache
-    assert cache[issn] is target_pathway
+    assert cache[issn] == (target_pathway, [])
+
+
+def test_oa_pathway_returns_cached_details(mocker):
+    sherpa_pathway_api_spy = mocker.spy(oa_pathway_module, "sherpa_pathway_api_async")
+    issn = "0003-987X"
+    details = [{"id": 1}]
+    cache = {issn: ("nocost", details)}
+
+    updated_paper = oa_pathway(
+        PaperWithOAStatus(doi="10.1011/111111", issn=issn, is_open_access=False),
+        cache=cache,
+    )
+
+    assert sherpa_pathway_api_spy.call_count == 0
+    assert updated_paper.oa_pathway is OAPathway.nocost
+    assert updated_paper.oa_pathway_details == details
 
 
 def test_remove_costly_oa_from_publisher_policy_without_additional_oa_fee_key():
@@ -1,7 +1,7 @@
 import os
 import pytest
 
-from requests import Response
+from httpx import Response
 from fyscience.orcid import get_author_with_papers, is_orcid, extract_orcid
 
 
@@ -9,15 +9,14 @@ ASSETS_PATH = os.path.join(os.path.dirname(__file__), "assets")
 
 
 def test_get_author_with_papers(monkeypatch):
-    def mock_get(*a, **kw):
+    async def mock_get(*a, **kw):
         with open(os.path.join(ASSETS_PATH, "orcid_author.xml"), "r") as fh:
             xml = fh.read()
-        r = Response()
+        r = Response(200)
         r._content = xml.encode()
-        r.status_code = 200
         return r
 
-    monkeypatch.setattr("fyscience.orcid.requests.get", mock_get)
+    monkeypatch.setattr("fyscience.orcid.upstream.get", mock_get)
     author = get_author_with_papers("0000-0000-0000-0000")
 
     assert len(author.paper_ids) == 2
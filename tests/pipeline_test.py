@@ -0,0 +1,61 @@
+import io
+import asyncio
+
+import pytest
+
+from fyscience.pipeline import Progress, run_pipeline
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.anyio
+async def test_run_pipeline_bounds_concurrency():
+    n_concurrent = 0
+    max_concurrent = 0
+
+    async def process(item):
+        nonlocal n_concurrent, max_concurrent
+        n_concurrent += 1
+        max_concurrent = max(max_concurrent, n_concurrent)
+        await asyncio.sleep(0.001 * (item % 3))
+        n_concurrent -= 1
+        if item == 5:
+            raise RuntimeError("dummy error")
+        return item * 2
+
+    progress = Progress(total=10, file=io.StringIO())
+    results = [
+        result
+        async for result in run_pipeline(
+            range(10), process, concurrency=3, progress=progress
+        )
+    ]
+
+    assert sorted(results) == [(i, i * 2) for i in range(10) if i != 5]
+    assert max_concurrent == 3
+    assert progress.n_done == 9
+    assert progress.n_failed == 1
+
+
+def test_progress_reports_throughput_and_eta():
+    timer = FakeTimer()
+    file = io.StringIO()
+    progress = Progress(total=100, interval=10, timer=timer, file=file)
+
+    timer.now = 5
+    for _ in range(10):
+        progress.update()
+    progress.update(failed=True)
+    assert file.getvalue() == ""
+
+    timer.now = 10
+    progress.update()
+    assert progress.rate == pytest.approx(1.1)
+    assert progress.eta == pytest.approx(88 / 1.1)
+    assert file.getvalue() == "11/100 done, 1.1/s, 1 failed, ETA 00:01:20\n"
@@ -0,0 +1,69 @@
+import os
+import json
+
+from fyscience import sherpa
+from fyscience.policy_store import PolicyStore, build_store
+from fyscience.schemas import OAPathway
+from fyscience.sherpa import classify_publications
+
+ASSETS_PATH = os.path.join(os.path.dirname(__file__), "assets")
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _crawl(issns):
+    with open(os.path.join(ASSETS_PATH, "publishers.json"), "r") as fh:
+        publishers = json.load(fh)["items"]
+
+    for issn in issns:
+        selected_publishers = [p for p in publishers if issn in json.dumps(p)]
+        yield issn, *classify_publications({"items": selected_publishers}), 0.0
+
+
+def test_policy_store_get(tmp_path):
+    path = str(tmp_path / "policy-store.sqlite3")
+    build_store(_crawl(["1179-3163", "2050-084X", "DOESNT-EXIST"]), path)
+    store = PolicyStore(path, timer=lambda: 0.0)
+
+    assert store.get("1179-3163") == (OAPathway.other, None)
+    assert store.get("DOESNT-EXIST") == (OAPathway.not_found, None)
+    assert store.get("1234-1234") is None
+
+    pathway, details = store.get("2050-084x")
+    assert pathway is OAPathway.nocost
+    assert details[0]["sherpa_publication_uri"].startswith(
+        "https://v2.sherpa.ac.uk/id/publication/"
+    )
+
+
+def test_policy_store_ignores_stale_entries(tmp_path):
+    path = str(tmp_path / "policy-store.sqlite3")
+    build_store(_crawl(["1179-3163"]), path)
+    timer = FakeTimer()
+    store = PolicyStore(path, max_age=60, timer=timer)
+
+    timer.now = 59
+    assert store.get("1179-3163") == (OAPathway.other, None)
+
+    timer.now = 60
+    assert store.get("1179-3163") is None
+
+
+def test_get_pathway_from_policy_store(tmp_path, monkeypatch):
+    path = str(tmp_path / "policy-store.sqlite3")
+    build_store(_crawl(["1179-3163"]), path)
+    store = PolicyStore(path, timer=lambda: 0.0)
+
+    async def mock_get_publisher(url):
+        raise AssertionError("The Sherpa API must not be queried")
+
+    monkeypatch.setattr("fyscience.sherpa.upstream.get", mock_get_publisher)
+    monkeypatch.setattr(sherpa, "get_policy_store", lambda: store)
+
+    assert sherpa.get_pathway("1179-3163", "DUMMY-KEY") == (OAPathway.other, None)
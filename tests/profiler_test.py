@@ -0,0 +1,42 @@
+import time
+
+from fyscience.profiler import SamplingProfiler, profile_name, remove_old_profiles
+
+
+def busy_wait(seconds):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+def test_profiler_samples_calling_thread(tmp_path):
+    profiler = SamplingProfiler(interval=0.001)
+    profiler.start()
+    busy_wait(0.1)
+    profiler.stop()
+
+    assert sum(profiler.samples.values()) > 0
+    stack, count = profiler.folded().splitlines()[0].rsplit(" ", 1)
+    assert stack.split(";")[-2:] == [
+        f"{__name__}:test_profiler_samples_calling_thread",
+        f"{__name__}:busy_wait",
+    ]
+    assert int(count) > 0
+
+    path = tmp_path / "profiles" / profile_name("/api/papers")
+    profiler.write(str(path))
+    assert path.read_text() == profiler.folded()
+
+
+def test_profile_name():
+    assert profile_name("/api/papers").endswith("-api_papers.folded")
+
+
+def test_remove_old_profiles(tmp_path):
+    names = [f"{1000 + i}-1-api_papers.folded" for i in range(5)]
+    for name in names + ["notes.txt"]:
+        (tmp_path / name).write_text("")
+
+    remove_old_profiles(str(tmp_path), keep=2)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == names[3:] + ["notes.txt"]
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import httpx
+import pytest
+
+from fyscience import upstream
+from fyscience.rate_limiter import BACKGROUND, SharedRateLimiter
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_rate_limiter_is_shared_across_instances(tmp_path):
+    timer = FakeTimer()
+    path = str(tmp_path / "rate-limits.sqlite3")
+    limits = {"v2.sherpa.ac.uk": (2, 2)}
+    worker_1 = SharedRateLimiter(path, limits=limits, timer=timer)
+    worker_2 = SharedRateLimiter(path, limits=limits, timer=timer)
+
+    assert worker_1.try_acquire("v2.sherpa.ac.uk") == 0
+    assert worker_2.try_acquire("v2.sherpa.ac.uk") == 0
+    assert worker_1.try_acquire("v2.sherpa.ac.uk") == 0.5
+
+    timer.now = 0.5
+    assert worker_2.try_acquire("v2.sherpa.ac.uk") == 0
+    assert worker_1.try_acquire("zenodo.org") == 0
+
+
+def test_rate_limiter_keeps_reserve_for_interactive_calls(tmp_path):
+    limiter = SharedRateLimiter(
+        str(tmp_path / "rate-limits.sqlite3"),
+        limits={"v2.sherpa.ac.uk": (1, 4)},
+        reserve=0.5,
+        timer=FakeTimer(),
+    )
+
+    assert limiter.try_acquire("v2.sherpa.ac.uk", BACKGROUND) == 0
+    assert limiter.try_acquire("v2.sherpa.ac.uk", BACKGROUND) == 0
+    assert limiter.try_acquire("v2.sherpa.ac.uk", BACKGROUND) == 1
+    assert limiter.try_acquire("v2.sherpa.ac.uk") == 0
+    assert limiter.try_acquire("v2.sherpa.ac.uk") == 0
+    assert limiter.try_acquire("v2.sherpa.ac.uk") == 1
+
+
+@pytest.mark.anyio
+async def test_request_waits_for_rate_limit(monkeypatch, tmp_path):
+    limiter = SharedRateLimiter(
+        str(tmp_path / "rate-limits.sqlite3"), limits={"zenodo.org": (20, 1)}
+    )
+    monkeypatch.setattr("fyscience.upstream.get_rate_limiter", lambda: limiter)
+
+    async def mock_request(self, method, url, **kwargs):
+        return httpx.Response(200)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+
+    started_at = time.monotonic()
+    for _ in range(3):
+        await upstream.get("https://zenodo.org/api/records")
+    assert time.monotonic() - started_at >= 0.09
+
+    with upstream.deadline(0.01):
+        with pytest.raises(upstream.DeadlineExceeded):
+            await upstream.get("https://zenodo.org/api/records")
+    await upstream.aclose()
+
+
+@pytest.mark.anyio
+async def test_request_takes_tokens_off_the_event_loop(monkeypatch, tmp_path):
+    limiter = SharedRateLimiter(str(tmp_path / "rate-limits.sqlite3"))
+    threads = []
+
+    def try_acquire(host, priority):
+        threads.append(threading.get_ident())
+        return 0.0
+
+    monkeypatch.setattr(limiter, "try_acquire", try_acquire)
+    monkeypatch.setattr("fyscience.upstream.get_rate_limiter", lambda: limiter)
+
+    async def mock_request(self, method, url, **kwargs):
+        return httpx.Response(200)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+
+    await upstream.get("https://zenodo.org/api/records")
+    assert len(threads) == 1
+    assert threading.get_ident() not in threads
+    await upstream.aclose()
@@ -0,0 +1,126 @@
+import httpx
+import pytest
+
+from fyscience import upstream
+from fyscience.retry import (
+    RetryBudget,
+    RetryPolicy,
+    parse_retry_after,
+    set_retry_policy,
+)
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, max_tokens=1)
+
+    assert budget.withdraw()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert not budget.withdraw()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+@pytest.mark.parametrize(
+    "headers,expected",
+    [
+        ({}, None),
+        ({"retry-after": "2"}, 2.0),
+        ({"retry-after": "-1"}, 0.0),
+        ({"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"}, 0.0),
+        ({"retry-after": "soon"}, None),
+    ],
+)
+def test_parse_retry_after(headers, expected):
+    assert parse_retry_after(httpx.Response(429, headers=headers)) == expected
+
+
+@pytest.mark.parametrize(
+    "method,status_code,error,expected",
+    [
+        ("GET", 200, None, False),
+        ("GET", 404, None, False),
+        ("GET", 429, None, True),
+        ("GET", 503, None, True),
+        ("GET", None, httpx.ReadTimeout("timeout"), True),
+        ("POST", 429, None, True),
+        ("POST", 503, None, False),
+        ("POST", None, httpx.ReadTimeout("timeout"), False),
+        ("POST", None, httpx.ConnectError("refused"), True),
+    ],
+)
+def test_is_retryable(method, status_code, error, expected):
+    response = None if status_code is None else httpx.Response(status_code)
+
+    assert RetryPolicy().is_retryable(method, response, error) is expected
+
+
+def test_delay():
+    policy = RetryPolicy(base_delay=0.1, max_delay=1.0, random=lambda: 1.0)
+
+    assert policy.delay(1) == 0.2
+    assert policy.delay(5) == 1.0
+    assert policy.delay(1, httpx.Response(429, headers={"retry-after": "0.5"})) == 0.5
+    assert policy.delay(1, httpx.Response(429, headers={"retry-after": "60"})) is None
+
+
+@pytest.mark.anyio
+async def test_request_retries_throttled_calls(monkeypatch):
+    responses = [
+        httpx.Response(429, headers={"retry-after": "0"}),
+        httpx.Response(503),
+        httpx.Response(200),
+    ]
+
+    async def mock_request(self, method, url, **kwargs):
+        return responses.pop(0)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    set_retry_policy("zenodo.org", RetryPolicy(base_delay=0.001))
+
+    response = await upstream.get("https://zenodo.org/api/records")
+    await upstream.aclose()
+
+    assert response.status_code == 200
+    assert responses == []
+
+
+@pytest.mark.anyio
+async def test_request_stops_retrying_once_budget_is_used_up(monkeypatch):
+    calls = []
+
+    async def mock_request(self, method, url, **kwargs):
+        calls.append(url)
+        raise httpx.ConnectError("refused")
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    set_retry_policy(
+        "zenodo.org",
+        RetryPolicy(base_delay=0.001, budget=RetryBudget(ratio=0, max_tokens=1)),
+    )
+
+    for _ in range(2):
+        with pytest.raises(upstream.UpstreamError) as error:
+            await upstream.get("https://zenodo.org/api/records")
+        assert isinstance(error.value.__cause__, httpx.ConnectError)
+    await upstream.aclose()
+
+    assert len(calls) == 3
+
+
+@pytest.mark.anyio
+async def test_request_does_not_retry_past_deadline(monkeypatch):
+    calls = []
+
+    async def mock_request(self, method, url, **kwargs):
+        calls.append(url)
+        return httpx.Response(429, headers={"retry-after": "1"})
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+
+    with upstream.deadline(0.5):
+        response = await upstream.get("https://zenodo.org/api/records")
+    await upstream.aclose()
+
+    assert response.status_code == 429
+    assert len(calls) == 1
@@ -1,14 +1,17 @@
-from fyscience.routers.api import extract_doi
+import asyncio
+import json
+import re
+
+import httpx
+import pytest
+
+from fyscience.cache import TTLCache
+from fyscience.routers.api import extract_doi, normalize_doi
 from fastapi.testclient import TestClient
 
-from fyscience.schemas import (
-    OAPathway,
-    PaperWithOAPathway,
-    FullPaper,
-    PaperWithOAStatus,
-)
-from fyscience import main
-from fyscience.routers.deps import Settings, get_settings
+from fyscience.schemas import OAPathway, FullPaper, Author
+from fyscience import main, metrics, upstream
+from fyscience.routers.deps import Settings, get_paper_cache, get_settings
 
 
 def get_settings_override():
@@ -16,17 +19,23 @@ def get_settings_override():
 
 
 main.app.dependency_overrides[get_settings] = get_settings_override
+# A fresh cache per request, so papers aren't cached across tests
+main.app.dependency_overrides[get_paper_cache] = lambda: TTLCache()
 
 
 def test_no_author_found(monkeypatch, client: TestClient):
     providers = [
-        "semantic_scholar.get_author_with_papers",
-        "semantic_scholar.get_author_id",
-        "orcid.get_author_with_papers",
-        "crossref.get_author_with_papers",
+        "semantic_scholar.get_author_with_papers_async",
+        "semantic_scholar.get_author_id_async",
+        "orcid.get_author_with_papers_async",
+        "crossref.get_author_with_papers_async",
     ]
+
+    async def mock_provider(*a, **kw):
+        return None
+
     for provider in providers:
-        monkeypatch.setattr(f"fyscience.routers.api.{provider}", lambda *a, **kw: None)
+        monkeypatch.setattr(f"fyscience.routers.api.{provider}", mock_provider)
 
     r = client.get("/api/authors?profile=Some+Author")
     assert r.status_code == 404
@@ -43,20 +52,12 @@ def test_get_paper(monkeypatch, client: TestClient) -> None:
     is_open_access = False
     oa_pathway = OAPathway.nocost.value
 
-    monkeypatch.setattr(
-        "fyscience.routers.api.unpaywall_get_paper",
-        lambda *a, **kw: FullPaper(doi=doi, issn=issn, is_open_access=is_open_access),
-    )
-    monkeypatch.setattr(
-        "fyscience.routers.api.validate_oa_status_from_s2_and_zenodo",
-        lambda *a, **kw: PaperWithOAStatus(
-            doi=doi, issn=issn, is_open_access=is_open_access
-        ),
-    )
-    monkeypatch.setattr(
-        "fyscience.routers.api.oa_pathway",
-        lambda paper, **kw: PaperWithOAPathway(oa_pathway=oa_pathway, **paper.dict()),
-    )
+    async def mock_enrich_paper(*a, **kw):
+        return FullPaper(
+            doi=doi, issn=issn, is_open_access=is_open_access, oa_pathway=oa_pathway
+        )
+
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
 
     r = client.get(f"/api/papers?paper_id={doi}")
     assert r.status_code == 200
@@ -67,6 +68,102 @@ def test_get_paper(monkeypatch, client: TestClient) -> None:
     assert paper["issn"] == issn
 
 
+def test_get_paper_server_timing(monkeypatch, client: TestClient) -> None:
+    async def mock_request(self, method, url, **kwargs):
+        return httpx.Response(200)
+
+    @metrics.provider_function
+    async def get_record(doi):
+        return await upstream.get(f"https://zenodo.org/api/records?q={doi}")
+
+    async def mock_enrich_paper(doi, **kw):
+        await get_record(doi)
+        return FullPaper(doi=doi, issn="1234-1234", oa_pathway=OAPathway.nocost)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
+
+    r = client.get("/api/papers?paper_id=10.1011/111111")
+    assert re.fullmatch(
+        r'api_test\.get_record;dur=\d+\.\d;desc="cache=none status=200 retries=0"',
+        r.headers["server-timing"],
+    )
+
+
+def test_get_papers(monkeypatch, client: TestClient) -> None:
+    dois = ["10.1007/s00580-005-0536-8", "10.1011/111111", "10.1007/s00580-005-0536-8"]
+
+    async def mock_enrich_paper(doi, **kw):
+        return FullPaper(doi=doi, oa_pathway=OAPathway.nocost.value)
+
+    async def mock_s2_get_paper(*a, **kw):
+        return None
+
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
+    monkeypatch.setattr(
+        "fyscience.routers.api.semantic_scholar.get_paper_async", mock_s2_get_paper
+    )
+
+    r = client.post("/api/papers:batch", json={"paper_ids": dois + ["unknownS2Id"]})
+    assert r.status_code == 200
+    assert [paper["doi"] for paper in r.json()] == dois[:2]
+
+
+def test_get_papers_batch_size(client: TestClient) -> None:
+    r = client.post("/api/papers:batch", json={"paper_ids": []})
+    assert r.status_code == 422
+
+    r = client.post(
+        "/api/papers:batch", json={"paper_ids": [f"10.1011/{i}" for i in range(1000)]}
+    )
+    assert r.status_code == 422
+
+
+def mock_author_with_delayed_papers(monkeypatch, delays):
+    async def mock_get_author_with_papers(*a, **kw):
+        return Author(name="Some Author", paper_ids=list(delays))
+
+    async def mock_enrich_paper(doi, **kw):
+        await asyncio.sleep(delays[doi])
+        return FullPaper(doi=doi)
+
+    monkeypatch.setattr(
+        "fyscience.routers.api.orcid.get_author_with_papers_async",
+        mock_get_author_with_papers,
+    )
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
+
+
+def test_stream_author_papers(monkeypatch, client: TestClient) -> None:
+    delays = {"10.1011/slow": 0.05, "10.1011/fast": 0.0}
+    mock_author_with_delayed_papers(monkeypatch, delays)
+
+    r = client.get("/api/authors/0000-0000-0000-0000/papers/stream")
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+
+    papers = [json.loads(line) for line in r.text.splitlines()]
+    assert [paper["doi"] for paper in papers] == ["10.1011/fast", "10.1011/slow"]
+
+
+def test_stream_author_papers_as_server_sent_events(
+    monkeypatch, client: TestClient
+) -> None:
+    mock_author_with_delayed_papers(monkeypatch, {"10.1011/111111": 0.0})
+
+    r = client.get(
+        "/api/authors/https://orcid.org/0000-0000-0000-0000/papers/stream",
+        headers={"accept": "text/event-stream"},
+    )
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+
+    events = r.text.strip().split("\n\n")
+    assert events[0].startswith("event: paper\ndata: ")
+    assert json.loads(events[0].split("data: ")[1])["doi"] == "10.1011/111111"
+    assert events[-1] == "event: end\ndata: {}"
+
+
 def test_log_endpoint(caplog, client: TestClient) -> None:
     event = "something_grand"
     message = "Details about how grand."
@@ -84,3 +181,223 @@ def test_extract_doi():
     assert only_doi == extract_doi(f"https://doi.org/{only_doi}")
     assert only_doi == extract_doi(f"http://doi.org/{only_doi}")
     assert "http://example.com/" == extract_doi("http://example.com/")
+
+
+def test_normalize_doi():
+    doi = "10.1234/abc.42424242"
+    assert doi == normalize_doi(doi)
+    assert doi == normalize_doi("10.1234/ABC.42424242")
+    assert doi == normalize_doi(f"https://doi.org/{doi}")
+    assert doi == normalize_doi(f"doi:{doi}")
+    assert doi == normalize_doi("https%3A%2F%2Fdoi.org%2F10.1234%2Fabc.42424242")
+
+
+def test_get_paper_is_cached(monkeypatch, client: TestClient) -> None:
+    paper_cache = TTLCache()
+    monkeypatch.setitem(
+        main.app.dependency_overrides, get_paper_cache, lambda: paper_cache
+    )
+    monkeypatch.setitem(
+        main.app.dependency_overrides,
+        get_settings,
+        lambda: Settings(
+            sherpa_api_key="DUMMY-API-KEY",
+            unpaywall_email="TEST@MAIL.LOCAL",
+            admin_token="DUMMY-ADMIN-TOKEN",
+        ),
+    )
+    calls = []
+
+    async def mock_enrich_paper(doi, **kw):
+        calls.append(doi)
+        return FullPaper(doi=doi, issn="1234-1234", oa_pathway=OAPathway.nocost)
+
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
+
+    assert client.get("/api/papers?paper_id=10.1011/ABC").status_code == 200
+    r = client.get("/api/papers?paper_id=https://doi.org/10.1011/abc")
+    assert r.json()["doi"] == "10.1011/ABC"
+    assert calls == ["10.1011/ABC"]
+
+    r = client.delete("/api/admin/paper-cache?doi=10.1011/abc")
+    assert r.status_code == 403
+    r = client.delete(
+        "/api/admin/paper-cache?doi=10.1011/abc",
+        headers={"authorization": "Bearer DUMMY-ADMIN-TOKEN"},
+    )
+    assert r.status_code == 204
+
+    client.get("/api/papers?paper_id=10.1011/abc")
+    assert calls == ["10.1011/ABC", "10.1011/abc"]
+
+
+def test_degraded_paper_is_not_cached(monkeypatch, client: TestClient) -> None:
+    paper_cache = TTLCache()
+    monkeypatch.setitem(
+        main.app.dependency_overrides, get_paper_cache, lambda: paper_cache
+    )
+    calls = []
+
+    async def mock_enrich_paper(doi, **kw):
+        calls.append(doi)
+        return FullPaper(
+            doi=doi,
+            issn="1234-1234",
+            oa_pathway=OAPathway.not_found,
+            degraded=["sherpa"],
+        )
+
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
+
+    for _ in range(2):
+        r = client.get("/api/papers?paper_id=10.1011/abc")
+        assert r.json()["degraded"] == ["sherpa"]
+    assert calls == ["10.1011/abc", "10.1011/abc"]
+    assert len(paper_cache) == 0
+
+
+def test_get_upstream_stats(monkeypatch, client: TestClient) -> None:
+    monkeypatch.setitem(
+        main.app.dependency_overrides,
+        get_settings,
+        lambda: Settings(
+            sherpa_api_key="DUMMY-API-KEY",
+            unpaywall_email="TEST@MAIL.LOCAL",
+            admin_token="DUMMY-ADMIN-TOKEN",
+        ),
+    )
+
+    async def mock_request(self, method, url, **kwargs):
+        return httpx.Response(404)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    client.get("/api/authors?profile=0000-0002-1825-0097")
+
+    assert client.get("/api/admin/upstreams").status_code == 403
+    r = client.get(
+        "/api/admin/upstreams", headers={"authorization": "Bearer DUMMY-ADMIN-TOKEN"}
+    )
+    assert r.status_code == 200
+    assert r.json()["pub.orcid.org"] == {
+        "limit": 10,
+        "in_flight": 0,
+        "queued": 0,
+        "circuit": "closed",
+    }
+
+
+def test_admin_endpoints_disabled_without_token(client: TestClient) -> None:
+    r = client.delete(
+        "/api/admin/paper-cache", headers={"authorization": "Bearer None"}
+    )
+    assert r.status_code == 404
+
+
+def test_admin_endpoints_disabled_with_empty_token(
+    monkeypatch, tmp_path, client: TestClient
+) -> None:
+    monkeypatch.setitem(
+        main.app.dependency_overrides,
+        get_settings,
+        lambda: Settings(
+            sherpa_api_key="DUMMY-API-KEY",
+            unpaywall_email="TEST@MAIL.LOCAL",
+            admin_token="",
+            profile_dir=str(tmp_path),
+        ),
+    )
+    r = client.get("/api/admin/upstreams", headers={"authorization": "Bearer "})
+    assert r.status_code == 404
+
+    async def mock_enrich_paper(doi, **kw):
+        return FullPaper(doi=doi, issn="1234-1234", oa_pathway=OAPathway.nocost)
+
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
+
+    r = client.get("/api/papers?paper_id=10.1011/111111", headers={"x-profile": ""})
+    assert "x-profile" not in r.headers
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize(
+    "authorization",
+    ["DUMMY-ADMIN-TOKEN", "Basic DUMMY-ADMIN-TOKEN", "Bearer Bearer DUMMY-ADMIN-TOKEN"],
+)
+def test_admin_endpoints_require_bearer_token(
+    authorization, monkeypatch, client: TestClient
+) -> None:
+    monkeypatch.setitem(
+        main.app.dependency_overrides,
+        get_settings,
+        lambda: Settings(
+            sherpa_api_key="DUMMY-API-KEY",
+            unpaywall_email="TEST@MAIL.LOCAL",
+            admin_token="DUMMY-ADMIN-TOKEN",
+        ),
+    )
+    r = client.get("/api/admin/upstreams", headers={"authorization": authorization})
+    assert r.status_code == 403
+
+
+def test_get_paper_profiled(monkeypatch, tmp_path, client: TestClient) -> None:
+    monkeypatch.setitem(
+        main.app.dependency_overrides,
+        get_settings,
+        lambda: Settings(
+            sherpa_api_key="DUMMY-API-KEY",
+            unpaywall_email="TEST@MAIL.LOCAL",
+            admin_token="DUMMY-ADMIN-TOKEN",
+            profile_dir=str(tmp_path),
+        ),
+    )
+
+    async def mock_enrich_paper(doi, **kw):
+        return FullPaper(doi=doi, issn="1234-1234", oa_pathway=OAPathway.nocost)
+
+    monkeypatch.setattr("fyscience.routers.api.enrich_paper", mock_enrich_paper)
+
+    r = client.get("/api/papers?paper_id=10.1011/111111")
+    assert "x-profile" not in r.headers
+    assert list(tmp_path.iterdir()) == []
+
+    r = client.get(
+        "/api/papers?paper_id=10.1011/111111",
+        headers={"x-profile": "DUMMY-ADMIN-TOKEN"},
+    )
+    assert r.status_code == 200
+    name = r.headers["x-profile"]
+    assert (tmp_path / name).is_file()
+
+    r = client.get(
+        f"/api/admin/profiles/{name}",
+        headers={"authorization": "Bearer DUMMY-ADMIN-TOKEN"},
+    )
+    assert r.status_code == 200
+    assert r.text == (tmp_path / name).read_text()
+
+
+def test_get_memory_report(monkeypatch, client: TestClient) -> None:
+    monkeypatch.setitem(
+        main.app.dependency_overrides,
+        get_settings,
+        lambda: Settings(
+            sherpa_api_key="DUMMY-API-KEY",
+            unpaywall_email="TEST@MAIL.LOCAL",
+            admin_token="DUMMY-ADMIN-TOKEN",
+        ),
+    )
+    headers = {"authorization": "Bearer DUMMY-ADMIN-TOKEN"}
+
+    assert client.get("/api/admin/memory").status_code == 403
+    r = client.get("/api/admin/memory", headers=headers)
+    assert r.status_code == 200
+    assert r.json()["tracing"] is False
+    assert set(r.json()["caches"]) >= {"pathway", "paper", "negative", "shared"}
+
+    assert client.put("/api/admin/memory/tracing", headers=headers).status_code == 204
+    try:
+        r = client.get("/api/admin/memory?limit=3", headers=headers)
+    finally:
+        client.delete("/api/admin/memory/tracing", headers=headers)
+    assert r.json()["tracing"] is True
+    assert len(r.json()["top"]) == 3
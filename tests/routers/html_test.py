@@ -29,13 +29,17 @@ def test_hit_human_error_page(client: TestClient) -> None:
 
 def test_no_author_found(monkeypatch, client: TestClient):
     providers = [
-        "semantic_scholar.get_author_with_papers",
-        "semantic_scholar.get_author_id",
-        "orcid.get_author_with_papers",
-        "crossref.get_author_with_papers",
+        "semantic_scholar.get_author_with_papers_async",
+        "semantic_scholar.get_author_id_async",
+        "orcid.get_author_with_papers_async",
+        "crossref.get_author_with_papers_async",
     ]
+
+    async def mock_provider(*a, **kw):
+        return None
+
     for provider in providers:
-        monkeypatch.setattr(f"fyscience.routers.api.{provider}", lambda *a, **kw: None)
+        monkeypatch.setattr(f"fyscience.routers.api.{provider}", mock_provider)
 
     r = client.get("/search?query=Some+Author")
     assert r.status_code == 404
@@ -1,5 +1,4 @@
 import pytest
-from urllib3.exceptions import NameResolutionError
 
 from fyscience.semantic_scholar import (
     get_paper,
@@ -7,18 +6,23 @@ from fyscience.semantic_scholar import (
     extract_profile_id_from_url,
     _get_request,
 )
+from fyscience.upstream import UpstreamError
 
 
 def test_get_paper_no_paper(monkeypatch):
-    monkeypatch.setattr("fyscience.semantic_scholar._get_paper", lambda *a, **kw: None)
+    async def mock_get_paper(*a, **kw):
+        return None
+
+    monkeypatch.setattr("fyscience.semantic_scholar._get_paper", mock_get_paper)
     paper = get_paper("irrelevant_dummy_id")
     assert paper is None
 
 
 def test_get_paper_no_doi(monkeypatch):
-    monkeypatch.setattr(
-        "fyscience.semantic_scholar._get_paper", lambda *a, **kw: Paper(doi=None)
-    )
+    async def mock_get_paper(*a, **kw):
+        return Paper(doi=None)
+
+    monkeypatch.setattr("fyscience.semantic_scholar._get_paper", mock_get_paper)
     paper = get_paper("irrelevant_dummy_id")
     assert paper is None
 
@@ -59,27 +63,29 @@ def test_extract_profile_id_from_url(url, profile_id):
     assert extracted_id == profile_id
 
 
-def test_dev_vs_prod_endpoint(monkeypatch):
-    def mock_get_dev(url, **kwargs):
+@pytest.mark.anyio
+async def test_dev_vs_prod_endpoint(monkeypatch):
+    async def mock_get_dev(url, **kwargs):
         assert url.startswith("https://api.semanticscholar.org")
         return None
 
-    monkeypatch.setattr("fyscience.semantic_scholar.requests.get", mock_get_dev)
-    _get_request("someEndpoint/123", api_key=None)
+    monkeypatch.setattr("fyscience.semantic_scholar.upstream.get", mock_get_dev)
+    await _get_request("someEndpoint/123", api_key=None)
 
-    def mock_get_prod(url, headers, **kwargs):
+    async def mock_get_prod(url, headers, **kwargs):
         assert url.startswith("https://partner.semanticscholar.org")
         assert "x-api-key" in headers
         return None
 
-    monkeypatch.setattr("fyscience.semantic_scholar.requests.get", mock_get_prod)
-    _get_request("someEndpoint/123", api_key="api_key_dummy")
+    monkeypatch.setattr("fyscience.semantic_scholar.upstream.get", mock_get_prod)
+    await _get_request("someEndpoint/123", api_key="api_key_dummy")
 
 
-def test_name_resolution_error(monkeypatch):
-    def mock_get_dev(url, **kwargs):
-        raise NameResolutionError(host="non-existing-host", conn=None, reason=None)
+@pytest.mark.anyio
+async def test_name_resolution_error(monkeypatch):
+    async def mock_get_dev(url, **kwargs):
+        raise UpstreamError("Name or service not known")
 
-    monkeypatch.setattr("fyscience.semantic_scholar.requests.get", mock_get_dev)
-    result = _get_request("someEndpoint/123", api_key=None)
+    monkeypatch.setattr("fyscience.semantic_scholar.upstream.get", mock_get_dev)
+    result = await _get_request("someEndpoint/123", api_key=None)
     assert result == None
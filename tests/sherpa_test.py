@@ -2,7 +2,7 @@ import os
 import json
 
 import pytest
-from requests import Response
+from httpx import Response
 from fyscience.sherpa import get_pathway, has_no_cost_oa_policy
 from fyscience.schemas import OAPathway
 
@@ -22,27 +22,25 @@ def test_get_pathway_successes(issn, pathway, monkeypatch):
     with open(os.path.join(ASSETS_PATH, "publishers.json"), "r") as fh:
         publishers = json.load(fh)["items"]
 
-    def mock_get_publisher(url):
+    async def mock_get_publisher(url):
         publisher_issn = url.split('"')[-2]
         selected_publishers = [p for p in publishers if publisher_issn in json.dumps(p)]
-        response = Response()
-        response.status_code = 200
+        response = Response(200)
         response._content = json.dumps({"items": selected_publishers}).encode("utf-8")
         return response
 
-    monkeypatch.setattr("fyscience.sherpa.requests.get", mock_get_publisher)
+    monkeypatch.setattr("fyscience.sherpa.upstream.get", mock_get_publisher)
 
     sherpa_pathway = get_pathway(issn=issn, api_key="DUMMY-KEY")[0]
     assert sherpa_pathway is pathway
 
 
 def test_get_pathway_request_error(monkeypatch):
-    def mock_get_publisher(url):
-        response = Response()
-        response.status_code = 404
+    async def mock_get_publisher(url):
+        response = Response(404)
         return response
 
-    monkeypatch.setattr("fyscience.sherpa.requests.get", mock_get_publisher)
+    monkeypatch.setattr("fyscience.sherpa.upstream.get", mock_get_publisher)
 
     pathway = get_pathway(issn="1234-1234", api_key="DUMMY-KEY")[0]
     assert pathway == OAPathway.not_found
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from fyscience import singleflight
+from fyscience.schemas import FullPaper
+from fyscience.singleflight import single_flight
+
+
+@pytest.mark.anyio
+async def test_single_flight_coalesces_concurrent_calls():
+    calls = []
+
+    @single_flight("test_coalesces")
+    async def get_paper(doi, email=None):
+        calls.append(doi)
+        await asyncio.sleep(0.01)
+        return FullPaper(doi=doi)
+
+    papers = await asyncio.gather(
+        get_paper("10.1011/111111"),
+        get_paper("10.1011/111111", None),
+        get_paper(doi="10.1011/111111"),
+        get_paper("10.1011/222222"),
+    )
+
+    assert calls == ["10.1011/111111", "10.1011/222222"]
+    assert [p.doi for p in papers] == 3 * ["10.1011/111111"] + ["10.1011/222222"]
+    # Callers get their own copy to modify
+    assert papers[0] is not papers[1]
+    assert singleflight.stats()["test_coalesces"] == {
+        "calls": 4,
+        "coalesced": 2,
+        "in_flight": 0,
+    }
+
+    await get_paper("10.1011/111111")
+    assert calls == ["10.1011/111111", "10.1011/222222", "10.1011/111111"]
+
+
+@pytest.mark.anyio
+async def test_single_flight_survives_cancelled_caller():
+    calls = []
+
+    @single_flight("test_cancelled")
+    async def get_url(doi):
+        calls.append(doi)
+        await asyncio.sleep(0.01)
+        return "https://zenodo.org/1"
+
+    first = asyncio.ensure_future(get_url("10.1011/111111"))
+    second = asyncio.ensure_future(get_url("10.1011/111111"))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await second == "https://zenodo.org/1"
+    assert first.cancelled()
+    assert calls == ["10.1011/111111"]
+
+
+@pytest.mark.anyio
+async def test_single_flight_shares_exceptions():
+    @single_flight("test_exceptions")
+    async def get_url(doi):
+        await asyncio.sleep(0.01)
+        raise RuntimeError("dummy error")
+
+    results = await asyncio.gather(
+        get_url("10.1011/111111"), get_url("10.1011/111111"), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.anyio
+async def test_single_flight_copies_result_for_first_caller():
+    @single_flight("test_first_caller")
+    async def get_paper(doi):
+        await asyncio.sleep(0.01)
+        return {"v": "original"}
+
+    async def get_and_mutate(doi):
+        paper = await get_paper(doi)
+        paper["v"] = "mutated by first"
+        return paper
+
+    first, second = await asyncio.gather(
+        get_and_mutate("10.1011/111111"), get_paper("10.1011/111111")
+    )
+    assert first == {"v": "mutated by first"}
+    assert second == {"v": "original"}
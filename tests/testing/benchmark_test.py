@@ -0,0 +1,43 @@
+import httpx
+import pytest
+
+from fyscience.testing.benchmark import SCENARIOS, percentile, run_load, summarize
+from fyscience.testing.upstreams import FakeUpstreams
+
+
+def test_percentile():
+    values = [0.1 * i for i in range(1, 101)]
+
+    assert percentile([], 50) is None
+    assert percentile([0.3], 99) == 0.3
+    assert percentile(values, 50) == pytest.approx(5.0)
+    assert percentile(values, 99) == pytest.approx(9.9)
+
+
+def test_summarize():
+    assert summarize([0.1, 0.2, 0.3, 0.4], [200, 404, 503, 0], 2.0) == {
+        "requests": 4,
+        "errors": 2,
+        "throughput": 2.0,
+        "p50": 0.2,
+        "p95": 0.4,
+        "p99": 0.4,
+    }
+
+
+def test_scenarios_ask_for_different_papers_and_authors():
+    for path in SCENARIOS.values():
+        assert len({path(i) for i in range(100)}) == 100
+
+
+@pytest.mark.anyio
+async def test_run_load():
+    with FakeUpstreams() as fakes:
+        async with httpx.AsyncClient(base_url=fakes.base_urls["zenodo.org"]) as client:
+            result = await run_load(
+                client, ['/api/records?q=doi:"10.1011/111111"'] * 20, concurrency=5
+            )
+
+    assert result["requests"] == 20
+    assert result["errors"] == 0
+    assert fakes.upstreams["zenodo"].calls[200] == 20
@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from fyscience import (
+    crossref,
+    openaccessbutton,
+    orcid,
+    semantic_scholar,
+    sherpa,
+    unpaywall,
+    upstream,
+    zenodo,
+)
+from fyscience.retry import RetryPolicy, set_retry_policy
+from fyscience.schemas import OAPathway
+from fyscience.testing import payloads
+from fyscience.testing.upstreams import Behaviour, FakeUpstreams, lognormal
+
+
+@pytest.fixture(scope="module")
+def fakes():
+    with FakeUpstreams({"zenodo": Behaviour(error_rate=1.0)}) as fakes:
+        yield fakes
+
+
+@pytest.mark.anyio
+async def test_providers_parse_stand_in_payloads(fakes):
+    doi = "10.1016/j.chaos.2019.109470"
+    with fakes.route_upstream_calls():
+        paper = await unpaywall.get_paper_async(doi, "TEST@MAIL.LOCAL")
+        pathway, _ = await sherpa.get_pathway_async(paper.issn, "DUMMY-API-KEY")
+        s2_paper = await semantic_scholar.get_paper_async(doi)
+        author_id = await semantic_scholar.get_author_id_async("D. Grossberger")
+        s2_author = await semantic_scholar.get_author_with_papers_async(author_id)
+        crossref_author = await crossref.get_author_with_papers_async("Grossberger")
+        orcid_author = await orcid.get_author_with_papers_async("0000-0002-0000-0001")
+        permissions = await openaccessbutton.get_permissions_async(doi)
+        metadata = await openaccessbutton.get_paper_metadata_async(doi)
+    await upstream.aclose()
+
+    assert paper.issn == "0960-0779" and paper.is_open_access is False
+    assert pathway in [OAPathway.nocost, OAPathway.not_found]
+    assert s2_paper.doi == doi
+    assert author_id.isnumeric()
+    assert s2_author.provider == "semantic_scholar" and s2_author.paper_ids
+    assert len(crossref_author.paper_ids) == 20
+    assert orcid_author.profile_url == "https://orcid.org/0000-0002-0000-0001"
+    assert orcid_author.paper_ids
+    assert "best_permission" in permissions
+    assert metadata["metadata"]["doi"] == doi
+    assert fakes.upstreams["orcid"].calls[200] == 1
+
+
+@pytest.mark.anyio
+async def test_stand_in_errors(fakes):
+    set_retry_policy("zenodo.org", RetryPolicy(max_attempts=1))
+    with fakes.route_upstream_calls():
+        # Nothing is cached for upstream errors
+        assert await zenodo.get_open_access_url_async("10.1011/111111") is None
+    await upstream.aclose()
+
+    assert fakes.upstreams["zenodo"].calls[503] == 1
+
+
+def test_same_payload_per_identifier():
+    doi = payloads.dois()[0]
+
+    assert payloads.s2_paper(doi) == payloads.s2_paper(doi)
+    assert payloads.unpaywall_doi_object(doi)["journal_issn_l"] == "0023-9186"
+    assert "0000-0002-0000-0001" in payloads.orcid_record("0000-0002-0000-0001")
+    assert payloads.RECORDED_ORCID not in payloads.orcid_record("0000-0002-0000-0001")
+
+
+def test_lognormal():
+    rng = random.Random(0)
+    latencies = sorted(lognormal(0.1, 1.0)(rng) for _ in range(10000))
+
+    assert latencies[5000] == pytest.approx(0.1, rel=0.1)
+    assert latencies[9900] == pytest.approx(1.0, rel=0.2)
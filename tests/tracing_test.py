@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from fyscience import tracing
+
+
+class RecordingExporter(tracing.Exporter):
+    def __init__(self):
+        super().__init__()
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = RecordingExporter()
+    monkeypatch.setattr("fyscience.tracing.get_exporter", lambda: exporter)
+    return exporter
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        (None, (None, None)),
+        (
+            "105445AA7843BC8BF206B12000100000/1;o=1",
+            ("105445aa7843bc8bf206b12000100000", "0000000000000001"),
+        ),
+        (
+            "105445aa7843bc8bf206b12000100000",
+            ("105445aa7843bc8bf206b12000100000", None),
+        ),
+        ("not-a-trace/1;o=1", (None, None)),
+    ],
+)
+def test_parse_trace_context(header, expected):
+    assert tracing.parse_trace_context(header) == expected
+
+
+def test_span_is_noop_without_exporter(monkeypatch):
+    monkeypatch.setattr("fyscience.tracing.get_exporter", lambda: None)
+    with tracing.span("cache_lookup") as span:
+        span.set_attribute("hit", True)
+
+
+@pytest.mark.anyio
+async def test_spans_nest_across_tasks(exporter):
+    async def lookup(name):
+        with tracing.span(name):
+            await asyncio.sleep(0)
+
+    with pytest.raises(RuntimeError):
+        with tracing.span("enrich_paper", doi="10.1011/111111"):
+            await asyncio.gather(lookup("unpaywall"), lookup("sherpa"))
+            raise RuntimeError("dummy error")
+
+    unpaywall, sherpa, root = exporter.spans
+    assert root.parent_id is None
+    assert root.attributes == {
+        "doi": "10.1011/111111",
+        "error": "RuntimeError('dummy error')",
+    }
+    for child in [unpaywall, sherpa]:
+        assert child.trace_id == root.trace_id
+        assert child.parent_id == root.span_id
+        assert child.start_time <= child.end_time <= root.end_time
+
+
+def test_request_span_continues_cloud_trace(exporter, client: TestClient):
+    client.get("/api/logs", headers={"x-cloud-trace-context": f"{'a' * 32}/255;o=1"})
+
+    span = exporter.spans[-1]
+    assert span.name == "GET /api/logs"
+    assert span.trace_id == "a" * 32
+    assert span.parent_id == "00000000000000ff"
+    assert span.attributes["http.status_code"] == 405
+
+
+def test_exporter_writes_otlp_json_lines(tmp_path):
+    path = tmp_path / "spans.jsonl"
+    span = tracing.Span("cache_lookup", "a" * 32)
+    span.set_attribute("namespace", "sherpa")
+    span.end_time = span.start_time + 1000
+
+    tracing.Exporter(path=str(path)).flush([span])
+
+    exported = json.loads(path.read_text())
+    assert exported["traceId"] == "a" * 32
+    assert exported["attributes"] == [
+        {"key": "namespace", "value": {"stringValue": "sherpa"}}
+    ]
+    assert tracing.otlp_payload([span])["resourceSpans"][0]["scopeSpans"][0][
+        "spans"
+    ] == [exported]
@@ -0,0 +1,88 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from fyscience import unpaywall
+from fyscience.schemas import FullPaper
+from fyscience.unpaywall import to_full_paper
+from fyscience.unpaywall_snapshot import (
+    SnapshotIndex,
+    build_index,
+    load_unpaywall_snapshot,
+)
+
+ASSETS_PATH = os.path.join(os.path.dirname(__file__), "assets")
+
+
+@pytest.fixture
+def snapshot_index(tmp_path):
+    snapshot_path = tmp_path / "unpaywall.jsonl.gz"
+    with open(os.path.join(ASSETS_PATH, "unpaywall_subset.jsonl"), "rb") as src:
+        with gzip.open(snapshot_path, "wb") as dst:
+            dst.write(src.read())
+
+    index_path = str(tmp_path / "unpaywall-index.sqlite3")
+    build_index(
+        (
+            to_full_paper(record["doi"], record)
+            for record in load_unpaywall_snapshot(str(snapshot_path))
+        ),
+        index_path,
+        batch_size=3,
+    )
+    return SnapshotIndex(index_path)
+
+
+def test_snapshot_index_get(snapshot_index):
+    with open(os.path.join(ASSETS_PATH, "unpaywall_subset.jsonl")) as fh:
+        records = [json.loads(line) for line in fh]
+
+    for record in records:
+        paper = snapshot_index.get(record["doi"].upper())
+        assert paper.doi == record["doi"].upper()
+        assert paper.is_open_access == record["is_oa"]
+        assert paper.issn == record["journal_issn_l"]
+
+    assert snapshot_index.get("10.1011/not.in.snapshot") is None
+
+
+def test_to_full_paper():
+    paper = to_full_paper(
+        "10.1011/111111",
+        {
+            "is_oa": True,
+            "journal_issn_l": "1234-1234",
+            "title": "Some Title",
+            "year": 2020,
+            "journal_name": "Some Journal",
+            "z_authors": [{"given": "Erling", "family": "Erlang"}],
+            "best_oa_location": {"url_for_pdf": "https://some.repo/paper.pdf"},
+            "published_date": "2020-03-01",
+        },
+    )
+
+    assert paper == FullPaper(
+        doi="10.1011/111111",
+        issn="1234-1234",
+        is_open_access=True,
+        title="Some Title",
+        year=2020,
+        journal="Some Journal",
+        authors="Erling Erlang",
+        oa_location_url="https://some.repo/paper.pdf",
+        published_date="2020-03-01",
+    )
+
+
+def test_get_paper_from_snapshot_index(snapshot_index, monkeypatch):
+    async def mock_get_doi(*args, **kwargs):
+        raise AssertionError("The Unpaywall API must not be queried")
+
+    monkeypatch.setattr("fyscience.unpaywall.upstream.get", mock_get_doi)
+    monkeypatch.setattr(unpaywall, "get_snapshot_index", lambda: snapshot_index)
+
+    paper = unpaywall.get_paper("10.2307/1190590", "dummy@local.test")
+    assert paper.is_open_access
+    assert paper.issn == "0023-9186"
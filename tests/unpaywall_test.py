@@ -2,11 +2,10 @@ import os
 import json
 
 import pytest
-from requests import Response
+from httpx import Response
 
 from fyscience.unpaywall import get_paper, Paper, _extract_authors
 
-
 ASSETS_PATH = os.path.join(os.path.dirname(__file__), "assets")
 DMUMMY_PAPER = Paper(
     data_standard=2,
@@ -27,9 +26,8 @@ DMUMMY_PAPER = Paper(
     [(True, True, "1234-1234"), (False, False, "1234-1234")],
 )
 def test_get_paper(is_oa, expected_is_oa, issn, monkeypatch):
-    def mock_get_doi(*args, **kwargs):
-        response = Response()
-        response.status_code = 200
+    async def mock_get_doi(*args, **kwargs):
+        response = Response(200)
         response._content = json.dumps(
             {
                 "doi": "10.1080/555222222",
@@ -60,7 +58,7 @@ def test_get_paper(is_oa, expected_is_oa, issn, monkeypatch):
         ).encode("utf-8")
         return response
 
-    monkeypatch.setattr("fyscience.unpaywall.requests.get", mock_get_doi)
+    monkeypatch.setattr("fyscience.unpaywall.upstream.get", mock_get_doi)
 
     paper = get_paper("10.1011/irrelevant.dummy", "dummy@local.test")
 
@@ -69,12 +67,11 @@ def test_get_paper(is_oa, expected_is_oa, issn, monkeypatch):
 
 
 def test_get_paper_not_found(monkeypatch):
-    def mock_get_doi(*args, **kwargs):
-        response = Response()
-        response.status_code = 404
+    async def mock_get_doi(*args, **kwargs):
+        response = Response(404)
         return response
 
-    monkeypatch.setattr("fyscience.unpaywall.requests.get", mock_get_doi)
+    monkeypatch.setattr("fyscience.unpaywall.upstream.get", mock_get_doi)
     paper = get_paper("10.1011/irrelevant.dummy", "dummy@local.test")
     assert paper is None
 
@@ -131,3 +128,29 @@ def test_get_paper_with_no_email():
 )
 def test_extract_authors_first_author(authors, first_author):
     assert _extract_authors(authors).startswith(first_author)
+
+
+def test_get_paper_not_found_is_cached(monkeypatch):
+    calls = []
+
+    async def mock_get_doi(*args, **kwargs):
+        calls.append(args)
+        return Response(404)
+
+    monkeypatch.setattr("fyscience.unpaywall.upstream.get", mock_get_doi)
+    assert get_paper("10.1011/irrelevant.dummy", "dummy@local.test") is None
+    assert get_paper("10.1011/irrelevant.dummy", "dummy@local.test") is None
+    assert len(calls) == 1
+
+
+def test_get_paper_error_is_not_cached(monkeypatch):
+    calls = []
+
+    async def mock_get_doi(*args, **kwargs):
+        calls.append(args)
+        return Response(503)
+
+    monkeypatch.setattr("fyscience.unpaywall.upstream.get", mock_get_doi)
+    assert get_paper("10.1011/irrelevant.dummy", "dummy@local.test") is None
+    assert get_paper("10.1011/irrelevant.dummy", "dummy@local.test") is None
+    assert len(calls) == 2
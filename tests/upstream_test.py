@@ -0,0 +1,169 @@
+import asyncio
+import weakref
+
+import httpx
+import pytest
+
+from fyscience import upstream
+from fyscience.circuit_breaker import CircuitBreaker
+from fyscience.singleflight import single_flight
+
+
+@pytest.mark.anyio
+async def test_get_client_pools_per_host():
+    client = upstream.get_client("api.unpaywall.org")
+
+    assert upstream.get_client("api.unpaywall.org") is client
+    assert upstream.get_client("v2.sherpa.ac.uk") is not client
+
+    await upstream.aclose()
+    assert client.is_closed
+    assert upstream.get_client("api.unpaywall.org") is not client
+    await upstream.aclose()
+
+
+def test_run_sync():
+    async def coroutine(value):
+        return value
+
+    assert upstream.run_sync(coroutine(42)) == 42
+
+
+def test_run_sync_raises():
+    async def coroutine():
+        raise RuntimeError("dummy error")
+
+    with pytest.raises(RuntimeError):
+        upstream.run_sync(coroutine())
+
+
+@pytest.mark.anyio
+async def test_limit_concurrency(monkeypatch):
+    n_concurrent = 0
+    max_concurrent = 0
+
+    async def mock_request(self, method, url, **kwargs):
+        nonlocal n_concurrent, max_concurrent
+        n_concurrent += 1
+        max_concurrent = max(max_concurrent, n_concurrent)
+        await asyncio.sleep(0.01)
+        n_concurrent -= 1
+        return httpx.Response(200)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    upstream.limit_concurrency("zenodo.org", 2)
+    try:
+        await asyncio.gather(
+            *(upstream.get("https://zenodo.org/api/records") for _ in range(6))
+        )
+    finally:
+        upstream.limit_concurrency("zenodo.org", None)
+        await upstream.aclose()
+
+    assert max_concurrent == 2
+
+
+@pytest.mark.anyio
+async def test_deadline_exceeded(monkeypatch):
+    async def mock_request(self, method, url, **kwargs):
+        await asyncio.sleep(1)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    try:
+        with upstream.deadline(0.01):
+            with pytest.raises(upstream.DeadlineExceeded):
+                await upstream.get("https://zenodo.org/api/records")
+            assert upstream.remaining() == 0.0
+            with pytest.raises(upstream.DeadlineExceeded):
+                await upstream.get("https://zenodo.org/api/records")
+    finally:
+        await upstream.aclose()
+
+
+@pytest.mark.anyio
+async def test_deadline_counts_hanging_calls_as_slow(monkeypatch):
+    breaker = CircuitBreaker("zenodo.org", min_calls=2, slow_call_duration=0.1)
+    monkeypatch.setattr("fyscience.circuit_breaker._breakers", {"zenodo.org": breaker})
+    monkeypatch.setattr("fyscience.upstream._limiters", weakref.WeakKeyDictionary())
+
+    async def mock_request(self, method, url, **kwargs):
+        await asyncio.sleep(1)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    try:
+        # Cancelled before it counts as slow, which says nothing about the upstream
+        with upstream.deadline(0.01):
+            with pytest.raises(upstream.DeadlineExceeded):
+                await upstream.get("https://zenodo.org/api/records")
+        assert breaker.state == "closed"
+        assert upstream.stats()["zenodo.org"]["limit"] == 10
+
+        for _ in range(2):
+            with upstream.deadline(0.15):
+                with pytest.raises(upstream.DeadlineExceeded):
+                    await upstream.get("https://zenodo.org/api/records")
+        assert breaker.state == "open"
+        assert upstream.stats()["zenodo.org"]["limit"] < 10
+    finally:
+        await upstream.aclose()
+
+
+def test_deadline_nesting():
+    assert upstream.remaining() is None
+    with upstream.deadline(1):
+        with upstream.deadline(60):
+            assert upstream.remaining() <= 1
+        with upstream.deadline(None):
+            assert upstream.remaining() is None
+        assert 0 < upstream.remaining() <= 1
+    assert upstream.remaining() is None
+
+
+@pytest.mark.anyio
+async def test_fallback_per_caller_of_shared_call():
+    calls = []
+
+    @upstream.fallback("fallback")
+    @single_flight("fallback_test")
+    async def lookup(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        raise upstream.UpstreamError("dummy error")
+
+    async def lookup_raising_errors(key):
+        with upstream.raise_errors():
+            return await lookup(key)
+
+    results = await asyncio.gather(
+        lookup("a"), lookup_raising_errors("a"), return_exceptions=True
+    )
+
+    assert calls == ["a"]
+    assert results[0] == "fallback"
+    assert isinstance(results[1], upstream.UpstreamError)
+
+
+@pytest.mark.anyio
+async def test_set_base_url(monkeypatch):
+    urls = []
+
+    async def mock_request(self, method, url, **kwargs):
+        urls.append(url)
+        return httpx.Response(200)
+
+    monkeypatch.setattr(httpx.AsyncClient, "request", mock_request)
+    upstream.set_base_url("zenodo.org", "http://127.0.0.1:8104")
+    try:
+        await upstream.get('https://zenodo.org/api/records?q=doi:"10.1011/111111"')
+        assert "zenodo.org" in upstream.stats()
+    finally:
+        upstream.set_base_url("zenodo.org", None)
+    await upstream.get("https://zenodo.org/api/records")
+    await upstream.aclose()
+
+    assert urls == [
+        'http://127.0.0.1:8104/api/records?q=doi:"10.1011/111111"',
+        "https://zenodo.org/api/records",
+    ]